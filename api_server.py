@@ -0,0 +1,492 @@
+"""
+VIVOHOME AI - Headless JSON API
+Structured search over HTTP for storefront/POS integrations. Returns raw
+results (no markdown rendering), supports HTTP/1.1 keep-alive, gzip,
+batched queries and offset pagination; catalog listings ("có những loại
+tivi nào") also page by keyset cursor: pass ``cursor`` (empty for the first
+page) and then each page's ``next_cursor``. /v1/answer returns the chat
+answer, as markdown or as the structured view for client-side rendering.
+/v1/facets counts products per category, brand, price band and key spec
+for a query (empty = whole catalog), optionally narrowed to one price band
+and one key spec, and pages through the matching products.
+
+    GET  /v1/search?q=TV+giá+cao+nhất&limit=5&offset=0
+    GET  /v1/search?q=có+những+loại+tivi+nào&limit=20&cursor=
+    POST /v1/search            {"query": "..."} or {"queries": ["...", ...]}
+    POST /v1/intent-search     {"query": "...", "intent": {...optional}, "cursor": "..."}
+    POST /v1/semantic          {"query": "...", "min_price": 0, "max_price": 5000000}
+    POST /v1/answer            {"query": "...", "format": "markdown" | "structured"}
+    GET  /v1/facets?q=tủ+lạnh+samsung&price=5000000-10000000&spec=Inverter&limit=5
+    POST /v1/updates           {"token": "...", "updates": [{"model", "gia", "ton_kho"}, ...]}
+    POST /v1/admin/profile     {"token": "...", "seconds": 30, "mode": "sample" | "cprofile",
+                                "memory": false, "stages": [...optional]}
+    POST /v1/admin/profile/status  {"token": "..."}
+    GET  /v1/products/<model>
+    GET  /metrics | /healthz | /ready
+"""
+
+import gzip
+import hmac
+import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+
+from app_config import (API_MAX_BATCH, API_MAX_PAGE_SIZE, API_PORT, LIVE_UPDATES_TOKEN,
+                        MAX_SEARCH_RESULTS, PROFILE_TOKEN)
+from logger import get_logger
+from metrics import READY, render_prometheus
+
+logger = get_logger("api")
+
+_GZIP_MIN_BYTES = 1024
+_MAX_BODY_BYTES = 1024 * 1024
+
+
+class ApiError(Exception):
+    """Client-visible error with an HTTP status."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+# ---------------------------------------------------------------------------
+# Request helpers
+# ---------------------------------------------------------------------------
+
+def _page_params(params: Dict) -> Tuple[int, int]:
+    try:
+        limit = int(params.get("limit", MAX_SEARCH_RESULTS))
+        offset = int(params.get("offset", 0))
+    except (TypeError, ValueError):
+        raise ApiError(400, "limit/offset must be integers")
+    if not 1 <= limit <= API_MAX_PAGE_SIZE or offset < 0:
+        raise ApiError(400, f"limit must be 1..{API_MAX_PAGE_SIZE}, offset >= 0")
+    return limit, offset
+
+
+def _paginate(items: List, limit: int, offset: int) -> Dict:
+    """Slice a result list fetched with one extra row to detect more pages."""
+    return {
+        "items": items[offset:offset + limit],
+        "offset": offset,
+        "limit": limit,
+        "has_more": len(items) > offset + limit,
+    }
+
+
+def _keyset_page(query: str, intent: Dict, limit: int, cursor: str) -> Dict:
+    """One listing page after *cursor* (empty = first page), straight from the catalog."""
+    from database import search_with_intent
+
+    try:
+        raw = search_with_intent(query, intent, limit, cursor=cursor or None)
+    except ValueError as exc:
+        raise ApiError(400, str(exc))
+    return {
+        "items": raw.get("products", []),
+        "limit": limit,
+        "next_cursor": raw.get("next_cursor"),
+        "has_more": bool(raw.get("next_cursor")),
+    }
+
+
+def _cursor_param(params: Dict) -> Optional[str]:
+    cursor = params.get("cursor")
+    if cursor is None:
+        return None
+    if not isinstance(cursor, str):
+        raise ApiError(400, "'cursor' must be a string")
+    if "queries" in params or int(params.get("offset") or 0):
+        raise ApiError(400, "cursor paging takes one query and no offset")
+    return cursor
+
+
+def _price_range(params: Dict) -> Optional[Tuple[Optional[int], Optional[int]]]:
+    """``min_price`` / ``max_price`` (VND) as a range, or None when neither is set."""
+    try:
+        low, high = (None if params.get(k) in (None, "") else int(params[k])
+                     for k in ("min_price", "max_price"))
+    except (TypeError, ValueError):
+        raise ApiError(400, "min_price/max_price must be integers")
+    return None if low is None and high is None else (low, high)
+
+
+def _check_token(params: Dict, token: str, feature: str, setting: str) -> None:
+    """Admin endpoints: 403 unless *token* is configured and matches."""
+    if not token:
+        raise ApiError(403, f"{feature} disabled (set {setting})")
+    if not hmac.compare_digest(str(params.get("token", "")).encode(), token.encode()):
+        raise ApiError(403, "invalid token")
+
+
+@contextmanager
+def _admitted(shed_at: int) -> Iterator[int]:
+    """
+    Count a handler that bypasses the engine (which admits its own
+    requests) against the overload controller; 503 from load level *shed_at*.
+    """
+    from overload import controller
+
+    with controller.request() as level:
+        if level >= shed_at:
+            raise ApiError(503, "server overloaded, retry shortly")
+        yield level
+
+
+def _intent_param(params: Dict, query: str) -> Dict:
+    """A client-supplied ``intent`` (checked, completed), else the parsed one."""
+    from query_parser import INTENT_PATTERNS, QueryIntent, parse_query
+
+    intent = params.get("intent")
+    if not intent:
+        return parse_query(query)
+    kinds = ("search", *INTENT_PATTERNS)
+    if not isinstance(intent, dict) or intent.get("intent", "search") not in kinds:
+        raise ApiError(400, f"'intent' must be an object with intent in {kinds}")
+    category, brands = intent.get("category"), intent.get("brands")
+    if category is not None and not isinstance(category, str):
+        raise ApiError(400, "'intent.category' must be a string")
+    if brands is not None and not (isinstance(brands, list)
+                                   and all(isinstance(b, str) for b in brands)):
+        raise ApiError(400, "'intent.brands' must be a list of strings")
+    return QueryIntent(intent.get("intent", "search"), category or None,
+                       brands or None, query).to_dict()
+
+
+def _queries(params: Dict) -> List[str]:
+    if "queries" in params:
+        queries = params["queries"]
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise ApiError(400, "'queries' must be a list of strings")
+        if len(queries) > API_MAX_BATCH:
+            raise ApiError(400, f"at most {API_MAX_BATCH} queries per batch")
+        return queries
+    query = params.get("query") or params.get("q")
+    if not isinstance(query, str) or not query.strip():
+        raise ApiError(400, "missing 'query'")
+    return [query]
+
+
+# ---------------------------------------------------------------------------
+# Endpoint handlers — each returns a JSON-serialisable dict
+# ---------------------------------------------------------------------------
+
+class SearchAPI:
+    """Routes API calls to a search engine (RAGEngine or SearchWorkerPool)."""
+
+    def __init__(self, engine=None):
+        if engine is None:
+            from rag_engine import rag_engine as engine
+        self.engine = engine
+        self.routes: Dict[Tuple[str, str], Callable[[Dict], Dict]] = {
+            ("GET", "/v1/search"): self.search,
+            ("POST", "/v1/search"): self.search,
+            ("POST", "/v1/intent-search"): self.intent_search,
+            ("POST", "/v1/semantic"): self.semantic,
+            ("POST", "/v1/answer"): self.answer,
+            ("GET", "/v1/facets"): self.facets,
+            ("POST", "/v1/facets"): self.facets,
+            ("POST", "/v1/updates"): self.updates,
+            ("POST", "/v1/admin/profile"): self.profile,
+            ("POST", "/v1/admin/profile/status"): self.profile_status,
+        }
+
+    def search(self, params: Dict) -> Dict:
+        limit, offset = _page_params(params)
+        queries = _queries(params)
+        cursor = _cursor_param(params)
+        if cursor is not None:
+            from database import is_listing
+            from query_parser import parse_query
+
+            # Only category/brand listings page from the catalog; any other
+            # query takes the engine's path (fuzzy, semantic, web) as usual
+            intent = parse_query(queries[0])
+            if is_listing(intent):
+                from overload import BUSY
+
+                with _admitted(BUSY):
+                    page = _keyset_page(queries[0], intent, limit, cursor)
+                page.update({"query": queries[0], "found": bool(page["items"]),
+                             "intent": intent,
+                             "sources": ["database"] if page["items"] else [],
+                             "web_results": None})
+                return page
+            if cursor:
+                raise ApiError(400, "cursor pagination only applies to category/brand listings")
+        if len(queries) > 1:
+            batch = self.engine.search_many(queries, max_results=offset + limit + 1)
+        else:
+            batch = [self.engine.search(queries[0], max_results=offset + limit + 1)]
+        if "queries" not in params and batch[0].get("busy"):
+            raise ApiError(503, "server overloaded, retry shortly")
+        results = []
+        for query, raw in zip(queries, batch):
+            page = _paginate(raw["products"], limit, offset)
+            page.update({
+                "query": query,
+                "found": raw["found"],
+                "intent": raw["intent"],
+                "sources": raw["sources"],
+                "web_results": raw["web_results"],
+                "request_id": raw.get("request_id"),
+            })
+            if raw.get("degraded"):
+                page["degraded"] = raw["degraded"]
+            results.append(page)
+        return {"results": results} if "queries" in params else results[0]
+
+    def intent_search(self, params: Dict) -> Dict:
+        from overload import BUSY
+
+        with _admitted(BUSY):
+            return self._intent_search(params)
+
+    @staticmethod
+    def _intent_search(params: Dict) -> Dict:
+        from database import search_with_intent
+
+        limit, offset = _page_params(params)
+        cursor = _cursor_param(params)
+        results = []
+        for query in _queries(params):
+            intent = _intent_param(params, query)
+            if cursor is not None:
+                return {**_keyset_page(query, intent, limit, cursor),
+                        "query": query, "intent": intent}
+            raw = search_with_intent(query, intent, max_results=offset + limit + 1)
+            page = _paginate(raw.get("products", []), limit, offset)
+            page.update({"query": query, "intent": intent})
+            results.append(page)
+        return {"results": results} if "queries" in params else results[0]
+
+    def semantic(self, params: Dict) -> Dict:
+        from overload import DB_ONLY
+
+        limit, offset = _page_params(params)
+        queries = _queries(params)
+        price_range = _price_range(params)
+        with _admitted(DB_ONLY):  # the level that skips semantic search in the engine
+            # Through the engine: with workers, the pool's embedding server
+            # owns the model, so this process never loads a second one
+            batch = self.engine.semantic_search_many(queries, offset + limit + 1, price_range)
+        results = []
+        for query, raw in zip(queries, batch):
+            if raw.get("error"):
+                raise ApiError(503, f"semantic search unavailable: {raw['error']}")
+            page = _paginate(raw.get("products", []), limit, offset)
+            page["query"] = query
+            results.append(page)
+        return {"results": results} if "queries" in params else results[0]
+
+    def answer(self, params: Dict) -> Dict:
+        fmt = params.get("format", "markdown")
+        if fmt not in ("markdown", "structured"):
+            raise ApiError(400, "format must be 'markdown' or 'structured'")
+        results = []
+        for query in _queries(params):
+            raw = self.engine.search(query)
+            results.append({
+                "query": query,
+                "format": fmt,
+                "answer": self.engine.generate_response(query, raw, fmt == "structured"),
+                "request_id": raw.get("request_id"),
+            })
+        return {"results": results} if "queries" in params else results[0]
+
+    @staticmethod
+    def facets(params: Dict) -> Dict:
+        from database import facet_counts, facet_search
+        from overload import BUSY
+
+        limit, offset = _page_params(params)
+        query = params.get("query") or params.get("q") or ""
+        price = params.get("price") or None
+        spec = params.get("spec") or None
+        if not all(isinstance(v, str) for v in (query, price or "", spec or "")):
+            raise ApiError(400, "'query', 'price' and 'spec' must be strings")
+        intent = _intent_param(params, query)
+        try:
+            with _admitted(BUSY):
+                counts = facet_counts(intent, price, spec)
+                raw = facet_search(intent, price, spec, max_results=offset + limit + 1)
+        except ValueError as exc:
+            raise ApiError(400, str(exc))
+        page = _paginate(raw.get("products", []), limit, offset)
+        page.update({"query": query, "intent": intent, "price": price, "spec": spec, **counts})
+        return page
+
+    @staticmethod
+    def updates(params: Dict) -> Dict:
+        from live_updates import apply_updates
+
+        _check_token(params, LIVE_UPDATES_TOKEN, "live updates", "LIVE_UPDATES_TOKEN")
+        updates = params.get("updates")
+        if not isinstance(updates, list):
+            raise ApiError(400, "'updates' must be a list")
+        return apply_updates(updates)
+
+    @staticmethod
+    def profile(params: Dict) -> Dict:
+        import profiler
+
+        _check_token(params, PROFILE_TOKEN, "profiling", "PROFILE_TOKEN")
+        stages = params.get("stages")
+        if stages is not None and not (isinstance(stages, list)
+                                       and all(isinstance(s, str) for s in stages)):
+            raise ApiError(400, "'stages' must be a list of stage names")
+        try:
+            seconds = float(params.get("seconds", 30))
+        except (TypeError, ValueError):
+            raise ApiError(400, "'seconds' must be a number")
+        try:
+            return profiler.start(seconds, str(params.get("mode", "sample")),
+                                  bool(params.get("memory", False)), stages)
+        except ValueError as exc:
+            raise ApiError(400, str(exc))
+        except RuntimeError as exc:
+            raise ApiError(409, str(exc))
+
+    @staticmethod
+    def profile_status(params: Dict) -> Dict:
+        import profiler
+
+        _check_token(params, PROFILE_TOKEN, "profiling", "PROFILE_TOKEN")
+        return profiler.status()
+
+    @staticmethod
+    def product(model_code: str) -> Dict:
+        from tools import lookup_product
+
+        result = lookup_product(model_code)
+        if not result.get("found"):
+            raise ApiError(404, result.get("message", "not found"))
+        return result
+
+
+# ---------------------------------------------------------------------------
+# HTTP layer
+# ---------------------------------------------------------------------------
+
+def _make_handler(api: SearchAPI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive; every response sets Content-Length
+
+        def do_GET(self):  # noqa: N802 (http.server API)
+            url = urlparse(self.path)
+            if url.path == "/metrics":
+                return self._send_text(200, render_prometheus(),
+                                       "text/plain; version=0.0.4; charset=utf-8")
+            if url.path == "/healthz":
+                return self._send_text(200, "ok\n")
+            if url.path == "/ready":
+                ready = READY.value() == 1
+                return self._send_text(200 if ready else 503,
+                                       "ready\n" if ready else "warming up\n")
+            if url.path.startswith("/v1/products/"):
+                model = unquote(url.path[len("/v1/products/"):])
+                return self._dispatch(lambda _: api.product(model), {})
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            self._dispatch(api.routes.get(("GET", url.path)), params)
+
+        def do_POST(self):  # noqa: N802
+            url = urlparse(self.path)
+            try:
+                params = self._read_json()
+            except ApiError as exc:
+                return self._send_json(exc.status, {"error": str(exc)})
+            self._dispatch(api.routes.get(("POST", url.path)), params)
+
+        def _read_json(self) -> Dict:
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if not 0 <= length <= _MAX_BODY_BYTES:
+                # The body stays unread, so the connection can't be reused
+                self.close_connection = True
+                if length < 0:
+                    raise ApiError(400, "invalid Content-Length")
+                raise ApiError(413, "request body too large")
+            raw = self.rfile.read(length) if length else b"{}"
+            try:
+                body = json.loads(raw.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                raise ApiError(400, "body must be UTF-8 JSON")
+            if not isinstance(body, dict):
+                raise ApiError(400, "body must be a JSON object")
+            return body
+
+        def _dispatch(self, handler: Optional[Callable[[Dict], Dict]], params: Dict) -> None:
+            if handler is None:
+                return self._send_json(404, {"error": "unknown endpoint"})
+            try:
+                self._send_json(200, handler(params))
+            except ApiError as exc:
+                self._send_json(exc.status, {"error": str(exc)})
+            except Exception as exc:
+                logger.error("API error on %s: %s", self.path, exc, exc_info=True)
+                self._send_json(500, {"error": "internal error"})
+
+        def _send_json(self, status: int, payload: Dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+            self._send_text(status, body, "application/json; charset=utf-8")
+
+        def _send_text(self, status: int, text: str,
+                       content_type: str = "text/plain; charset=utf-8") -> None:
+            body = text.encode("utf-8")
+            gzipped = (len(body) >= _GZIP_MIN_BYTES
+                       and "gzip" in self.headers.get("Accept-Encoding", ""))
+            if gzipped:
+                body = gzip.compress(body, compresslevel=5)
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if gzipped:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Vary", "Accept-Encoding")
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            logger.debug("%s - %s", self.address_string(), fmt % args)
+
+    return Handler
+
+
+def start_api_server(port: int = API_PORT, host: str = "0.0.0.0",
+                     engine=None) -> ThreadingHTTPServer:
+    """Serve the JSON API from a daemon thread and return the server."""
+    server = ThreadingHTTPServer((host, port), _make_handler(SearchAPI(engine)))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="api-http", daemon=True)
+    thread.start()
+    logger.info("JSON API on http://%s:%d/v1/search", host, server.server_address[1])
+    return server
+
+
+# ---------------------------------------------------------------------------
+# CLI: headless mode (no Gradio)
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    from startup import start_warmup
+
+    print(f"VIVOHOME JSON API on :{API_PORT}")
+    from live_updates import start_feed
+    from profiler import install_signal_handler
+
+    install_signal_handler()
+    start_warmup()
+    start_feed()
+    srv = start_api_server(API_PORT)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        srv.shutdown()
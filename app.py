@@ -3,12 +3,13 @@ VIVOHOME AI - Gradio Application
 Premium shopping assistant UI with multimodal input (text + image).
 """
 
-import gradio as gr
-
-from app_config import APP_NAME, APP_VERSION, SHARE_LINK
+from app_config import (API_ENABLED, API_PORT, APP_NAME, APP_VERSION, GRADIO_CONCURRENCY,
+                        GRADIO_QUEUE_SIZE, METRICS_ENABLED, METRICS_PORT, QUERY_LOG_REPLAY,
+                        SEARCH_WORKERS, SHARE_LINK)
 from tools import lookup_product, extract_model, describe_image
 from query_parser import parse_query
 from database import search_with_intent
+from formatter import BUSY, NO_MORE
 from logger import app_logger
 
 # Lazy RAG import — gracefully degrade if optional deps are missing
@@ -20,6 +21,14 @@ except ImportError as exc:
     _RAG_AVAILABLE = False
     app_logger.warning("RAG Engine not available: %s", exc)
 
+# In-process engine by default; replaced by a SearchWorkerPool when
+# SEARCH_WORKERS > 0 (see __main__). Sessions stay in the UI process.
+_search_engine = rag_engine if _RAG_AVAILABLE else None
+_conversation = None
+if _RAG_AVAILABLE:
+    from session_store import ConversationalSearch
+    _conversation = ConversationalSearch(_search_engine)
+
 app_logger.info("Starting %s v%s", APP_NAME, APP_VERSION)
 
 
@@ -27,8 +36,12 @@ app_logger.info("Starting %s v%s", APP_NAME, APP_VERSION)
 # Chat handler
 # ---------------------------------------------------------------------------
 
-def chat_with_agent(message, history):
-    """Process a user message (text and/or image) and return a response."""
+def chat_with_agent(message, history, session_id=None):
+    """
+    Process a user message (text and/or image) and return a response.
+    Messages sharing a *session_id* can refine the previous answer
+    ("còn cái rẻ hơn không?") without a new catalog search.
+    """
     user_text = message.get("text", "") if isinstance(message, dict) else str(message)
     user_files = message.get("files", []) if isinstance(message, dict) else []
 
@@ -42,15 +55,28 @@ def chat_with_agent(message, history):
     try:
         if image_path:
             return _handle_image(image_path)
-        return _handle_text(user_text)
+        return _handle_text(user_text, session_id)
     except Exception as exc:
         app_logger.error("Error: %s", exc, exc_info=True)
         return f"❌ Lỗi: {exc}\n\nĐảm bảo vLLM Server đang chạy!"
 
 
+def show_more(session_id) -> str:
+    """The "Xem thêm" button: next page of the session's last listing."""
+    if not _RAG_AVAILABLE:
+        return NO_MORE
+    try:
+        return _conversation.process_more(session_id)
+    except Exception as exc:
+        app_logger.error("Error: %s", exc, exc_info=True)
+        return f"❌ Lỗi: {exc}"
+
+
 def _handle_image(image_path: str) -> str:
     """Process an image input: extract model → lookup product."""
     model_result = extract_model(image_path)
+    if model_result.get("busy"):
+        return BUSY
 
     if model_result.get("found"):
         model_code = model_result["model"]
@@ -78,11 +104,11 @@ def _handle_image(image_path: str) -> str:
     return "Không thể đọc được thông tin từ ảnh."
 
 
-def _handle_text(user_text: str) -> str:
+def _handle_text(user_text: str, session_id=None) -> str:
     """Process a text-only query through RAG or basic search."""
     if _RAG_AVAILABLE:
         app_logger.info("RAG search: %s", user_text[:60])
-        return rag_engine.process(user_text)
+        return _conversation.process(user_text, session_id)
 
     # Basic fallback
     intent = parse_query(user_text)
@@ -175,8 +201,10 @@ button[variant="secondary"] {
 """
 
 
-def _build_ui() -> gr.Blocks:
+def _build_ui() -> "gr.Blocks":
     """Build the Gradio Blocks interface."""
+    import gradio as gr  # Deferred: importing app for its handlers stays cheap
+
     with gr.Blocks(
         theme=gr.themes.Default(
             primary_hue="cyan",
@@ -211,6 +239,7 @@ def _build_ui() -> gr.Blocks:
                 submit_btn="Gửi",
                 scale=5,
             )
+            more = gr.Button("➕ Xem thêm", variant="secondary", scale=1, size="sm")
             clear = gr.Button("🗑️ Xóa", variant="secondary", scale=1, size="sm")
 
         # Examples
@@ -243,8 +272,9 @@ def _build_ui() -> gr.Blocks:
             f"Powered by Qwen2-VL • ChromaDB • Tavily</p>"
         )
 
-        def respond(message, chat_history):
-            bot_response = chat_with_agent(message, chat_history)
+        def respond(message, chat_history, request: gr.Request):
+            bot_response = chat_with_agent(message, chat_history,
+                                           session_id=request.session_hash)
             user_msg = message.get("text", "") if isinstance(message, dict) else str(message)
             if isinstance(message, dict) and message.get("files"):
                 user_msg += " [📷 Image]"
@@ -253,15 +283,75 @@ def _build_ui() -> gr.Blocks:
             return "", chat_history
 
         msg.submit(respond, [msg, chatbot], [msg, chatbot])
-        clear.click(lambda: [], None, chatbot, queue=False)
+
+        def respond_more(chat_history, request: gr.Request):
+            chat_history.append({"role": "user", "content": "➕ Xem thêm"})
+            chat_history.append({"role": "assistant",
+                                 "content": show_more(request.session_hash)})
+            return chat_history
+
+        more.click(respond_more, chatbot, chatbot)
+
+        def clear_chat(request: gr.Request):
+            if _conversation is not None:
+                _conversation.store.discard(request.session_hash)
+            return []
+
+        clear.click(clear_chat, None, chatbot, queue=False)
 
     return demo
 
 
-demo = _build_ui()
+_demo = None
+
+
+def get_demo():
+    """Build the UI on first use (``app.demo`` still works via __getattr__)."""
+    global _demo
+    if _demo is None:
+        _demo = _build_ui()
+    return _demo
+
+
+def __getattr__(name):
+    if name == "demo":
+        return get_demo()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
+    from startup import start_warmup
+
     print("=" * 50)
     print(f"🚀 {APP_NAME} v{APP_VERSION}")
     print("=" * 50)
-    demo.launch(share=SHARE_LINK)
\ No newline at end of file
+    if METRICS_ENABLED:
+        from metrics import start_metrics_server
+        start_metrics_server(METRICS_PORT)
+    from profiler import install_signal_handler
+    install_signal_handler()  # kill -USR2 <pid>: 30 s sampled + memory profile
+    demo = get_demo()
+    concurrency = GRADIO_CONCURRENCY
+    if SEARCH_WORKERS > 0 and _RAG_AVAILABLE:
+        from startup import register_warmup_step
+        from worker_pool import SearchWorkerPool
+        _search_engine = SearchWorkerPool(SEARCH_WORKERS)
+        _conversation.engine = _search_engine
+        register_warmup_step("vector_store", _search_engine.warm_up)
+        if QUERY_LOG_REPLAY > 0:
+            from querylog import replay
+            register_warmup_step("query_replay", lambda: replay(_search_engine))
+        concurrency = SEARCH_WORKERS * 2
+    # Bounded: past GRADIO_QUEUE_SIZE waiting events Gradio rejects new ones
+    demo.queue(default_concurrency_limit=concurrency, max_size=GRADIO_QUEUE_SIZE)
+    if API_ENABLED and _RAG_AVAILABLE:
+        from api_server import start_api_server
+        start_api_server(API_PORT, engine=_search_engine)
+    if _RAG_AVAILABLE:
+        from live_updates import start_feed
+        start_feed()
+    # Serve the UI first, then load embeddings/Chroma in the background;
+    # /ready on the metrics port flips to 200 once warm-up completes.
+    demo.launch(share=SHARE_LINK, prevent_thread_lock=True)
+    start_warmup()
+    demo.block_thread()
\ No newline at end of file
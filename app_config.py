@@ -12,6 +12,10 @@ DB_PATH = str(BASE_DIR / "vivohome.db")
 CSV_PATH = str(BASE_DIR / "product.csv")
 CHROMA_PATH = str(BASE_DIR / "chroma_db")
 LOG_DIR = str(BASE_DIR / "logs")
+WEB_KNOWLEDGE_PATH = os.getenv("WEB_KNOWLEDGE_PATH", str(BASE_DIR / "web_knowledge.db"))
+# Prebuilt catalog artifact (catalog_build.py); empty = load from SQLite
+CATALOG_ARTIFACT_DIR = os.getenv("CATALOG_ARTIFACT_DIR", "")
+CATALOG_ARTIFACT_KEEP = int(os.getenv("CATALOG_ARTIFACT_KEEP", "3"))  # versions kept on disk
 
 # === vLLM Server ===
 VLLM_URL = os.getenv("VLLM_URL", "http://127.0.0.1:8000/v1/chat/completions")
@@ -25,13 +29,101 @@ TAVILY_SEARCH_URL = "https://api.tavily.com/search"
 SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.5"))
 MAX_SEARCH_RESULTS = int(os.getenv("MAX_SEARCH_RESULTS", "5"))
 WEB_SEARCH_TIMEOUT = int(os.getenv("WEB_SEARCH_TIMEOUT", "10"))
+WEB_SEARCH_CONCURRENCY = int(os.getenv("WEB_SEARCH_CONCURRENCY", "4"))  # batch fallbacks in flight
+# Start the web call before local stages finish: off | generic | aggressive
+SPECULATIVE_WEB = os.getenv("SPECULATIVE_WEB", "off")
+SEARCH_BUDGET_MS = int(os.getenv("SEARCH_BUDGET_MS", "0"))  # per-request; 0 = unbounded
+SPECULATIVE_WEB_SLOTS = int(os.getenv("SPECULATIVE_WEB_SLOTS", "2"))  # early calls in flight, own pool
+SPECULATIVE_WEB_SIMILARITY = float(os.getenv("SPECULATIVE_WEB_SIMILARITY", "0.5"))  # weak fuzzy best → early
+WEB_SEARCH_MODE = os.getenv("WEB_SEARCH_MODE", "hybrid")  # hybrid | offline | live
+WEB_KNOWLEDGE_HARVEST = os.getenv("WEB_KNOWLEDGE_HARVEST", "true").lower() == "true"
+WEB_KNOWLEDGE_MAX_AGE_DAYS = int(os.getenv("WEB_KNOWLEDGE_MAX_AGE_DAYS", "30"))  # 0 = keep forever
+FUZZY_ENABLED = os.getenv("FUZZY_ENABLED", "true").lower() == "true"  # typo-tolerant stage
+FUZZY_MIN_SCORE = float(os.getenv("FUZZY_MIN_SCORE", "0.75"))  # per-token and per-product
+
+# === Chat Sessions (follow-up refinement) ===
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))                  # sessions kept (LRU)
+SESSION_IDLE_TTL = int(os.getenv("SESSION_IDLE_TTL", "1800"))        # seconds
+SESSION_MAX_CANDIDATES = int(os.getenv("SESSION_MAX_CANDIDATES", "100"))  # rows per session
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "4096"))      # cached product fragments
 VLLM_TIMEOUT = int(os.getenv("VLLM_TIMEOUT", "60"))
 
 # === Embedding Model ===
-EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))  # cached query vectors
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()  # torch | onnx
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", str(BASE_DIR / "onnx_model"))
+EMBEDDING_QUANTIZE = os.getenv("EMBEDDING_QUANTIZE", "true").lower() == "true"  # onnx: int8 weights
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))          # 0 = runtime default
+VECTOR_QUANTIZE = os.getenv("VECTOR_QUANTIZE", "true").lower() == "true"  # artifact: int8 scan + float rescore
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "10"))   # rescored candidates = k × this
 
 # === App Settings ===
 APP_NAME = "VIVOHOME AI Assistant"
 APP_VERSION = "2.0.0"
 GRADIO_PORT = int(os.getenv("GRADIO_PORT", "7860"))
 SHARE_LINK = os.getenv("SHARE_LINK", "true").lower() == "true"
+
+# === Logging ===
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() == "true"          # JSON lines file output
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"         # queue + writer thread
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))           # records; drops when full
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))  # fraction of DEBUG kept
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "0"))             # per call site / sec, 0 = off
+
+# === Serving ===
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "0"))  # 0 = search in the UI process
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# === JSON API ===
+API_ENABLED = os.getenv("API_ENABLED", "true").lower() == "true"
+API_PORT = int(os.getenv("API_PORT", "8080"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "50"))
+API_MAX_BATCH = int(os.getenv("API_MAX_BATCH", "32"))       # queries per request
+
+# === Live Price/Stock Updates ===
+LIVE_UPDATES_FEED = os.getenv("LIVE_UPDATES_FEED", "")            # JSON-lines file to follow
+LIVE_UPDATES_POLL_MS = int(os.getenv("LIVE_UPDATES_POLL_MS", "200"))
+LIVE_UPDATES_BATCH = int(os.getenv("LIVE_UPDATES_BATCH", "500"))     # updates per transaction
+LIVE_UPDATES_TOKEN = os.getenv("LIVE_UPDATES_TOKEN", "")          # POST /v1/updates; empty = off
+
+# === Overload Control ===
+OVERLOAD_MAX_INFLIGHT = int(os.getenv("OVERLOAD_MAX_INFLIGHT", "32"))  # requests per process; 0 = off
+OVERLOAD_LEVELS = tuple(float(x) for x in                             # load fractions: no web, DB-only, busy
+                        os.getenv("OVERLOAD_LEVELS", "0.5,0.75,1.0").split(","))
+OVERLOAD_COOLDOWN_S = float(os.getenv("OVERLOAD_COOLDOWN_S", "5"))     # hold a raised level this long
+STAGE_LIMITS = os.getenv("STAGE_LIMITS", "vision=2,semantic=4,web=4")  # concurrent calls per stage
+STAGE_QUEUE_SIZE = int(os.getenv("STAGE_QUEUE_SIZE", "16"))            # waiters per stage, then shed
+STAGE_QUEUE_TIMEOUT_MS = int(os.getenv("STAGE_QUEUE_TIMEOUT_MS", "2000"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))         # answers served when busy
+GRADIO_CONCURRENCY = int(os.getenv("GRADIO_CONCURRENCY", "8"))         # chat events run at once
+GRADIO_QUEUE_SIZE = int(os.getenv("GRADIO_QUEUE_SIZE", "64"))          # waiting chat events, then rejected
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"  # coalesce identical calls
+
+# === Facets ===
+FACET_PRICE_BANDS = tuple(int(x) for x in                              # band edges in VND
+                          os.getenv("FACET_PRICE_BANDS",
+                                    "2000000,5000000,10000000,20000000").split(",") if x.strip())
+
+# === Startup ===
+WARMUP_SEMANTIC = os.getenv("WARMUP_SEMANTIC", "true").lower() == "true"  # preload embeddings + Chroma
+
+# === Query Log ===
+QUERY_LOG_ENABLED = os.getenv("QUERY_LOG_ENABLED", "true").lower() == "true"
+QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", str(Path(LOG_DIR) / "queries.jsonl"))
+QUERY_LOG_MAX_MB = int(os.getenv("QUERY_LOG_MAX_MB", "50"))          # then rotate to .1
+QUERY_LOG_REPLAY = int(os.getenv("QUERY_LOG_REPLAY", "200"))         # hot queries replayed at warm-up; 0 = off
+QUERY_LOG_WINDOW = int(os.getenv("QUERY_LOG_WINDOW", "100000"))      # recent records considered
+
+# === Profiling ===
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")                          # POST /v1/admin/profile; empty = off
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(Path(LOG_DIR) / "profiles"))
+PROFILE_MAX_S = float(os.getenv("PROFILE_MAX_S", "300"))               # longest capture allowed
+PROFILE_SAMPLE_HZ = int(os.getenv("PROFILE_SAMPLE_HZ", "100"))         # stack samples per second
+PROFILE_STAGES = os.getenv("PROFILE_STAGES", "parse,database,fuzzy,semantic,web,format")  # empty = all spans
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "25"))
+
+# === Observability ===
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9100"))
@@ -0,0 +1,499 @@
+"""
+VIVOHOME AI - Benchmark Suite
+Replays a query corpus against the search pipeline and reports latency
+percentiles, throughput and allocations.
+
+Usage:
+    python benchmark.py                              # real catalog
+    python benchmark.py --rows 100000                # synthetic catalog
+    python benchmark.py --output bench.json --compare bench_baseline.json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Sequence
+from unittest import mock
+
+from app_config import BASE_DIR
+from metrics import percentile
+
+# ---------------------------------------------------------------------------
+# Query corpus
+# ---------------------------------------------------------------------------
+
+# Examples from README.md and the Gradio UI, plus shapes users actually type
+DEFAULT_QUERIES: List[str] = [
+    "TV giá cao nhất",
+    "Tủ lạnh rẻ nhất",
+    "So sánh TV Samsung và LG",
+    "có những loại tivi nào",
+    "Máy lọc nước Hòa Phát",
+    "máy giặt tiết kiệm điện",
+    "iPhone 15 Pro Max giá bao nhiêu",
+    "Bình tắm Rossi",
+    "bàn là Sunhouse",
+    "điều hòa Panasonic",
+    "quạt Sunhouse",
+    "tu lanh",
+    "samsumg",
+    "maygiat",
+    "còn cái rẻ hơn không?",
+    "so sánh với LG",
+]
+
+_QUOTED_RE = re.compile(r"[\"“]([^\"”]{2,60})[\"”]")
+
+
+def load_corpus(path: str) -> List[str]:
+    """
+    Load extra queries from a text or JSON-lines file.
+
+    Plain text files hold one query per line. JSON-lines records may carry
+    a ``query`` field; otherwise quoted phrases are harvested from their
+    ``title`` and ``body`` (the format of the team's request backlog).
+    """
+    queries: List[str] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if not path.endswith(".jsonl"):
+                queries.append(line)
+                continue
+            record = json.loads(line)
+            if record.get("query"):
+                queries.append(record["query"])
+                continue
+            text = f"{record.get('title', '')} {record.get('body', '')}"
+            queries.extend(m.strip() for m in _QUOTED_RE.findall(text)
+                           if not m.strip().endswith((".py", ".csv", ".db")))
+    return queries
+
+
+# ---------------------------------------------------------------------------
+# Synthetic catalog
+# ---------------------------------------------------------------------------
+
+def generate_catalog(rows: int, db_path: str, *, seed: int = 42) -> int:
+    """
+    Scale the real catalog to *rows* products and write it to *db_path*.
+
+    Each synthetic row clones a real product with a unique model suffix and
+    a jittered price, so category/brand distributions match production.
+    """
+    from database import (create_products_indexes, create_products_table,
+                          ensure_schema, get_connection)
+
+    with get_connection() as src:
+        base = [dict(r) for r in src.execute("SELECT * FROM products")]
+    if not base:
+        raise RuntimeError("Base catalog is empty — run `python database.py` first")
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    create_products_table(conn)
+
+    batch: List[tuple] = []
+    for i in range(rows):
+        p = base[i % len(base)]
+        suffix = "" if i < len(base) else f"-S{i}"
+        gia = int((p["gia"] or 0) * rng.uniform(0.8, 1.2)) // 1000 * 1000
+        batch.append((
+            i + 1, p["nhom_hang"], p["nhom_hang_loai"], p["ten_san_pham"],
+            f"{p['model'] or ''}{suffix}", p["thong_so_chinh"], gia, p["mo_ta"],
+        ))
+        if len(batch) >= 10_000:
+            _insert_rows(conn, batch)
+            batch.clear()
+    if batch:
+        _insert_rows(conn, batch)
+    conn.commit()
+    ensure_schema(conn)
+    create_products_indexes(conn)
+    conn.close()
+    return rows
+
+
+def _insert_rows(conn: sqlite3.Connection, batch: Sequence[tuple]) -> None:
+    conn.executemany("""
+        INSERT INTO products
+            (stt, nhom_hang, nhom_hang_loai, ten_san_pham, model,
+             thong_so_chinh, gia, mo_ta)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, batch)
+
+
+# ---------------------------------------------------------------------------
+# Local stubs for remote services
+# ---------------------------------------------------------------------------
+
+def _stub_web_search(query: str, max_results: int = 3, **_kwargs) -> Dict:
+    """Offline stand-in for Tavily with the same result schema."""
+    results = [{"type": "answer", "content": f"Giá tham khảo cho {query}",
+                "source": "tavily_ai"}]
+    results += [
+        {"type": "web_result", "title": f"{query} #{i}", "content": "stub " * 20,
+         "url": f"https://example.invalid/{i}", "source": "web_search"}
+        for i in range(max_results)
+    ]
+    return {"found": True, "count": len(results), "results": results}
+
+
+def _stub_post_vision(prompt: str, b64: str, temperature: float, max_tokens: int) -> str:
+    """Offline stand-in for the vLLM vision endpoint (the image is still encoded)."""
+    return "RT20HAR8DBU"
+
+
+def _fixture_image(directory: str, width: int = 400, height: int = 300) -> str:
+    """
+    An RGB noise PNG the size of a label photo (~360 KB, incompressible),
+    so tools.extract_model reads and encodes a realistic image.
+    """
+    import struct
+    import zlib
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (struct.pack(">I", len(data)) + kind + data
+                + struct.pack(">I", zlib.crc32(kind + data)))
+
+    rows = b"".join(b"\x00" + os.urandom(width * 3) for _ in range(height))
+    path = os.path.join(directory, "label.png")
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n"
+                + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+                + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+    return path
+
+
+def _stubbed_services() -> ExitStack:
+    """Patch every remote call the pipeline can make."""
+    import rag_engine
+    import tools
+
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(rag_engine, "web_search", _stub_web_search))
+    stack.enter_context(mock.patch.object(tools, "_post_vision", _stub_post_vision))
+    return stack
+
+
+def _unlogged():
+    """
+    Keep benchmark traffic out of the production query log — on every
+    thread — so it never counts as "hot" in the warm-up replay.
+    """
+    import querylog
+    return mock.patch.object(querylog.query_log, "enabled", False)
+
+
+def _semantic_available() -> Optional[str]:
+    """Return None when semantic search works, else the reason it doesn't."""
+    try:
+        import vector_store
+        vector_store._get_collection()
+        return None
+    except Exception as exc:  # ImportError, missing model, ...
+        return f"{type(exc).__name__}: {exc}"
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+
+def bench_target(fn: Callable[[str], object], queries: Sequence[str], *,
+                 iterations: int = 5, warmup: int = 1) -> Dict:
+    """
+    Time *fn* over the corpus, then measure allocations in a separate pass
+    (tracemalloc distorts timings, so the two are never mixed).
+    """
+    for _ in range(warmup):
+        for q in queries:
+            fn(q)
+
+    latencies: List[float] = []
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        for q in queries:
+            t0 = time.perf_counter()
+            fn(q)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    wall = time.perf_counter() - wall_start
+
+    peaks: List[int] = []
+    tracemalloc.start()
+    try:
+        for q in queries:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            fn(q)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - base)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "calls": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "throughput_qps": round(len(latencies) / wall, 1) if wall else 0.0,
+        "alloc_peak_kb_mean": round(sum(peaks) / len(peaks) / 1024, 1),
+        "alloc_peak_kb_max": round(max(peaks) / 1024, 1),
+    }
+
+
+def run_load(fn: Callable[[str], object], queries: Sequence[str], *,
+             concurrency: int, duration: float) -> Dict:
+    """Closed-loop load generator: *concurrency* clients for *duration* seconds."""
+    deadline = time.perf_counter() + duration
+
+    def client(offset: int) -> List[float]:
+        samples, i = [], offset
+        while time.perf_counter() < deadline:
+            t0 = time.perf_counter()
+            fn(queries[i % len(queries)])
+            samples.append((time.perf_counter() - t0) * 1000)
+            i += 1
+        return samples
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = [x for r in pool.map(client, range(concurrency)) for x in r]
+    wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "calls": len(latencies),
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "throughput_qps": round(len(latencies) / wall, 1) if wall else 0.0,
+    }
+
+
+# Entry points whose cold import time is tracked between commits
+STARTUP_MODULES = ("rag_engine", "app")
+
+
+def import_time_report(module: str, *, top: int = 10) -> Dict:
+    """
+    Cold-import *module* in a fresh interpreter under ``-X importtime`` and
+    return the total plus the heaviest imports by cumulative time.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR, capture_output=True, text=True, timeout=300,
+    )
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:   self [us] |   cumulative |   <indent>module"
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(self_us), int(cum_us)))
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr else "failed"}
+    total = next((cum for name, _, cum in entries if name == module), 0)
+    heaviest = sorted((e for e in entries if e[0] != module),
+                      key=lambda e: e[2], reverse=True)
+    return {
+        "total_ms": round(total / 1000, 1),
+        "top": [{"module": n, "cumulative_ms": round(c / 1000, 1)}
+                for n, _, c in heaviest[:top]],
+    }
+
+
+# ---------------------------------------------------------------------------
+# Suite
+# ---------------------------------------------------------------------------
+
+def _targets(semantic_ok: bool, image_path: str) -> Dict[str, Callable[[str], object]]:
+    from database import search_by_keywords, search_with_intent
+    from fuzzy_index import fuzzy_search
+    from query_parser import parse_query
+    from rag_engine import RAGEngine
+    from tools import extract_model
+    from vector_store import semantic_search
+
+    engine = RAGEngine(use_web_fallback=True, use_semantic=semantic_ok)
+    targets = {
+        "parse_query": parse_query,
+        "search_with_intent": lambda q: search_with_intent(q, parse_query(q), 5),
+        "search_by_keywords": lambda q: search_by_keywords(q, 5),
+        "fuzzy_search": lambda q: fuzzy_search(q, 5),
+        "rag_engine.search": engine.search,
+        "rag_engine.process": engine.process,
+        "tools.extract_model": lambda q: extract_model(image_path),
+    }
+    if semantic_ok:
+        targets["semantic_search"] = lambda q: semantic_search(q, 5)
+    return targets
+
+
+def run_suite(queries: Sequence[str], *, iterations: int = 5,
+              concurrency: int = 0, duration: float = 5.0,
+              only: Optional[Sequence[str]] = None) -> Dict:
+    """Run every target against the currently configured database."""
+    reason = _semantic_available()
+    results: Dict[str, Dict] = {}
+    with _stubbed_services(), _unlogged(), tempfile.TemporaryDirectory() as tmp:
+        for name, fn in _targets(reason is None, _fixture_image(tmp)).items():
+            if only and name not in only:
+                continue
+            results[name] = bench_target(fn, queries, iterations=iterations)
+            if concurrency:
+                results[name]["load"] = run_load(
+                    fn, queries, concurrency=concurrency, duration=duration)
+    if reason is not None:
+        results["semantic_search"] = {"skipped": reason}
+    return results
+
+
+def run_pool_load(queries: Sequence[str], *, workers: int, duration: float) -> Dict:
+    """
+    Load-test the multi-process pool with 2 clients per worker. The web
+    fallback is disabled because the Tavily stub is not patched into the
+    spawned workers.
+    """
+    from worker_pool import SearchWorkerPool
+
+    with _unlogged(), SearchWorkerPool(workers, use_web_fallback=False) as pool:
+        try:
+            pool.warm_up()
+        except Exception:  # embedding server unavailable → DB-only workers
+            pass
+        result = run_load(pool.process, queries, concurrency=workers * 2,
+                          duration=duration)
+    result["workers"] = workers
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def compare(current: Dict, baseline: Dict, *, tolerance: float = 10.0) -> List[str]:
+    """Return a line per metric that regressed by more than *tolerance* %."""
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or "skipped" in cur or "skipped" in base:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if metric not in cur or not base.get(metric):
+                continue
+            if cur[metric] > base[metric] * (1 + tolerance / 100):
+                delta = (cur[metric] / base[metric] - 1) * 100
+                regressions.append(
+                    f"{name}.{metric}: {base[metric]} → {cur[metric]} (+{delta:.0f}%)")
+    return regressions
+
+
+def _print_table(results: Dict[str, Dict]) -> None:
+    print(f"{'target':<22}{'p50':>10}{'p95':>10}{'p99':>10}{'qps':>10}{'alloc KB':>10}")
+    for name, r in results.items():
+        if "workers" in r:
+            print(f"{name:<22}{r['p50_ms']:>10}{'':>10}{r['p99_ms']:>10}"
+                  f"{r['throughput_qps']:>10}  ({r['workers']} workers)")
+            continue
+        if "skipped" in r:
+            print(f"{name:<22}  skipped ({r['skipped'][:50]})")
+            continue
+        print(f"{name:<22}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['throughput_qps']:>10}{r['alloc_peak_kb_mean']:>10}")
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="VIVOHOME search benchmark")
+    parser.add_argument("--rows", type=int, default=0,
+                        help="scale the catalog to N synthetic rows (e.g. 10000, 100000, 1000000)")
+    parser.add_argument("--corpus", action="append", default=[],
+                        help="extra query file (.txt or .jsonl); repeatable")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=0,
+                        help="also run a closed-loop load test with N clients")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="also load-test a SearchWorkerPool with N processes")
+    parser.add_argument("--only", nargs="*", help="restrict to these targets")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="baseline JSON to diff against")
+    parser.add_argument("--tolerance", type=float, default=10.0,
+                        help="allowed regression in percent")
+    parser.add_argument("--no-startup", action="store_true",
+                        help="skip the -X importtime cold-start report")
+    args = parser.parse_args(argv)
+
+    queries = list(DEFAULT_QUERIES)
+    for path in args.corpus:
+        queries.extend(load_corpus(path))
+
+    with ExitStack() as stack:
+        if args.rows:
+            import catalog
+            import database
+            tmp = stack.enter_context(tempfile.TemporaryDirectory())
+            db_path = os.path.join(tmp, "bench.db")
+            print(f"Generating synthetic catalog: {args.rows:,} rows ...")
+            generate_catalog(args.rows, db_path)
+            stack.enter_context(mock.patch.object(database, "DB_PATH", db_path))
+            # A published artifact would shadow the synthetic DB: read SQLite
+            stack.enter_context(mock.patch.object(catalog, "CATALOG_ARTIFACT_DIR", ""))
+            stack.enter_context(mock.patch.dict(os.environ, {"CATALOG_ARTIFACT_DIR": ""}))
+        results = run_suite(queries, iterations=args.iterations,
+                            concurrency=args.concurrency, duration=args.duration,
+                            only=args.only)
+        if args.workers:
+            results["worker_pool.process"] = run_pool_load(
+                queries, workers=args.workers, duration=args.duration)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "rows": args.rows or "real",
+            "queries": len(queries),
+            "iterations": args.iterations,
+        },
+        "results": results,
+    }
+    if not args.no_startup:
+        report["startup"] = {m: import_time_report(m) for m in STARTUP_MODULES}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    _print_table(results)
+    for module, rep in report.get("startup", {}).items():
+        print(f"import {module}: {rep.get('total_ms', rep.get('error'))} ms")
+    print(f"\nSaved → {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), tolerance=args.tolerance)
+        for line in regressions:
+            print(f"  REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
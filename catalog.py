@@ -0,0 +1,632 @@
+"""
+VIVOHOME AI - Columnar Catalog
+In-memory, array-backed copy of the products table for intent search.
+Filters are boolean masks over NumPy arrays (cached per category/brand),
+deduplication and top-k run on index arrays, and Python dicts are only
+built for the rows actually returned.
+
+The snapshot comes from SQLite, or — when CATALOG_ARTIFACT_DIR is set —
+from a prebuilt artifact (catalog_build.py) that is memory-mapped
+read-only, so startup does no parsing and worker processes share pages.
+"""
+
+import json
+import mmap
+import os
+import re
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import database
+from app_config import CATALOG_ARTIFACT_DIR
+from logger import get_logger
+from metrics import span
+from normalizer import fold, fold_padded
+
+logger = get_logger("catalog")
+
+_MASK_CACHE_SIZE = 256
+
+# Rows of one listing ordered by (price, id), with those two sort keys
+Listing = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+# Artifact layout: magic, header length (u64 LE), JSON header, then arrays
+# at 64-byte aligned offsets (relative to the first aligned byte after the
+# header) listed in the header.
+ARTIFACT_MAGIC = b"VVCATLG1"
+ARTIFACT_FORMAT = 2
+ARTIFACT_ALIGN = 64
+POINTER_FILE = "CURRENT"
+
+# String columns stored as blob + offsets (see _Strings)
+STRING_COLUMNS = ("ten", "model", "specs", "nhom_hang", "nhom_hang_loai",
+                  "ten_fold", "search_fold")
+
+
+class _Strings:
+    """
+    Read-only string column: values joined by newlines into one UTF-8 blob
+    plus the start offset of each value. Works the same over bytes and over
+    a memory-mapped array; values are decoded on access.
+    """
+
+    def __init__(self, blob, offsets: np.ndarray, empty_as_none: bool = False):
+        self.data = memoryview(blob)
+        self.offsets = offsets
+        self.empty_as_none = empty_as_none
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        i = int(i)
+        end = int(self.offsets[i + 1]) - 1 if i + 1 < len(self.offsets) else len(self.data)
+        value = str(self.data[int(self.offsets[i]):end], "utf-8")
+        return None if self.empty_as_none and not value else value
+
+    @staticmethod
+    def join(values: Iterable[Optional[str]]) -> Tuple[bytes, np.ndarray]:
+        parts = [(v or "").encode("utf-8") for v in values]
+        lengths = np.fromiter((len(p) + 1 for p in parts), dtype=np.int64, count=len(parts))
+        offsets = np.zeros(len(parts), dtype=np.int64)
+        if len(parts) > 1:
+            np.cumsum(lengths[:-1], out=offsets[1:])
+        return b"\n".join(parts), offsets
+
+
+def _column(rows: Sequence, name: str) -> List:
+    if rows and name in rows[0].keys():
+        return [r[name] for r in rows]
+    return [None] * len(rows)
+
+
+class Catalog:
+    """
+    Column arrays for one snapshot of the catalog. Folded search text is
+    kept as one newline-joined blob per column plus row offsets, so a
+    phrase scan is a single regex pass instead of one check per row.
+    """
+
+    def __init__(self, rows: Sequence, source_key: tuple = ()):
+        self.source_key = source_key
+        self.version: Optional[str] = None  # artifact version, if loaded from one
+        self.size = len(rows)
+        self.ten: Sequence[str] = [r["ten_san_pham"] for r in rows]
+        self.model: Sequence[Optional[str]] = [r["model"] for r in rows]
+        self.specs: Sequence[Optional[str]] = [r["thong_so_chinh"] for r in rows]
+        self.nhom_hang: Sequence[Optional[str]] = _column(rows, "nhom_hang")
+        self.nhom_hang_loai: Sequence[Optional[str]] = _column(rows, "nhom_hang_loai")
+        self.gia = np.fromiter((r["gia"] or 0 for r in rows), dtype=np.int64, count=self.size)
+        self.ids = np.fromiter((i if i is not None else n + 1
+                                for n, i in enumerate(_column(rows, "id"))),
+                               dtype=np.int64, count=self.size)
+        self.stock = np.fromiter((-1 if s is None else s for s in _column(rows, "ton_kho")),
+                                 dtype=np.int64, count=self.size)  # -1 = unknown
+
+        # Folded values are padded; an empty one still separates rows
+        self.ten_fold = _Strings(*_Strings.join(r["ten_fold"] or " " for r in rows))
+        self.search_fold = _Strings(*_Strings.join(r["search_fold"] or " " for r in rows))
+
+        # Dedup key: first row index per model; rows without a model never merge
+        first: Dict[str, int] = {}
+        self.model_key = np.fromiter(
+            (first.setdefault(m, i) if m else -(i + 1) for i, m in enumerate(self.model)),
+            dtype=np.int64, count=self.size)
+
+        self._model_index: Optional[Tuple[Sequence[str], np.ndarray]] = None
+        self._mask_rows: Dict[tuple, int] = {}      # prebuilt masks (artifact only)
+        self._packed_masks: Optional[np.ndarray] = None
+        self.terms: Optional[_Strings] = None        # token index (artifact only)
+        self.postings: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self.embeddings: Optional[np.ndarray] = None
+        self.embedding_norms: Optional[np.ndarray] = None
+        self.embedding_codes: Optional[np.ndarray] = None  # int8, see vector_quant
+        self.embedding_scale: Optional[np.ndarray] = None
+
+        self._masks: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._listings: "OrderedDict[tuple, Listing]" = OrderedDict()
+        self._prices_changed = 0  # bumped by update(gia=...); guards listing builds
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_artifact(cls, path: str, source_key: tuple = ()) -> "Catalog":
+        """Map a catalog_build artifact read-only; arrays are views of the file."""
+        header, arrays = read_artifact(path)
+        cat = cls.__new__(cls)
+        cat.source_key = source_key
+        cat.version = header["version"]
+        cat.size = header["rows"]
+        for name in STRING_COLUMNS:
+            nullable = name not in ("ten", "ten_fold", "search_fold")
+            setattr(cat, name, _Strings(arrays[f"{name}.blob"], arrays[f"{name}.off"],
+                                        empty_as_none=nullable))
+        cat.gia, cat.ids, cat.model_key = arrays["gia"], arrays["ids"], arrays["model_key"]
+        cat.stock = arrays["stock"]
+        cat._model_index = (_Strings(arrays["model_index.blob"], arrays["model_index.off"]),
+                            arrays["model_index.rows"])
+        cat._mask_rows = {(kind, tuple(value) if isinstance(value, list) else value): i
+                          for i, (kind, value) in enumerate(header["mask_keys"])}
+        cat._packed_masks = arrays["intent_masks"]
+        cat.terms = _Strings(arrays["terms.blob"], arrays["terms.off"])
+        cat.postings = (arrays["postings.off"], arrays["postings.rows"])
+        cat.embeddings = arrays.get("embeddings")
+        cat.embedding_norms = arrays.get("embedding_norms")
+        cat.embedding_codes = arrays.get("embeddings.q8")
+        cat.embedding_scale = arrays.get("embeddings.scale")
+        cat._masks = OrderedDict()
+        cat._listings = OrderedDict()
+        cat._prices_changed = 0
+        cat._lock = threading.Lock()
+        return cat
+
+    # ------------------------------------------------------------------
+    # Masks
+    # ------------------------------------------------------------------
+
+    def _scan(self, column: _Strings, phrases: Sequence[str]) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        pattern = re.compile(b"|".join(re.escape(p.encode("utf-8")) for p in phrases))
+        hits = np.fromiter((m.start() for m in pattern.finditer(column.data)), dtype=np.int64)
+        if hits.size:
+            mask[np.searchsorted(column.offsets, hits, side="right") - 1] = True
+        return mask
+
+    def _cached_mask(self, key: tuple, build) -> np.ndarray:
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        row = self._mask_rows.get(key)
+        if row is not None:
+            mask = np.unpackbits(self._packed_masks[row], count=self.size).astype(bool)
+        else:
+            mask = build()
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > _MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return mask
+
+    @staticmethod
+    def category_key(category: str) -> tuple:
+        keywords = database.TV_KEYWORDS if category.lower() == "tv" else (category,)
+        return "category", tuple(fold_padded(k) for k in keywords)
+
+    @staticmethod
+    def brand_key(brand: str) -> tuple:
+        return "brand", fold(brand)
+
+    def category_mask(self, category: str) -> np.ndarray:
+        """Whole-token phrase match on the folded product name."""
+        key = self.category_key(category)
+        return self._cached_mask(key, lambda: self._scan(self.ten_fold, key[1]))
+
+    def brand_mask(self, brand: str) -> np.ndarray:
+        """Substring match on folded name + model + specs."""
+        key = self.brand_key(brand)
+        return self._cached_mask(key, lambda: self._scan(self.search_fold, (key[1],)))
+
+    def spec_mask(self, phrases: Sequence[str]) -> np.ndarray:
+        """Whole-token match of any of *phrases* on folded name + model + specs."""
+        key = ("spec", tuple(fold_padded(p) for p in phrases))
+        return self._cached_mask(key, lambda: self._scan(self.search_fold, key[1]))
+
+    # ------------------------------------------------------------------
+    # Index-array operations
+    # ------------------------------------------------------------------
+
+    def dedupe(self, idx: np.ndarray) -> np.ndarray:
+        """Keep the first row per model, preserving the order of *idx*."""
+        if idx.size < 2:
+            return idx
+        _, first = np.unique(self.model_key[idx], return_index=True)
+        return idx[np.sort(first)]
+
+    def top_k(self, idx: np.ndarray, k: int, *, descending: bool) -> np.ndarray:
+        """
+        The k rows of *idx* with the highest (or lowest) price, ordered; ties
+        keep their order in *idx*, exactly like a stable sort would.
+        """
+        n = idx.size
+        if n == 0 or k <= 0:
+            return idx[:0]
+        prices = self.gia[idx]
+        key = (-prices if descending else prices) * n + np.arange(n, dtype=np.int64)
+        part = np.argpartition(key, k - 1)[:k] if n > k else np.arange(n)
+        return idx[part[np.argsort(key[part])]]
+
+    # ------------------------------------------------------------------
+    # Model-code index
+    # ------------------------------------------------------------------
+
+    def model_index(self) -> Tuple[Sequence[str], np.ndarray]:
+        """Folded model codes in sorted order, and the row of each (lowest id first)."""
+        if self._model_index is None:
+            keys = [fold_padded(m) if m else "" for m in self.model]
+            order = sorted(range(self.size), key=keys.__getitem__)  # stable
+            self._model_index = ([keys[i] for i in order], np.array(order, dtype=np.int64))
+        return self._model_index
+
+    def find_model(self, model_code: str) -> Optional[int]:
+        """Row of the product whose folded model code equals *model_code*'s."""
+        rows = self.rows_for_model(model_code)
+        return int(rows[0]) if rows.size else None
+
+    def rows_for_model(self, model_code: str) -> np.ndarray:
+        """Every row with that folded model code, lowest id first."""
+        keys, rows = self.model_index()
+        target = fold_padded(model_code)
+        start = end = bisect_left(keys, target)
+        while end < len(keys) and keys[end] == target:
+            end += 1
+        return rows[start:end]
+
+    # ------------------------------------------------------------------
+    # In-place updates (live price/stock feed)
+    # ------------------------------------------------------------------
+
+    def update(self, rows: np.ndarray, *, gia: Optional[int] = None,
+               stock: Optional[int] = None) -> None:
+        """
+        Set price and/or stock for *rows*. Mapped (read-only) arrays are
+        copied to private memory on the first update.
+        """
+        with self._lock:
+            if gia is not None:
+                if not self.gia.flags.writeable:
+                    self.gia = self.gia.copy()
+                self.gia[rows] = gia
+                self._listings.clear()
+                self._prices_changed += 1
+            if stock is not None:
+                if not self.stock.flags.writeable:
+                    self.stock = self.stock.copy()
+                self.stock[rows] = stock
+
+    @property
+    def prices_generation(self) -> int:
+        """Bumped by each price update; caches derived from prices compare it."""
+        return self._prices_changed
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def rank(self, intent: Dict, max_results: int, candidates: int = 0, *,
+             after: Optional[Tuple[int, int]] = None, paged: bool = False) -> Dict:
+        """
+        Same contract as database._rank_rows, over index arrays. A listing
+        (plain search intent) starts after the (price, id) keyset *after*;
+        with *paged* its result carries ``"next"``, the keyset of its last
+        row, or None on the last page.
+        """
+        kind = intent["intent"]
+        brands = intent.get("brands")
+
+        # Step 1 — filter by category
+        mask = (self.category_mask(intent["category"]) if intent.get("category")
+                else np.ones(self.size, dtype=bool))
+
+        pool = None
+        if candidates and intent.get("category"):
+            unique = self.dedupe(np.flatnonzero(mask))
+            if unique.size <= candidates:
+                pool = [self.candidate(i) for i in unique]
+
+        # Steps 2-4 — brands, deduplicate by model, order by intent
+        next_key = None
+        if brands and kind == "compare":
+            idx = self.top_k(self._comparison(mask, brands), 6, descending=True)
+        elif kind in ("highest_price", "lowest_price", "compare"):
+            idx = self.dedupe(np.flatnonzero(self._with_brands(mask, brands)))
+            if kind == "highest_price" and idx.size:
+                idx = idx[[int(np.argmax(self.gia[idx]))]]
+            elif kind == "lowest_price" and idx.size:
+                idx = idx[[int(np.argmin(self.gia[idx]))]]
+            elif kind == "compare":
+                idx = self.top_k(idx, 6, descending=True)
+        else:
+            rows, gia, ids = self.listing(intent)
+            start = self.seek((rows, gia, ids), after) if after is not None else 0
+            end = min(start + max_results, rows.size)
+            idx = rows[start:end]
+            if end < rows.size:
+                next_key = (int(gia[end - 1]), int(ids[end - 1]))
+
+        # Step 5 — format only the rows returned (compare shows up to 6)
+        if idx.size:
+            limit = idx.size if kind == "compare" else max_results
+            products = [self.product(i) for i in idx[:limit]]
+            result = {"found": True, "count": len(products), "products": products}
+            if pool is not None:
+                result["candidates"] = pool
+        else:
+            result = {"found": False}
+        if paged:
+            result["next"] = next_key
+        return result
+
+    def _with_brands(self, mask: np.ndarray, brands: Optional[Sequence[str]]) -> np.ndarray:
+        if not brands:
+            return mask
+        brand_any = np.zeros(self.size, dtype=bool)
+        for b in brands:
+            brand_any |= self.brand_mask(b)
+        return mask & brand_any
+
+    # ------------------------------------------------------------------
+    # Keyset listings
+    # ------------------------------------------------------------------
+
+    def listing(self, intent: Dict) -> Listing:
+        """
+        Deduplicated rows for the intent's category and brands ordered by
+        (price, id), plus those keys. Built once per filter, so any page
+        costs two binary searches and a slice; price updates drop the cache.
+        """
+        category = intent.get("category")
+        key = (self.category_key(category) if category else None,
+               tuple(sorted({self.brand_key(b)[1] for b in intent.get("brands") or ()})))
+        with self._lock:
+            hit = self._listings.get(key)
+            if hit is not None:
+                self._listings.move_to_end(key)
+                return hit
+            generation = self._prices_changed
+
+        mask = (self.category_mask(category) if category
+                else np.ones(self.size, dtype=bool))
+        rows = self.dedupe(np.flatnonzero(self._with_brands(mask, intent.get("brands"))))
+        gia = self.gia[rows]
+        order = np.lexsort((self.ids[rows], gia))
+        listing = (rows[order], gia[order], self.ids[rows][order])
+        with self._lock:
+            if generation == self._prices_changed:  # else priced before an update
+                self._listings[key] = listing
+                while len(self._listings) > _MASK_CACHE_SIZE:
+                    self._listings.popitem(last=False)
+        return listing
+
+    def price_range(self, intent: Dict, max_results: int, below: Optional[int] = None,
+                    above: Optional[int] = None) -> Dict:
+        """
+        The intent's listing cut to prices strictly below *below* and/or above
+        *above*, nearest the bound first: the priciest rows under *below*,
+        else the cheapest over *above*. Two binary searches on the cached listing.
+        """
+        rows, gia, _ = self.listing(intent)
+        lo = int(np.searchsorted(gia, above, side="right")) if above is not None else 0
+        hi = int(np.searchsorted(gia, below, side="left")) if below is not None else rows.size
+        idx = (rows[max(lo, hi - max_results):hi][::-1] if below is not None
+               else rows[lo:min(hi, lo + max_results)])
+        if not idx.size:
+            return {"found": False}
+        products = [self.product(i) for i in idx]
+        return {"found": True, "count": len(products), "products": products}
+
+    @staticmethod
+    def seek(listing: Listing, after: Tuple[int, int]) -> int:
+        """Position of the first row ordered after the (price, id) keyset."""
+        _, gia, ids = listing
+        lo = int(np.searchsorted(gia, after[0], side="left"))
+        hi = int(np.searchsorted(gia, after[0], side="right"))
+        return lo + int(np.searchsorted(ids[lo:hi], after[1], side="right"))
+
+    def _comparison(self, mask: np.ndarray, brands: Sequence[str]) -> np.ndarray:
+        """Top two products per brand, first brand wins a shared model."""
+        seen: set = set()
+        chosen: List[int] = []
+        for brand in brands:
+            for i in self.top_k(np.flatnonzero(mask & self.brand_mask(brand)), 2,
+                                descending=True):
+                model = self.model[i] or ""
+                if model not in seen:
+                    chosen.append(int(i))
+                    seen.add(model)
+        return self.dedupe(np.array(chosen, dtype=np.int64))
+
+    def product(self, i: int) -> Dict:
+        return {
+            "ten": self.ten[i],
+            "model": self.model[i] or "N/A",
+            "gia": int(self.gia[i]),
+            "nsx": self.specs[i] or "N/A",
+        }
+
+    def candidate(self, i: int) -> Dict:
+        """Row dict for session follow-ups — the columns _rank_rows reads."""
+        return {
+            "ten_san_pham": self.ten[i],
+            "model": self.model[i],
+            "gia": int(self.gia[i]),
+            "thong_so_chinh": self.specs[i],
+            "ten_fold": self.ten_fold[i],
+            "search_fold": self.search_fold[i],
+        }
+
+
+# ---------------------------------------------------------------------------
+# Artifact reading
+# ---------------------------------------------------------------------------
+
+def data_offset(position: int) -> int:
+    """First aligned offset at or after *position* (array offsets are relative to it)."""
+    return -(-position // ARTIFACT_ALIGN) * ARTIFACT_ALIGN
+
+
+def read_artifact(path: str) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """Header and zero-copy, read-only array views of an artifact file."""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(ARTIFACT_MAGIC)] != ARTIFACT_MAGIC:
+        raise ValueError(f"{path} is not a catalog artifact")
+    start = len(ARTIFACT_MAGIC) + 8
+    length = int.from_bytes(mm[start - 8:start], "little")
+    header = json.loads(mm[start:start + length])
+    if header.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"{path}: unsupported artifact format {header.get('format')}")
+    base = data_offset(start + length)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        count = int(np.prod(spec["shape"]))
+        arrays[name] = np.frombuffer(mm, dtype=spec["dtype"], count=count,
+                                     offset=base + spec["offset"]).reshape(spec["shape"])
+    return header, arrays
+
+
+_pointers: Dict[str, Tuple[tuple, str]] = {}
+
+
+def current_artifact(directory: Optional[str] = None) -> Optional[str]:
+    """Path of the artifact named by *directory*/CURRENT, or None."""
+    directory = directory or CATALOG_ARTIFACT_DIR
+    if not directory:
+        return None
+    pointer = os.path.join(directory, POINTER_FILE)
+    try:
+        st = os.stat(pointer)
+    except FileNotFoundError:
+        return None
+    # CURRENT is replaced atomically, so a new version means a new inode
+    stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+    cached = _pointers.get(pointer)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(pointer, encoding="utf-8") as f:
+        path = os.path.join(directory, f.read().strip())
+    _pointers[pointer] = (stamp, path)
+    return path
+
+
+# ---------------------------------------------------------------------------
+# Process-wide snapshot (reloaded when the database file or artifact changes)
+# ---------------------------------------------------------------------------
+
+_catalog: Optional[Catalog] = None
+_version = 0  # bumped on every (re)load; keys caches derived from catalog rows
+_load_lock = threading.Lock()
+
+
+def _source_key() -> tuple:
+    st = os.stat(database.DB_PATH)
+    return database.DB_PATH, st.st_mtime_ns, st.st_size
+
+
+def _snapshot_key(artifact: Optional[str]) -> tuple:
+    """
+    Artifact snapshots also carry the DB stamp (when there is a DB): live
+    prices and stock are written there, so another process's write reloads
+    the artifact with them overlaid.
+    """
+    if not artifact:
+        return _source_key()
+    if not os.path.exists(database.DB_PATH):
+        return "artifact", artifact
+    return ("artifact", artifact) + _source_key()
+
+
+def _overlay_live_values(catalog: Catalog) -> None:
+    """Replace the artifact's build-time price/stock with the DB's current values."""
+    with span("sqlite"), database.get_connection() as conn:
+        rows = conn.execute("SELECT id, model, gia, ton_kho FROM products").fetchall()
+    if not rows or not catalog.size:
+        return
+    ids = np.fromiter((r["id"] for r in rows), dtype=np.int64, count=len(rows))
+    gia = np.fromiter((r["gia"] or 0 for r in rows), dtype=np.int64, count=len(rows))
+    stock = np.fromiter((-1 if r["ton_kho"] is None else r["ton_kho"] for r in rows),
+                        dtype=np.int64, count=len(rows))
+
+    order = np.argsort(catalog.ids, kind="stable")
+    pos = np.minimum(np.searchsorted(catalog.ids, ids, sorter=order), catalog.size - 1)
+    target = order[pos]
+    known = catalog.ids[target] == ids
+    differs = known & ((catalog.gia[target] != gia) | (catalog.stock[target] != stock))
+    # Same id but another model: the DB was imported from a different CSV
+    picks = [j for j in np.flatnonzero(differs) if catalog.model[target[j]] == rows[j]["model"]]
+    if not picks:
+        return
+    rows_at = target[picks]
+    catalog.gia, catalog.stock = catalog.gia.copy(), catalog.stock.copy()
+    catalog.gia[rows_at], catalog.stock[rows_at] = gia[picks], stock[picks]
+    logger.info("Catalog overlay: %d live price/stock values from the database", len(picks))
+
+
+def _load(key: tuple) -> Catalog:
+    if key[0] == "artifact":
+        catalog = Catalog.from_artifact(key[1], key)
+        if len(key) > 2:
+            _overlay_live_values(catalog)
+        logger.info("Catalog mapped: %d products, artifact %s", catalog.size, catalog.version)
+        return catalog
+    with span("sqlite"), database.get_connection() as conn:
+        rows = conn.execute("""
+            SELECT id, ten_san_pham, model, gia, ton_kho, thong_so_chinh, nhom_hang,
+                   nhom_hang_loai, ten_fold, search_fold
+            FROM products ORDER BY id
+        """).fetchall()
+    catalog = Catalog(rows, _source_key())
+    logger.info("Catalog loaded: %d products", catalog.size)
+    return catalog
+
+
+def get_catalog() -> Catalog:
+    """Current catalog snapshot; reloads after the database or artifact changes."""
+    global _catalog, _version
+    artifact = current_artifact()
+    if not artifact and not os.path.exists(database.DB_PATH):
+        database.get_connection().close()  # builds the DB from CSV
+    key = _snapshot_key(artifact)
+    if _catalog is None or _catalog.source_key != key:
+        with _load_lock:
+            if _catalog is None or _catalog.source_key != key:
+                _catalog = _load(key)
+                _version += 1
+    return _catalog
+
+
+def catalog_version() -> int:
+    """Version of the loaded snapshot (0 until the first load); never reloads."""
+    return _version
+
+
+@contextmanager
+def patching() -> Iterator[Catalog]:
+    """
+    Yield the current snapshot for a DB write that this process also applies
+    to the snapshot in place (live_updates). Reloads wait meanwhile, and the
+    snapshot adopts the new file stamp, so the write never triggers a full
+    reload here; other processes see the stamp change and reload. Don't
+    call get_catalog() inside the block.
+    """
+    get_catalog()
+    with _load_lock:
+        yield _catalog
+        key = _catalog.source_key
+        _catalog.source_key = _snapshot_key(key[1] if key[0] == "artifact" else None)
+
+
+def reset_catalog() -> None:
+    global _catalog
+    with _load_lock:
+        _catalog = None
+
+
+# ---------------------------------------------------------------------------
+# CLI test
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    from query_parser import parse_query
+
+    cat = get_catalog()
+    print(f"{cat.size} products, price array {cat.gia.nbytes} bytes, "
+          f"artifact {cat.version or '-'}")
+    for q in ["TV giá cao nhất", "Tủ lạnh rẻ nhất", "So sánh TV Samsung và LG",
+              "Máy lọc nước Hòa Phát"]:
+        print(f"\n{q}: {cat.rank(parse_query(q), 3)}")
@@ -0,0 +1,260 @@
+"""
+VIVOHOME AI - Catalog Artifact Builder
+Offline step that compiles product.csv into one versioned, memory-mappable
+file: column arrays (incl. price and stock), precomputed category/brand masks, the model-code
+index, the fuzzy token index and (optionally) product embeddings plus their
+int8 codes (vector_quant.py). Serving
+processes map it read-only via catalog.get_catalog() when
+CATALOG_ARTIFACT_DIR is set.
+
+New versions are written next to the old ones and published by atomically
+replacing the CURRENT pointer, so running processes switch on their next
+search and never see a half-written file.
+
+    python catalog_build.py build [--csv product.csv | --db bench.db] [--embeddings] [--force]
+    python catalog_build.py info
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app_config import BASE_DIR, CATALOG_ARTIFACT_DIR, CATALOG_ARTIFACT_KEEP, CSV_PATH
+from catalog import (ARTIFACT_FORMAT, ARTIFACT_MAGIC, POINTER_FILE, STRING_COLUMNS, Catalog,
+                     _Strings, current_artifact, data_offset, read_artifact)
+from fuzzy_index import FuzzyIndex
+from logger import get_logger
+from query_parser import BRAND_PATTERNS, CATEGORY_PATTERNS
+
+logger = get_logger("catalog_build")
+
+DEFAULT_DIR = str(BASE_DIR / "catalog_artifact")
+_PREFIX, _SUFFIX = "catalog-", ".vcat"
+
+
+# ---------------------------------------------------------------------------
+# Compilation
+# ---------------------------------------------------------------------------
+
+def load_rows(csv_path: str) -> List[sqlite3.Row]:
+    """Import *csv_path* exactly like database.init_database, into a scratch DB."""
+    import database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "build.db")
+        database.init_database(db_path, csv_path)
+        return load_db_rows(db_path)
+
+
+def load_db_rows(db_path: str) -> List[sqlite3.Row]:
+    """Rows of an existing catalog DB (e.g. a benchmark.py synthetic one)."""
+    import database
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        database.ensure_schema(conn)
+        return conn.execute("SELECT * FROM products ORDER BY id").fetchall()
+    finally:
+        conn.close()
+
+
+def compile_rows(rows: Sequence,
+                 embed: Optional[Callable[[List[str]], Sequence]] = None
+                 ) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """
+    Header fields and named arrays for *rows* (products table rows, in id
+    order). Masks and indexes are computed by the same Catalog/FuzzyIndex
+    code that serves queries, so a mapped artifact ranks identically.
+    """
+    cat = Catalog(rows)
+    arrays: Dict[str, np.ndarray] = {}
+
+    def put_strings(name: str, values) -> None:
+        blob, offsets = _Strings.join(values)
+        arrays[f"{name}.blob"] = np.frombuffer(blob, dtype=np.uint8)
+        arrays[f"{name}.off"] = offsets
+
+    for name in STRING_COLUMNS:
+        column = getattr(cat, name)
+        if isinstance(column, _Strings):
+            arrays[f"{name}.blob"] = np.frombuffer(column.data, dtype=np.uint8)
+            arrays[f"{name}.off"] = column.offsets
+        else:
+            put_strings(name, column)
+    arrays["gia"], arrays["ids"], arrays["model_key"] = cat.gia, cat.ids, cat.model_key
+    arrays["stock"] = cat.stock
+
+    keys, order = cat.model_index()
+    put_strings("model_index", keys)
+    arrays["model_index.rows"] = order
+
+    # Every category and brand mask a parsed query can ask for
+    masks: Dict[tuple, np.ndarray] = {}
+    for category in CATEGORY_PATTERNS:
+        masks[Catalog.category_key(category)] = cat.category_mask(category)
+    for brand in BRAND_PATTERNS:
+        masks[Catalog.brand_key(brand)] = cat.brand_mask(brand)
+    arrays["intent_masks"] = np.packbits(np.stack(list(masks.values())), axis=1)
+
+    fuzzy = FuzzyIndex(rows)
+    put_strings("terms", fuzzy.terms)
+    arrays["postings.off"], arrays["postings.rows"] = fuzzy.to_csr()
+
+    header = {"rows": cat.size, "mask_keys": [list(k) for k in masks],
+              "embedding_model": None}
+    if embed is not None:
+        from app_config import EMBEDDING_MODEL
+        from vector_quant import quantize
+        from vector_store import DOC_SCHEMA, product_document
+
+        vectors = np.asarray(embed([product_document(r) for r in rows]), dtype=np.float32)
+        arrays["embeddings"] = vectors
+        arrays["embedding_norms"] = np.einsum("ij,ij->i", vectors, vectors)
+        arrays["embeddings.q8"], arrays["embeddings.scale"] = quantize(vectors)
+        header["embedding_model"] = EMBEDDING_MODEL
+        header["doc_schema"] = DOC_SCHEMA
+    return header, arrays
+
+
+# ---------------------------------------------------------------------------
+# Writing and publishing
+# ---------------------------------------------------------------------------
+
+def write_artifact(path: str, header: Dict, arrays: Dict[str, np.ndarray]) -> None:
+    """Write *arrays* after a JSON header; fsynced before returning."""
+    specs, offset = {}, 0
+    for name, arr in arrays.items():
+        offset = data_offset(offset)
+        specs[name] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": offset}
+        offset += arr.nbytes
+    raw = json.dumps(dict(header, format=ARTIFACT_FORMAT, arrays=specs),
+                     ensure_ascii=False).encode("utf-8")
+    start = len(ARTIFACT_MAGIC) + 8
+    base = data_offset(start + len(raw))
+    with open(path, "wb") as f:
+        f.write(ARTIFACT_MAGIC + len(raw).to_bytes(8, "little") + raw)
+        for name, arr in arrays.items():
+            f.write(b"\0" * (base + specs[name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def publish(directory: str, filename: str) -> None:
+    """Point CURRENT at *filename* with one atomic rename."""
+    tmp = os.path.join(directory, f".{POINTER_FILE}.{os.getpid()}")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(filename + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(directory, POINTER_FILE))
+
+
+def prune(directory: str, keep: int = CATALOG_ARTIFACT_KEEP) -> List[str]:
+    """
+    Delete all but the newest *keep* versions (never the current one).
+    Processes still mapping a deleted file keep reading it until they switch.
+    """
+    current = os.path.basename(current_artifact(directory) or "")
+    versions = sorted((f for f in os.listdir(directory)
+                       if f.startswith(_PREFIX) and f.endswith(_SUFFIX)), reverse=True)
+    removed = [f for f in versions[max(keep, 1):] if f != current]
+    for f in removed:
+        os.remove(os.path.join(directory, f))
+    return removed
+
+
+def _source_digest(path: str, embeddings: bool) -> str:
+    from vector_store import DOC_SCHEMA
+
+    # Embeddings carry int8 codes ("q8") and follow the embedded text's
+    # schema, so artifacts from before either change rebuild
+    tag = f"q8:doc{DOC_SCHEMA}:" if embeddings else ""
+    h = hashlib.sha256(f"{ARTIFACT_FORMAT}:{int(embeddings)}:{tag}".encode())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def build_artifact(csv_path: Optional[str] = None, directory: Optional[str] = None, *,
+                   db_path: Optional[str] = None,
+                   embed: Optional[Callable[[List[str]], Sequence]] = None,
+                   force: bool = False) -> str:
+    """
+    Compile *csv_path* (or the SQLite catalog at *db_path*) and publish it as
+    the current version in *directory*. Returns the artifact path; an
+    unchanged source reuses the current version unless *force* is set.
+    """
+    source = db_path or csv_path or CSV_PATH
+    directory = directory or CATALOG_ARTIFACT_DIR or DEFAULT_DIR
+    os.makedirs(directory, exist_ok=True)
+    digest = _source_digest(source, embed is not None)
+
+    existing = current_artifact(directory)
+    if existing and os.path.exists(existing) and not force:
+        if read_artifact(existing)[0].get("source_sha256") == digest:
+            logger.info("Catalog artifact up to date: %s", existing)
+            return existing
+
+    start = time.perf_counter()
+    rows = load_db_rows(db_path) if db_path else load_rows(source)
+    header, arrays = compile_rows(rows, embed)
+    version = f"{time.strftime('%Y%m%d-%H%M%S')}-{digest[:10]}"
+    header.update(version=version, built_at=time.time(),
+                  source=os.path.basename(source), source_sha256=digest)
+
+    filename = f"{_PREFIX}{version}{_SUFFIX}"
+    path = os.path.join(directory, filename)
+    tmp = os.path.join(directory, f".{filename}.{os.getpid()}")
+    write_artifact(tmp, header, arrays)
+    os.replace(tmp, path)
+    publish(directory, filename)
+    removed = prune(directory)
+    logger.info("Catalog artifact %s: %d products, %.1f MB, %.2fs (pruned %d)",
+                version, header["rows"], os.path.getsize(path) / 1e6,
+                time.perf_counter() - start, len(removed))
+    return path
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the catalog artifact")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build")
+    build.add_argument("--csv", default=CSV_PATH)
+    build.add_argument("--db", help="compile an existing SQLite catalog instead of the CSV")
+    build.add_argument("--dir", default=CATALOG_ARTIFACT_DIR or DEFAULT_DIR)
+    build.add_argument("--embeddings", action="store_true",
+                       help="also store product embeddings (EMBEDDING_BACKEND encoder)")
+    build.add_argument("--force", action="store_true")
+    info = sub.add_parser("info")
+    info.add_argument("--dir", default=CATALOG_ARTIFACT_DIR or DEFAULT_DIR)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from embeddings import load_embedder
+
+        print(build_artifact(args.csv, args.dir, db_path=args.db, force=args.force,
+                             embed=load_embedder() if args.embeddings else None))
+    else:
+        path = current_artifact(args.dir)
+        if not path:
+            raise SystemExit(f"No artifact published in {args.dir}")
+        t0 = time.perf_counter()
+        cat = Catalog.from_artifact(path)
+        print(f"{path}\n  version {cat.version}, {cat.size} products, "
+              f"mapped in {(time.perf_counter() - t0) * 1000:.1f} ms, "
+              f"embeddings: {'yes' if cat.embeddings is not None else 'no'}")
@@ -4,14 +4,24 @@ SQLite database for product storage and search.
 Uses named column access (sqlite3.Row) instead of magic indices.
 """
 
+import base64
+import json
 import sqlite3
 import os
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
-import pandas as pd
-
-from app_config import DB_PATH, CSV_PATH
+from app_config import DB_PATH, CSV_PATH, SQLITE_MMAP_SIZE
 from logger import db_logger
+from metrics import span
+from normalizer import fold, fold_padded, tokenize
+
+# Search worker processes open the catalog read-only (see worker_pool.py)
+_read_only = False
+_schema_checked = False
+
+# Pre-folded (accent-free, lowercase, space-padded tokens) copies of the
+# searchable text, written once at import so queries never re-fold rows.
+FOLD_COLUMNS = ("ten_fold", "model_fold", "thong_so_fold", "search_fold")
 
 
 # ---------------------------------------------------------------------------
@@ -23,48 +33,51 @@ def get_connection() -> sqlite3.Connection:
     if not os.path.exists(DB_PATH):
         db_logger.warning("Database not found. Creating from CSV...")
         init_database()
-    conn = sqlite3.connect(DB_PATH)
+    if _read_only:
+        conn = sqlite3.connect(f"file:{DB_PATH}?mode=ro", uri=True)
+    else:
+        conn = sqlite3.connect(DB_PATH)
+        if not _schema_checked:
+            ensure_schema(conn)
+    # Memory-mapped reads: every process maps the same page-cache pages
+    # instead of copying them into a private buffer.
+    conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
     conn.row_factory = sqlite3.Row  # Access columns by name
     return conn
 
 
+def use_read_only_connections(enabled: bool = True) -> None:
+    """Open all subsequent connections in read-only mode."""
+    global _read_only
+    _read_only = enabled
+
+
 # ---------------------------------------------------------------------------
 # Database initialisation
 # ---------------------------------------------------------------------------
 
-def init_database() -> None:
+def init_database(db_path: Optional[str] = None, csv_path: Optional[str] = None) -> None:
     """Create the SQLite database and import data from product.csv."""
-    db_logger.info("Initializing database from %s ...", CSV_PATH)
+    import pandas as pd  # Import-path only: keeps search-only processes light
+
+    db_path, csv_path = db_path or DB_PATH, csv_path or CSV_PATH
+    db_logger.info("Initializing database from %s ...", csv_path)
 
     # Read CSV — try semicolon first (Vietnamese Excel), fall back to comma
     try:
-        df = pd.read_csv(CSV_PATH, encoding="utf-8-sig", sep=";",
+        df = pd.read_csv(csv_path, encoding="utf-8-sig", sep=";",
                          on_bad_lines="skip", engine="python")
     except Exception:
-        df = pd.read_csv(CSV_PATH, encoding="utf-8-sig",
+        df = pd.read_csv(csv_path, encoding="utf-8-sig",
                          on_bad_lines="skip", engine="python")
 
     df.columns = df.columns.str.strip()
     db_logger.info("CSV loaded: %d rows, columns=%s", len(df), list(df.columns))
 
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
 
     # Rebuild table
-    conn.execute("DROP TABLE IF EXISTS products")
-    conn.execute("""
-        CREATE TABLE products (
-            id              INTEGER PRIMARY KEY AUTOINCREMENT,
-            stt             INTEGER,
-            nhom_hang       TEXT,
-            nhom_hang_loai  TEXT,
-            ten_san_pham    TEXT,
-            model           TEXT,
-            thong_so_chinh  TEXT,
-            gia             INTEGER DEFAULT 0,
-            mo_ta           TEXT,
-            created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+    create_products_table(conn)
 
     success, errors = 0, 0
     for idx, row in df.iterrows():
@@ -98,10 +111,8 @@ def init_database() -> None:
 
     conn.commit()
 
-    # Indexes for fast lookup
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_model ON products(model)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_ten ON products(ten_san_pham)")
-    conn.commit()
+    ensure_schema(conn)
+    create_products_indexes(conn)
 
     count = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
     db_logger.info("Database ready — %d products (success=%d, errors=%d)",
@@ -109,8 +120,95 @@ def init_database() -> None:
     conn.close()
 
 
+def create_products_table(conn: sqlite3.Connection) -> None:
+    """(Re)create the empty ``products`` table on *conn*."""
+    conn.execute("DROP TABLE IF EXISTS products")
+    conn.execute("""
+        CREATE TABLE products (
+            id              INTEGER PRIMARY KEY AUTOINCREMENT,
+            stt             INTEGER,
+            nhom_hang       TEXT,
+            nhom_hang_loai  TEXT,
+            ten_san_pham    TEXT,
+            model           TEXT,
+            thong_so_chinh  TEXT,
+            gia             INTEGER DEFAULT 0,
+            mo_ta           TEXT,
+            ton_kho         INTEGER,
+            ten_fold        TEXT,
+            model_fold      TEXT,
+            thong_so_fold   TEXT,
+            search_fold     TEXT,
+            created_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def create_products_indexes(conn: sqlite3.Connection) -> None:
+    """Create lookup indexes once the table has been populated."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_model ON products(model)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_ten ON products(ten_san_pham)")
+    conn.commit()
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """
+    Add any missing fold / stock columns (catalogs built before they
+    existed) and fill fold columns for rows that have none yet. Cheap no-op
+    on an up-to-date DB.
+    """
+    global _schema_checked
+    existing = {r[1] for r in conn.execute("PRAGMA table_info(products)")}
+    if not existing:
+        return  # table not created yet
+    for col in FOLD_COLUMNS:
+        if col not in existing:
+            conn.execute(f"ALTER TABLE products ADD COLUMN {col} TEXT")
+    if "ton_kho" not in existing:
+        conn.execute("ALTER TABLE products ADD COLUMN ton_kho INTEGER")  # NULL = unknown
+
+    pending = conn.execute("""
+        SELECT id, ten_san_pham, model, thong_so_chinh
+        FROM products WHERE search_fold IS NULL
+    """).fetchall()
+    if pending:
+        conn.executemany(
+            "UPDATE products SET ten_fold = ?, model_fold = ?, thong_so_fold = ?, "
+            "search_fold = ? WHERE id = ?",
+            [(*fold_columns(ten, model, specs), row_id)
+             for row_id, ten, model, specs in pending],
+        )
+        db_logger.info("Folded search text for %d products", len(pending))
+    conn.commit()
+    _schema_checked = True
+
+
+def apply_product_updates(changes: List[Tuple[int, Optional[int], Optional[int]]]) -> int:
+    """
+    Set price and/or stock for ``(id, gia, ton_kho)`` tuples in one
+    transaction; None leaves that column unchanged. Returns rows updated.
+    """
+    if not changes:
+        return 0
+    with span("sqlite"), get_connection() as conn:
+        cur = conn.executemany(
+            "UPDATE products SET gia = COALESCE(?, gia), ton_kho = COALESCE(?, ton_kho) "
+            "WHERE id = ?",
+            [(gia, stock, row_id) for row_id, gia, stock in changes],
+        )
+        return cur.rowcount
+
+
+def fold_columns(ten, model, specs) -> Tuple[str, str, str, str]:
+    """Values for FOLD_COLUMNS from a product's name, model and specs."""
+    parts = [fold_padded(v) if isinstance(v, str) else " " for v in (ten, model, specs)]
+    return (*parts, "".join(parts))
+
+
 def _parse_price(raw) -> int:
     """Robustly parse a price string/number into an integer."""
+    import pandas as pd
+
     if pd.isna(raw):
         return 0
     try:
@@ -127,7 +225,26 @@ def _parse_price(raw) -> int:
 # ---------------------------------------------------------------------------
 
 def search_by_model(model_code: str) -> Dict:
-    """Find a product by exact model code (LIKE match)."""
+    """
+    Find a product by model code: an exact (folded) code comes from the
+    catalog's model index, anything else falls back to a LIKE match.
+    """
+    from catalog import get_catalog
+
+    catalog = get_catalog()
+    i = catalog.find_model(model_code)
+    if i is not None:
+        return {
+            "found": True,
+            "id": int(catalog.ids[i]),
+            "ten_san_pham": catalog.ten[i],
+            "model": catalog.model[i],
+            "gia": int(catalog.gia[i]),
+            "nhom_hang": catalog.nhom_hang_loai[i],
+            "thong_so": catalog.specs[i],
+            "ton_kho": None if catalog.stock[i] < 0 else int(catalog.stock[i]),
+        }
+
     with get_connection() as conn:
         row = conn.execute(
             "SELECT * FROM products WHERE model LIKE ? LIMIT 1",
@@ -143,6 +260,7 @@ def search_by_model(model_code: str) -> Dict:
             "gia": row["gia"],
             "nhom_hang": row["nhom_hang_loai"],
             "thong_so": row["thong_so_chinh"],
+            "ton_kho": row["ton_kho"],
         }
     return {"found": False}
 
@@ -152,19 +270,16 @@ def search_by_keywords(query: str, max_results: int = 3) -> Dict:
     if not query or not query.strip():
         return {"found": False}
 
-    keywords = query.lower().split()
+    keywords = tokenize(query)
     if not keywords:
         return {"found": False}
 
-    with get_connection() as conn:
+    with span("sqlite"), get_connection() as conn:
         rows = conn.execute("SELECT * FROM products").fetchall()
 
     scored: List = []
     for row in rows:
-        ten = (row["ten_san_pham"] or "").lower()
-        model = (row["model"] or "").lower()
-        specs = (row["thong_so_chinh"] or "").lower()
-
+        ten, model, specs = row["ten_fold"], row["model_fold"], row["thong_so_fold"]
         score = sum(
             (3 if kw in ten else 0) +
             (2 if kw in model else 0) +
@@ -185,7 +300,8 @@ def search_by_keywords(query: str, max_results: int = 3) -> Dict:
     return {"found": False}
 
 
-def search_with_intent(query: str, intent: Dict, max_results: int = 3) -> Dict:
+def search_with_intent(query: str, intent: Dict, max_results: int = 3,
+                       candidates: int = 0, cursor: Optional[str] = None) -> Dict:
     """
     Smart search using parsed intent (category, brands, price ordering).
 
@@ -193,10 +309,151 @@ def search_with_intent(query: str, intent: Dict, max_results: int = 3) -> Dict:
         query: Original user query.
         intent: Output of query_parser.parse_query().
         max_results: Maximum products to return.
+        candidates: If > 0, also return the category's rows (at most this
+            many) as ``"candidates"`` so follow-ups can be ranked in memory
+            with rank_candidates().
+        cursor: ``"next_cursor"`` of the previous page. Listings (plain
+            search intents with a category or brand, cheapest first) return
+            one while more rows remain; it is only valid for the same
+            category and brands.
+
+    Raises ValueError for a malformed or mismatched cursor.
     """
-    with get_connection() as conn:
-        rows = list(conn.execute("SELECT * FROM products").fetchall())
+    from catalog import get_catalog  # array-backed; see catalog.py
+
+    if not is_listing(intent):
+        if cursor:
+            raise ValueError("cursor pagination only applies to category/brand listings")
+        return get_catalog().rank(intent, max_results, candidates)
+    after = decode_cursor(cursor, intent) if cursor else None
+    result = get_catalog().rank(intent, max_results, candidates, after=after, paged=True)
+    last = result.pop("next")
+    result["next_cursor"] = encode_cursor(intent, last) if last else None
+    return result
+
+
+def search_price_range(intent: Dict, max_results: int = 3, below: Optional[int] = None,
+                       above: Optional[int] = None) -> Dict:
+    """
+    The intent's category/brand listing limited to prices strictly below
+    *below* and/or above *above*, nearest that price first. Session
+    follow-ups use it when the category was too large to keep as candidates.
+    """
+    from catalog import get_catalog
+
+    return get_catalog().price_range(intent, max_results, below, above)
+
+
+def is_listing(intent: Dict) -> bool:
+    """
+    Plain search intents narrowed by category or brand list that page by
+    page; the others pick rows, and an unfiltered search isn't a listing.
+    """
+    return (intent["intent"] not in ("highest_price", "lowest_price", "compare")
+            and bool(intent.get("category") or intent.get("brands")))
+
+
+def _cursor_filter(intent: Dict) -> List:
+    return [fold(intent.get("category") or ""),
+            sorted({fold(b) for b in intent.get("brands") or ()})]
+
+
+def encode_cursor(intent: Dict, after: Tuple[int, int]) -> str:
+    """Opaque keyset cursor: the listing's filter and its last (price, id)."""
+    raw = json.dumps([*_cursor_filter(intent), *after], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
 
+
+def decode_cursor(cursor: str, intent: Dict) -> Tuple[int, int]:
+    """(price, id) keyset of *cursor*; ValueError if bad or for another listing."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        category, brands, gia, row_id = json.loads(raw.decode("utf-8"))
+        after = (int(gia), int(row_id))
+    except (ValueError, TypeError, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+    if [category, brands] != _cursor_filter(intent):
+        raise ValueError("cursor belongs to a different listing")
+    return after
+
+
+def facet_counts(intent: Dict, price_band: Optional[str] = None,
+                 spec: Optional[str] = None) -> Dict:
+    """
+    Product count for the intent's filters (narrowed to *price_band* and
+    key *spec*) plus category / brand / price-band / key-spec facet counts,
+    from the catalog's bitmaps (see facets.py).
+
+    Returns {"total": n, "facets": {"category": {...}, "brand": {...},
+    "price": {...}, "spec": {...}}}. Raises ValueError for an unknown price
+    band or key spec.
+    """
+    from facets import get_index
+
+    with span("facets"):
+        return get_index().counts(intent, price_band, spec)
+
+
+def facet_search(intent: Dict, price_band: Optional[str] = None,
+                 spec: Optional[str] = None, max_results: int = 3) -> Dict:
+    """
+    Products under the same filters as facet_counts — one per model, in
+    catalog order — straight from the bitmaps. Same result shape as
+    search_with_intent; raises ValueError like facet_counts.
+    """
+    from facets import get_index
+
+    with span("facets"):
+        index = get_index()
+        rows = index.select(intent, price_band, spec)[:max_results]
+        products = [index.catalog.product(i) for i in rows]
+    if products:
+        return {"found": True, "count": len(products), "products": products}
+    return {"found": False}
+
+
+def search_with_intent_many(requests: List[Tuple[str, Dict]],
+                            max_results: int = 3) -> List[Dict]:
+    """
+    Batch form of search_with_intent: one catalog snapshot for all
+    (query, intent) pairs, and one ranking pass per distinct intent.
+    Results are returned in input order.
+    """
+    from catalog import get_catalog
+
+    if not requests:
+        return []
+    catalog = get_catalog()
+
+    by_intent: Dict[Tuple, Dict] = {}
+    results = []
+    for _query, intent in requests:
+        key = (intent["intent"], intent.get("category"),
+               tuple(intent.get("brands") or ()))
+        if key not in by_intent:
+            by_intent[key] = catalog.rank(intent, max_results)
+        # Callers tag products in place — hand each one its own copies
+        hit = by_intent[key]
+        results.append({**hit, "products": [dict(p) for p in hit["products"]]}
+                       if hit.get("found") else dict(hit))
+    return results
+
+
+def rank_candidates(candidates: List[Dict], intent: Dict, max_results: int = 3,
+                    keep_order: bool = False) -> Dict:
+    """
+    Rank a ``"candidates"`` list from search_with_intent without a DB read.
+    With *keep_order*, a listing keeps the candidates' order instead of
+    cheapest first (e.g. nearest price first for "rẻ hơn").
+    """
+    return _rank_rows(candidates, intent, max_results, keep_order)
+
+
+def _rank_rows(rows: List, intent: Dict, max_results: int, keep_order: bool = False) -> Dict:
+    """
+    Filter, deduplicate and order row dicts for a parsed intent. Reference
+    implementation of catalog.Catalog.rank, used for small in-memory lists.
+    """
     # Step 1 — filter by category
     if intent.get("category"):
         rows = _filter_by_category(rows, intent["category"])
@@ -218,6 +475,8 @@ def search_with_intent(query: str, intent: Dict, max_results: int = 3) -> Dict:
     elif intent["intent"] == "compare" and rows:
         rows = sorted(rows, key=lambda r: r["gia"] or 0, reverse=True)
         max_results = min(6, len(rows))
+    elif not keep_order:
+        rows = sorted(rows, key=lambda r: r["gia"] or 0)  # listings: cheapest first
 
     # Step 5 — format output
     if rows:
@@ -238,33 +497,22 @@ def search_with_intent(query: str, intent: Dict, max_results: int = 3) -> Dict:
 # Private helpers
 # ---------------------------------------------------------------------------
 
-_TV_KEYWORDS = ("tv", "tivi", "ti vi", "tele", "television")
+TV_KEYWORDS = ("tv", "tivi", "ti vi", "tele", "television")
 
 
 def _filter_by_category(rows: List, category: str) -> List:
-    cat = category.lower()
-    filtered = []
-    for r in rows:
-        ten = (r["ten_san_pham"] or "").lower()
-        if cat == "tv":
-            if any(kw in ten for kw in _TV_KEYWORDS):
-                filtered.append(r)
-        elif cat in ten:
-            filtered.append(r)
-    return filtered
+    # Whole-token phrase match on the folded name: " noi " matches
+    # "Nồi cơm điện" but never a longer word that merely contains "noi".
+    if category.lower() == "tv":
+        phrases = tuple(fold_padded(kw) for kw in TV_KEYWORDS)
+    else:
+        phrases = (fold_padded(category),)
+    return [r for r in rows if any(p in r["ten_fold"] for p in phrases)]
 
 
 def _filter_by_brands(rows: List, brands: List[str]) -> List:
-    result = []
-    for r in rows:
-        text = " ".join([
-            (r["ten_san_pham"] or ""),
-            (r["model"] or ""),
-            (r["thong_so_chinh"] or ""),
-        ]).lower()
-        if any(b.lower() in text for b in brands):
-            result.append(r)
-    return result
+    folded = [fold(b) for b in brands]
+    return [r for r in rows if any(b in r["search_fold"] for b in folded)]
 
 
 def _collect_comparison_brands(rows: List, brands: List[str]) -> List:
@@ -272,15 +520,8 @@ def _collect_comparison_brands(rows: List, brands: List[str]) -> List:
     seen_models: set = set()
     result = []
     for brand in brands:
-        brand_lower = brand.lower()
-        brand_rows = [
-            r for r in rows
-            if brand_lower in " ".join([
-                (r["ten_san_pham"] or ""),
-                (r["model"] or ""),
-                (r["thong_so_chinh"] or ""),
-            ]).lower()
-        ]
+        brand_folded = fold(brand)
+        brand_rows = [r for r in rows if brand_folded in r["search_fold"]]
         brand_rows.sort(key=lambda r: r["gia"] or 0, reverse=True)
         for r in brand_rows[:2]:
             model = r["model"] or ""
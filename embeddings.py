@@ -0,0 +1,315 @@
+"""
+VIVOHOME AI - Embedding Backends
+Sentence encoders for the vector store, selected by EMBEDDING_BACKEND:
+
+    torch  sentence-transformers / PyTorch (default)
+    onnx   the same model exported to ONNX Runtime, optionally with dynamic
+           int8-quantized weights — no torch at serving time, faster on CPU
+
+The ONNX model is exported once (needs torch + sentence-transformers) and
+then served with only onnxruntime + tokenizers:
+
+    python embeddings.py export                  # → onnx_model/ (fp32 + int8)
+    python embeddings.py compare --output emb.json
+"""
+
+import json
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app_config import (EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_ONNX_DIR,
+                        EMBEDDING_QUANTIZE, EMBEDDING_THREADS)
+from logger import get_logger
+
+logger = get_logger("embeddings")
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+MANIFEST_FILE = "manifest.json"
+_BATCH = 64
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+def _mean_pool(hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Mean of token vectors, padding excluded (the model's pooling layer)."""
+    weights = mask[..., None].astype(np.float32)
+    return (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+
+
+class OnnxEmbedder:
+    """
+    ONNX Runtime encoder producing the same vectors as sentence-transformers
+    (transformer → mean pooling). Callable like a Chroma embedding function.
+    """
+
+    def __init__(self, directory: str = EMBEDDING_ONNX_DIR,
+                 quantized: bool = EMBEDDING_QUANTIZE, threads: int = EMBEDDING_THREADS):
+        path = os.path.join(directory, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found — run: python embeddings.py export")
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest["model"] != EMBEDDING_MODEL:
+            logger.warning("ONNX model %s differs from EMBEDDING_MODEL %s",
+                           manifest["model"], EMBEDDING_MODEL)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self._session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self._session.get_inputs()}
+
+        self._tokenizer = Tokenizer.from_file(os.path.join(directory, "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=manifest["max_length"])
+        self._tokenizer.no_padding()
+        self._pad_id = manifest["pad_id"]
+        self.path = path
+
+    def __call__(self, input: Sequence[str]) -> List[np.ndarray]:  # noqa: A002 (Chroma API)
+        tokens = [e.ids for e in self._tokenizer.encode_batch(list(input))]
+        # Batch similar lengths together (as sentence-transformers does) to pad less
+        order = sorted(range(len(tokens)), key=lambda i: len(tokens[i]))
+        out: List[np.ndarray] = [None] * len(tokens)
+        for start in range(0, len(order), _BATCH):
+            chunk = order[start:start + _BATCH]
+            ids = np.full((len(chunk), max(len(tokens[i]) for i in chunk)), self._pad_id,
+                          dtype=np.int64)
+            mask = np.zeros_like(ids)
+            for row, i in enumerate(chunk):
+                ids[row, :len(tokens[i])] = tokens[i]
+                mask[row, :len(tokens[i])] = 1
+            feed = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self._inputs:
+                feed["token_type_ids"] = np.zeros_like(ids)
+            pooled = _mean_pool(self._session.run(None, feed)[0], mask)
+            for row, i in enumerate(chunk):
+                out[i] = pooled[row]
+        return out
+
+
+class TorchEmbedder:
+    """sentence-transformers encoder, callable like a Chroma embedding function."""
+
+    def __init__(self, threads: int = EMBEDDING_THREADS):
+        from sentence_transformers import SentenceTransformer
+
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+        self._model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+
+    def __call__(self, input: Sequence[str]) -> List[np.ndarray]:  # noqa: A002 (Chroma API)
+        return list(self._model.encode(list(input), batch_size=_BATCH, convert_to_numpy=True,
+                                       show_progress_bar=False))
+
+
+def load_embedder(backend: Optional[str] = None, quantized: bool = EMBEDDING_QUANTIZE):
+    """Encoder for *backend* (default EMBEDDING_BACKEND): texts → list of vectors."""
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        return OnnxEmbedder(quantized=quantized)
+    if backend == "torch":
+        return TorchEmbedder()
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r} (torch | onnx)")
+
+
+# ---------------------------------------------------------------------------
+# Export (offline; needs torch)
+# ---------------------------------------------------------------------------
+
+def export_onnx(directory: str = EMBEDDING_ONNX_DIR, quantize: bool = True) -> Dict[str, str]:
+    """
+    Export EMBEDDING_MODEL's transformer to ONNX (dynamic batch/sequence
+    axes) plus its fast tokenizer, and optionally an int8 copy with
+    dynamically quantized weights. Returns the written model paths.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    transformer, pooling = st[0], st[1].get_config_dict()
+    modes = {k for k, v in pooling.items() if k.startswith("pooling_mode_") and v}
+    if len(st) > 2 or (pooling.get("pooling_mode", "mean") != "mean"
+                       or modes - {"pooling_mode_mean_tokens"}):
+        raise ValueError(f"{EMBEDDING_MODEL}: only transformer + mean pooling is supported")
+    tokenizer = transformer.tokenizer
+    os.makedirs(directory, exist_ok=True)
+    tokenizer.save_pretrained(directory)  # writes tokenizer.json
+
+    class _Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+    sample = tokenizer(["xin chào", "tủ lạnh Samsung"], padding=True, return_tensors="pt")
+    paths = {"fp32": os.path.join(directory, FP32_FILE)}
+    axes = {0: "batch", 1: "tokens"}
+    torch.onnx.export(
+        _Encoder(transformer.auto_model).eval(),
+        (sample["input_ids"], sample["attention_mask"]),
+        paths["fp32"],
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={"input_ids": axes, "attention_mask": axes, "last_hidden_state": axes},
+        opset_version=17,
+        dynamo=False,
+    )
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        paths["int8"] = os.path.join(directory, INT8_FILE)
+        quantize_dynamic(paths["fp32"], paths["int8"], weight_type=QuantType.QInt8)
+
+    with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model": EMBEDDING_MODEL, "max_length": st.max_seq_length,
+                   "pad_id": tokenizer.pad_token_id, "pad_token": tokenizer.pad_token,
+                   "exported_at": time.time()}, f, indent=2)
+    for name, path in paths.items():
+        logger.info("Exported %s model: %s (%.1f MB)", name, path, os.path.getsize(path) / 1e6)
+    return paths
+
+
+# ---------------------------------------------------------------------------
+# Parity and speed comparison
+# ---------------------------------------------------------------------------
+
+def parity(reference_docs: np.ndarray, reference_queries: np.ndarray,
+           docs: np.ndarray, queries: np.ndarray, k: int = 5) -> Dict:
+    """
+    How closely a backend reproduces the reference vectors: per-document
+    cosine similarity, and the overlap of each query's top-*k* documents
+    (squared L2, as the vector store ranks) with the reference top-*k*.
+    """
+    def unit(v):
+        return v / np.clip(np.linalg.norm(v, axis=1, keepdims=True), 1e-12, None)
+
+    cosine = np.einsum("ij,ij->i", unit(reference_docs), unit(docs))
+
+    def top(d, q):
+        dist = (q * q).sum(1)[:, None] + (d * d).sum(1)[None, :] - 2 * q @ d.T
+        return np.argsort(dist, axis=1, kind="stable")[:, :k]
+
+    expected, got = top(reference_docs, reference_queries), top(docs, queries)
+    overlap = [len(set(a) & set(b)) / len(a) for a, b in zip(expected, got)]
+    return {"cosine_min": round(float(cosine.min()), 5),
+            "cosine_mean": round(float(cosine.mean()), 5),
+            f"top{k}_overlap": round(float(np.mean(overlap)), 4)}
+
+
+def _profile(backend: str, quantized: bool, docs: List[str], queries: List[str],
+             repeat: int) -> Dict:
+    """Load one backend and time it; runs in a fresh process for clean RSS."""
+    import resource
+
+    from metrics import percentile
+
+    def rss_mb() -> float:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+    base = rss_mb()
+    start = time.perf_counter()
+    embed = load_embedder(backend, quantized)
+    load_s = time.perf_counter() - start
+    doc_vectors = np.asarray(embed(docs), dtype=np.float32)  # also warms up
+
+    batch_s = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        embed(docs)
+        batch_s.append(time.perf_counter() - start)
+    latencies = []
+    for q in queries * repeat:
+        start = time.perf_counter()
+        embed([q])
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "load_s": round(load_s, 3),
+        "docs_per_s": round(len(docs) / min(batch_s), 1),
+        "query_p50_ms": round(percentile(latencies, 50), 2),
+        "query_p95_ms": round(percentile(latencies, 95), 2),
+        "rss_mb": round(rss_mb() - base, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "_docs": doc_vectors,
+        "_queries": np.asarray(embed(queries), dtype=np.float32),
+    }
+
+
+def compare(docs: List[str], queries: List[str], *, repeat: int = 3, k: int = 5,
+            backends: Sequence[tuple] = (("torch", False), ("onnx", False), ("onnx", True))
+            ) -> Dict[str, Dict]:
+    """
+    Speed, memory and parity of each (backend, quantized) against the first
+    (the PyTorch reference). Each backend is measured in its own process.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    report: Dict[str, Dict] = {}
+    reference = None
+    for backend, quantized in backends:
+        name = f"{backend}-int8" if quantized else backend
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            result = pool.submit(_profile, backend, quantized, docs, queries, repeat).result()
+        vectors = (result.pop("_docs"), result.pop("_queries"))
+        if reference is None:
+            reference = vectors
+        result.update(parity(*reference, *vectors, k=k))
+        report[name] = result
+        logger.info("%s: %s", name, result)
+    return report
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    import sqlite3
+
+    parser = argparse.ArgumentParser(description="Embedding backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export")
+    export.add_argument("--dir", default=EMBEDDING_ONNX_DIR)
+    export.add_argument("--no-quantize", action="store_true")
+    cmp = sub.add_parser("compare")
+    cmp.add_argument("--repeat", type=int, default=3)
+    cmp.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(export_onnx(args.dir, quantize=not args.no_quantize))
+    else:
+        from app_config import DB_PATH
+        from benchmark import DEFAULT_QUERIES
+        from vector_store import product_document
+
+        conn = sqlite3.connect(DB_PATH)
+        conn.row_factory = sqlite3.Row
+        documents = [product_document(r) for r in conn.execute("SELECT * FROM products")]
+        conn.close()
+        results = compare(documents, list(DEFAULT_QUERIES), repeat=args.repeat)
+        print(f"{'backend':<12}{'load s':>8}{'docs/s':>9}{'p50 ms':>8}{'p95 ms':>8}"
+              f"{'RSS MB':>8}{'cos min':>9}{'top5':>7}")
+        for name, r in results.items():
+            print(f"{name:<12}{r['load_s']:>8}{r['docs_per_s']:>9}{r['query_p50_ms']:>8}"
+                  f"{r['query_p95_ms']:>8}{r['rss_mb']:>8}{r['cosine_min']:>9}"
+                  f"{r['top5_overlap']:>7}")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
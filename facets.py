@@ -0,0 +1,233 @@
+"""
+VIVOHOME AI - Faceted Counts
+Per-value bitmaps over the catalog for category, brand, price band and key
+spec (KEY_SPECS). A filter — any parse_query intent, optionally narrowed to
+one price band and one key spec — is a bitwise AND of packed 64-bit words,
+and every facet count is one more AND plus a popcount, so counts cost
+microseconds with no row scan. The same AND gives the matching rows.
+
+Counts are of distinct products: a model is counted once, at its first row
+(the row Catalog.dedupe keeps). A facet's own selection is left out of its
+counts, so under "tủ lạnh Samsung" the brand facet still shows how many LG
+fridges there are, and the category facet how many Samsung TVs.
+
+    python facets.py "tủ lạnh samsung" [--price 5000000-10000000] [--spec Inverter]
+"""
+
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app_config import FACET_PRICE_BANDS
+from logger import get_logger
+from query_parser import BRAND_PATTERNS, CATEGORY_PATTERNS
+
+logger = get_logger("facets")
+
+# Key-spec facet: label → phrases matched as whole tokens (accent-free) in
+# the product name, model and "Thông số chính"
+KEY_SPECS: Dict[str, Tuple[str, ...]] = {
+    "Inverter": ("inverter",),
+    "Smart TV": ("smart tv", "google tv", "android tv", "tizen", "webos"),
+    "4K": ("4k", "uhd"),
+    "Wi-Fi": ("wifi", "wi fi"),
+    "Lọc RO": ("ro",),
+    "Cửa trên": ("cửa trên",),
+    "Cửa trước": ("cửa trước",),
+    "Tiết kiệm điện 5 sao": ("5 sao",),
+    "Điều khiển từ xa": ("điều khiển từ xa", "remote"),
+}
+
+
+# ---------------------------------------------------------------------------
+# Bitmaps
+# ---------------------------------------------------------------------------
+
+def pack(mask: np.ndarray) -> np.ndarray:
+    """Boolean row mask → bitmap of uint64 words (row i is bit i, zero-padded)."""
+    padded = np.zeros(-(-mask.size // 64) * 64, dtype=bool)
+    padded[:mask.size] = mask
+    return np.packbits(padded, bitorder="little").view(np.uint64)
+
+
+def unpack(bits: np.ndarray, size: int) -> np.ndarray:
+    """Row indices set in *bits*, ascending."""
+    return np.flatnonzero(np.unpackbits(bits.view(np.uint8), count=size, bitorder="little"))
+
+
+if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+    def popcount(bits: np.ndarray) -> int:
+        return int(np.bitwise_count(bits).sum())
+else:
+    _POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(bits: np.ndarray) -> int:
+        return int(_POPCOUNT8[bits.view(np.uint8)].sum())
+
+
+def band_labels(edges: Sequence[int]) -> List[str]:
+    """``(2000000, 5000000)`` → ["0-2000000", "2000000-5000000", "5000000+"]."""
+    bounds = [0, *edges]
+    return [f"{lo}-{hi}" for lo, hi in zip(bounds, edges)] + [f"{bounds[-1]}+"]
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class FacetIndex:
+    """
+    Bitmaps for one catalog snapshot: one per category and brand known to
+    query_parser, one per key spec and price band, and the first-row-per-model
+    set. Price bands follow live price updates (rebuilt on the next call).
+    """
+
+    def __init__(self, catalog, price_edges: Sequence[int] = FACET_PRICE_BANDS):
+        self.catalog = catalog
+        self.size = catalog.size
+        self.edges = tuple(sorted(price_edges))
+        self.labels = band_labels(self.edges)
+        rows = np.arange(self.size, dtype=np.int64)
+        self.unique = pack((catalog.model_key == rows) | (catalog.model_key < 0))
+        self.categories = {c: pack(catalog.category_mask(c)) for c in CATEGORY_PATTERNS}
+        self.brands = {b: pack(catalog.brand_mask(b)) for b in BRAND_PATTERNS}
+        self.specs = {label: pack(catalog.spec_mask(phrases))
+                      for label, phrases in KEY_SPECS.items()}
+        self._prices: Tuple[int, Dict[str, np.ndarray]] = (-1, {})
+        self._lock = threading.Lock()
+
+    def prices(self) -> Dict[str, np.ndarray]:
+        """Price-band bitmaps, rebuilt after a price update."""
+        generation, bands = self._prices
+        if generation != self.catalog.prices_generation:
+            with self._lock:
+                generation, bands = self._prices
+                current = self.catalog.prices_generation
+                if generation != current:
+                    band = np.searchsorted(np.array(self.edges, dtype=np.int64),
+                                           self.catalog.gia, side="right")
+                    bands = {label: pack(band == i) for i, label in enumerate(self.labels)}
+                    self._prices = (current, bands)
+        return bands
+
+    # -- filters -------------------------------------------------------
+
+    def _category(self, category: Optional[str]) -> Optional[np.ndarray]:
+        if not category:
+            return None
+        bits = self.categories.get(category)
+        return bits if bits is not None else pack(self.catalog.category_mask(category))
+
+    def _brands(self, brands: Optional[Sequence[str]]) -> Optional[np.ndarray]:
+        if not brands:
+            return None
+        bits = np.zeros_like(self.unique)
+        for b in brands:
+            known = self.brands.get(b)
+            bits |= known if known is not None else pack(self.catalog.brand_mask(b))
+        return bits
+
+    def _price(self, band: Optional[str]) -> Optional[np.ndarray]:
+        if not band:
+            return None
+        bits = self.prices().get(band)
+        if bits is None:
+            raise ValueError(f"unknown price band {band!r} (one of {', '.join(self.labels)})")
+        return bits
+
+    def _spec(self, spec: Optional[str]) -> Optional[np.ndarray]:
+        if not spec:
+            return None
+        bits = self.specs.get(spec)
+        if bits is None:
+            raise ValueError(f"unknown key spec {spec!r} (one of {', '.join(self.specs)})")
+        return bits
+
+    def _filters(self, intent: Dict, price_band: Optional[str],
+                 spec: Optional[str]) -> Dict[str, np.ndarray]:
+        parts = {"category": self._category(intent.get("category")),
+                 "brand": self._brands(intent.get("brands")),
+                 "price": self._price(price_band),
+                 "spec": self._spec(spec)}
+        return {k: v for k, v in parts.items() if v is not None}
+
+    def _and(self, filters: Dict[str, np.ndarray], skip: str = "") -> np.ndarray:
+        bits = self.unique
+        for name, part in filters.items():
+            if name != skip:
+                bits = bits & part
+        return bits
+
+    # -- queries -------------------------------------------------------
+
+    def select(self, intent: Dict, price_band: Optional[str] = None,
+               spec: Optional[str] = None) -> np.ndarray:
+        """Rows matching the filters, one per model, in row order."""
+        return unpack(self._and(self._filters(intent, price_band, spec)), self.size)
+
+    def counts(self, intent: Dict, price_band: Optional[str] = None,
+               spec: Optional[str] = None) -> Dict:
+        """
+        Matching products and per-value facet counts. Categories, brands and
+        key specs with no matches are left out; every price band is listed,
+        in order. Raises ValueError for an unknown price band or key spec.
+        """
+        filters = self._filters(intent, price_band, spec)
+        values = {"category": self.categories, "brand": self.brands,
+                  "price": self.prices(), "spec": self.specs}
+        facets = {}
+        for name, bitmaps in values.items():
+            base = self._and(filters, skip=name)
+            counted = {value: popcount(base & bits) for value, bits in bitmaps.items()}
+            facets[name] = (counted if name == "price"
+                            else {value: n for value, n in counted.items() if n})
+        return {"total": popcount(self._and(filters)), "facets": facets}
+
+
+_index: Optional[FacetIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> FacetIndex:
+    """Facet bitmaps for the current catalog snapshot (rebuilt after a reload)."""
+    global _index
+    from catalog import get_catalog
+
+    catalog = get_catalog()
+    if _index is None or _index.catalog is not catalog:
+        with _index_lock:
+            if _index is None or _index.catalog is not catalog:
+                _index = FacetIndex(catalog)
+                logger.info("Facet index: %d categories, %d brands, %d price bands",
+                            len(_index.categories), len(_index.brands), len(_index.labels))
+    return _index
+
+
+# ---------------------------------------------------------------------------
+# CLI test
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import time
+
+    from query_parser import parse_query
+
+    parser = argparse.ArgumentParser(description="Facet counts for a query")
+    parser.add_argument("query", nargs="?", default="tủ lạnh")
+    parser.add_argument("--price", default=None, help="price band label, e.g. 0-2000000")
+    parser.add_argument("--spec", default=None, help=f"key spec, one of: {', '.join(KEY_SPECS)}")
+    args = parser.parse_args()
+
+    index = get_index()
+    intent = parse_query(args.query)
+    start = time.perf_counter()
+    result = index.counts(intent, args.price, args.spec)
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    rows = index.select(intent, args.price, args.spec)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"{index.size} rows, counts in {elapsed_us:.0f} µs; first matches:")
+    for i in rows[:5]:
+        print(f"  {index.catalog.product(i)}")
@@ -0,0 +1,243 @@
+"""
+VIVOHOME AI - Response Formatter
+Renders search results for the chat UI from precompiled templates. Each
+product's markdown fragment is rendered once per catalog version and
+reused across answers; callers that render on the client can ask for the
+structured view (to_view) instead.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from app_config import RENDER_CACHE_SIZE
+from catalog import catalog_version
+from metrics import CACHE_HITS, CACHE_MISSES, span
+
+# ---------------------------------------------------------------------------
+# Templates
+# ---------------------------------------------------------------------------
+
+# Product fragments (cached); numbering, icons and similarity go around them
+_CARD = "📦 **{ten}**\n- Model: {model}\n- Giá: **{gia:,} VND**\n".format
+_LINE = "**{ten}** ({model})\n   - Giá: **{gia:,} VND**".format
+
+_SINGLE = "{title}\n\n{card}- Độ phù hợp: {sim:.0f}%\n\n📍 Nguồn: {sources}".format
+_SINGLE_TITLES = {
+    "highest_price": "💎 **Sản phẩm {category} giá cao nhất:**",
+    "lowest_price": "💰 **Sản phẩm {category} giá rẻ nhất:**",
+}
+_COMPARE_HEADER = "📊 **So sánh {category}:**\n".format
+_LIST_HEADER = "📦 **Sản phẩm tìm được:**\n"
+_SIMILARITY = "\n   - Độ phù hợp: {:.0f}%".format
+_FOOTER = "\n📍 Nguồn: {}".format
+
+_WEB_HEADER = "🌐 **Không tìm thấy trong kho VIVOHOME. Kết quả từ web:**\n"
+_WEB_ANSWER = "💡 **Tóm tắt:** {}\n".format
+_WEB_RESULT = "🔗 **{title}**\n   {snippet}...".format
+_WEB_LINK = "\n   [Xem thêm]({})".format
+
+NO_RESULTS = (
+    "❌ **Không tìm thấy sản phẩm**\n\n"
+    "Xin lỗi, tôi không tìm thấy sản phẩm phù hợp.\n"
+    "Bạn có thể thử:\n"
+    '- Mô tả sản phẩm khác đi\n'
+    '- Kiểm tra lại tên sản phẩm\n'
+    '- Hỏi cụ thể hơn (ví dụ: "TV Samsung 55 inch")'
+)
+
+NO_MORE = "✅ **Đã hiển thị hết sản phẩm phù hợp.**"
+_MORE_HINT = '\n➕ _Còn sản phẩm khác — gõ "xem thêm" hoặc bấm **Xem thêm**._'
+
+BUSY = (
+    "⏳ **Hệ thống đang bận**\n\n"
+    "Hiện có quá nhiều yêu cầu cùng lúc. Bạn vui lòng thử lại sau ít giây."
+)
+
+_MAX_LISTED = 5
+
+
+# ---------------------------------------------------------------------------
+# Fragment cache
+# ---------------------------------------------------------------------------
+
+_fragments: "OrderedDict[tuple, str]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _fragment(kind: str, p: Dict) -> str:
+    """
+    Rendered product fragment, keyed on the catalog version and the product
+    identity (model + name + price), so a reload or a price change re-renders.
+    """
+    model = p.get("model", "N/A")
+    key = (kind, catalog_version(), model, p["ten"], p["gia"])
+    with _lock:
+        text = _fragments.get(key)
+        if text is not None:
+            _fragments.move_to_end(key)
+    if text is not None:
+        CACHE_HITS.inc(cache="render")
+        return text
+
+    CACHE_MISSES.inc(cache="render")
+    template = _CARD if kind == "card" else _LINE
+    text = template(ten=p["ten"], model=model, gia=p["gia"])
+    if RENDER_CACHE_SIZE > 0:
+        with _lock:
+            _fragments[key] = text
+            while len(_fragments) > RENDER_CACHE_SIZE:
+                _fragments.popitem(last=False)
+    return text
+
+
+def clear_cache() -> None:
+    with _lock:
+        _fragments.clear()
+
+
+def cache_size() -> int:
+    return len(_fragments)
+
+
+# ---------------------------------------------------------------------------
+# Markdown rendering
+# ---------------------------------------------------------------------------
+
+def render(search_result: Dict) -> str:
+    """Markdown answer for a RAGEngine.search() result."""
+    if search_result.get("busy"):
+        return BUSY
+    products = search_result.get("products", [])
+    if products:
+        text = render_products(search_result.get("intent", {}), products,
+                               search_result.get("sources", []))
+        return text + _MORE_HINT if search_result.get("next_cursor") else text
+    if search_result.get("exhausted"):
+        return NO_MORE
+    web_results = search_result.get("web_results")
+    if web_results:
+        return render_web(web_results)
+    return NO_RESULTS
+
+
+def render_products(intent: Dict, products: List[Dict], sources: List[str]) -> str:
+    intent_type = intent.get("intent", "search")
+    category = intent.get("category", "")
+    footer = _FOOTER(", ".join(sources))
+
+    if intent_type in _SINGLE_TITLES:
+        p = products[0]
+        return _SINGLE(title=_SINGLE_TITLES[intent_type].format(category=category),
+                       card=_fragment("card", p), sim=p.get("similarity", 0.9) * 100,
+                       sources=", ".join(sources))
+
+    if intent_type == "compare":
+        parts = [_COMPARE_HEADER(category=category or "sản phẩm")]
+        for i, p in enumerate(products[:_MAX_LISTED], 1):
+            line = f"{i}. {_fragment('line', p)}"
+            if p.get("similarity"):
+                line += _SIMILARITY(p["similarity"] * 100)
+            parts.append(line)
+        parts.append(footer)
+        return "\n".join(parts)
+
+    # Default search
+    parts = [_LIST_HEADER]
+    for p in products[:_MAX_LISTED]:
+        sim = p.get("similarity", 0)
+        icon = "🟢" if sim > 0.7 else "🟡" if sim > 0.5 else "🔴"
+        parts.append(f"{icon} {_fragment('line', p)}")
+    parts.append(footer)
+    return "\n".join(parts)
+
+
+def render_web(web_results: List[Dict]) -> str:
+    parts = [_WEB_HEADER]
+    for r in web_results:
+        if r["type"] == "answer":
+            parts.append(_WEB_ANSWER(r["content"]))
+        else:
+            text = _WEB_RESULT(title=r["title"], snippet=r["content"][:150])
+            if r.get("url"):
+                text += _WEB_LINK(r["url"])
+            parts.append(text + "\n")
+    return "\n".join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Structured view (client-side rendering)
+# ---------------------------------------------------------------------------
+
+def to_view(search_result: Dict) -> Dict:
+    """
+    The data the markdown answer is built from, for clients that render
+    themselves: ``{"kind": "products"|"web"|"empty"|"busy", "intent",
+    "category", "sources", "items"}``, plus ``degraded`` under load and
+    ``next_cursor`` when a listing has more pages. Product items carry
+    ten/model/gia/similarity and are trimmed to what the markdown answer
+    would show.
+    """
+    intent = search_result.get("intent") or {}
+    products = search_result.get("products") or []
+    web_results = search_result.get("web_results")
+    view: Dict = {
+        "intent": intent.get("intent", "search"),
+        "category": intent.get("category"),
+        "sources": search_result.get("sources", []),
+    }
+    if search_result.get("busy"):
+        view["kind"] = "busy"
+        view["items"] = []
+    elif products:
+        shown = 1 if view["intent"] in _SINGLE_TITLES else _MAX_LISTED
+        view["kind"] = "products"
+        view["items"] = [{
+            "ten": p["ten"],
+            "model": p.get("model", "N/A"),
+            "gia": p["gia"],
+            "similarity": p.get("similarity"),
+        } for p in products[:shown]]
+    elif web_results:
+        view["kind"] = "web"
+        view["items"] = [{k: r[k] for k in ("type", "title", "content", "url") if k in r}
+                         for r in web_results]
+    else:
+        view["kind"] = "empty"
+        view["items"] = []
+    if search_result.get("next_cursor"):
+        view["next_cursor"] = search_result["next_cursor"]
+    if search_result.get("degraded"):
+        view["degraded"] = search_result["degraded"]
+    if search_result.get("request_id"):
+        view["request_id"] = search_result["request_id"]
+    return view
+
+
+def format_result(search_result: Dict, structured: bool = False):
+    """Markdown string, or the structured view when *structured* is set."""
+    with span("format"):
+        return to_view(search_result) if structured else render(search_result)
+
+
+# ---------------------------------------------------------------------------
+# CLI test
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import json
+    import time
+
+    sample = {
+        "intent": {"intent": "search", "category": "tv"},
+        "sources": ["database"],
+        "products": [{"ten": f"TV Samsung {i}", "model": f"QA{i}", "gia": 10_000_000 + i,
+                      "similarity": 0.9} for i in range(5)],
+    }
+    print(render(sample))
+    print(json.dumps(to_view(sample), ensure_ascii=False, indent=2))
+    start = time.perf_counter()
+    for _ in range(10_000):
+        render(sample)
+    print(f"\n10k renders: {(time.perf_counter() - start) * 1000:.1f} ms, "
+          f"{cache_size()} fragments cached")
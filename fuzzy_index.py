@@ -0,0 +1,243 @@
+"""
+VIVOHOME AI - Fuzzy Product Index
+Typo-tolerant lookup ("samsumg", "maygiat", "tu lanh") over product names
+and models. A character-trigram inverted index prefilters candidate terms;
+candidates are rescored with an edit-based similarity. Runs between the
+database and semantic stages so near-miss spellings never reach the
+embedding model or the web.
+"""
+
+import threading
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app_config import FUZZY_MIN_SCORE
+from catalog import Catalog, get_catalog
+from logger import get_logger
+from normalizer import tokenize
+
+logger = get_logger("fuzzy")
+
+_MAX_CANDIDATES = 20  # terms rescored per query token
+_MIN_FUZZY_LEN = 4    # shorter tokens ("gia", "lg") must match exactly
+
+
+def _trigrams(term: str) -> set:
+    padded = f"${term}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class FuzzyIndex:
+    """
+    Vocabulary of folded name/model tokens plus joined adjacent name tokens
+    ("may giat" → "maygiat"), with term → trigram and term → product postings.
+    """
+
+    def __init__(self, rows: List):
+        self.catalog: Optional[Catalog] = None         # snapshot it was built from
+        self.products: Sequence[Dict] = []
+        self.terms: List[str] = []
+        self._term_ids: Dict[str, int] = {}
+        self._postings: Sequence = []                  # term id → product ids
+        self._by_trigram: Dict[str, List[int]] = defaultdict(list)
+
+        for row in rows:
+            pid = len(self.products)
+            self.products.append({
+                "ten": row["ten_san_pham"],
+                "model": row["model"] or "N/A",
+                "gia": row["gia"],
+                "nsx": row["thong_so_chinh"] or "N/A",
+            })
+            name = tokenize(row["ten_san_pham"] or "")
+            terms = set(name) | set(tokenize(row["model"] or ""))
+            terms.update(a + b for a, b in zip(name, name[1:]))
+            for term in terms:
+                self._postings[self._term_id(term)].add(pid)
+
+    @classmethod
+    def from_catalog(cls, catalog: Catalog) -> "FuzzyIndex":
+        """
+        Index over a mapped catalog artifact: vocabulary and postings come
+        prebuilt, only the term → trigram map is built here.
+        """
+        index = cls([])
+        index.catalog = catalog
+        index.products = _CatalogProducts(catalog)
+        index.terms = [catalog.terms[i] for i in range(len(catalog.terms))]
+        index._term_ids = {term: tid for tid, term in enumerate(index.terms)}
+        index._postings = _CsrPostings(*catalog.postings)
+        for tid, term in enumerate(index.terms):
+            for gram in _trigrams(term):
+                index._by_trigram[gram].append(tid)
+        return index
+
+    def to_csr(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Postings as (offsets, product ids) arrays; ids ascending per term."""
+        lengths = np.fromiter((len(p) for p in self._postings), dtype=np.int64,
+                              count=len(self.terms))
+        offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        pids = np.fromiter((pid for p in self._postings for pid in sorted(p)),
+                           dtype=np.int32, count=int(offsets[-1]))
+        return offsets, pids
+
+    def _term_id(self, term: str) -> int:
+        tid = self._term_ids.get(term)
+        if tid is None:
+            tid = self._term_ids[term] = len(self.terms)
+            self.terms.append(term)
+            self._postings.append(set())
+            for gram in _trigrams(term):
+                self._by_trigram[gram].append(tid)
+        return tid
+
+    def match_term(self, token: str) -> List[Tuple[int, float]]:
+        """Vocabulary terms similar to *token*, as (term id, similarity)."""
+        if token in self._term_ids:
+            return [(self._term_ids[token], 1.0)]
+        if len(token) < _MIN_FUZZY_LEN:
+            return []
+        grams = _trigrams(token)
+        shared = Counter(tid for g in grams for tid in self._by_trigram.get(g, ()))
+        matches = []
+        for tid, _ in shared.most_common(_MAX_CANDIDATES):
+            sim = SequenceMatcher(None, token, self.terms[tid]).ratio()
+            if sim >= FUZZY_MIN_SCORE:
+                matches.append((tid, sim))
+        return matches
+
+    def search(self, query: str, max_results: int = 5) -> Dict:
+        """
+        Products covering every query token. A product's score is the mean
+        over tokens of its best matching term's similarity. A miss reports
+        the best score seen (``"best"``) as a confidence signal.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return {"found": False, "best": 0.0}
+
+        scores: Dict[int, float] = defaultdict(float)
+        for token in tokens:
+            best: Dict[int, float] = {}
+            for tid, sim in self.match_term(token):
+                for pid in self._postings[tid]:
+                    if sim > best.get(pid, 0.0):
+                        best[pid] = sim
+            if not best:
+                return {"found": False, "best": 0.0}  # a token nothing resembles
+            for pid, sim in best.items():
+                scores[pid] += sim
+
+        ranked = sorted(((s / len(tokens), pid) for pid, s in scores.items()),
+                        key=lambda x: (-x[0], x[1]))
+        products, seen = [], set()
+        for score, pid in ranked:
+            if score < FUZZY_MIN_SCORE or len(products) >= max_results:
+                break
+            product = self.products[pid]
+            if product["model"] in seen:
+                continue
+            seen.add(product["model"])
+            products.append({**product, "similarity": round(score, 3)})
+
+        if products:
+            return {"found": True, "count": len(products), "products": products}
+        return {"found": False, "best": round(ranked[0][0], 3) if ranked else 0.0}
+
+
+class _CatalogProducts:
+    """Product dicts built on access from a mapped catalog."""
+
+    def __init__(self, catalog: Catalog):
+        self._catalog = catalog
+
+    def __len__(self) -> int:
+        return self._catalog.size
+
+    def __getitem__(self, pid: int) -> Dict:
+        return self._catalog.product(pid)
+
+
+class _CsrPostings:
+    """term id → product ids, over (offsets, ids) arrays."""
+
+    def __init__(self, offsets: np.ndarray, pids: np.ndarray):
+        self._offsets, self._pids = offsets, pids
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, tid: int) -> List[int]:
+        return self._pids[self._offsets[tid]:self._offsets[tid + 1]].tolist()
+
+
+# ---------------------------------------------------------------------------
+# Process-wide index (built lazily from the catalog)
+# ---------------------------------------------------------------------------
+
+_index: Optional[FuzzyIndex] = None
+_lock = threading.Lock()
+
+
+def get_index() -> FuzzyIndex:
+    """
+    Shared index; rebuilt whenever the catalog snapshot it was built from is
+    replaced (a new artifact, or another process's write to the DB).
+    """
+    global _index
+    catalog = get_catalog()
+    if _index is None or _index.catalog is not catalog:
+        with _lock:
+            if _index is None or _index.catalog is not catalog:
+                if catalog.terms is not None:  # mapped artifact: prebuilt postings
+                    _index = FuzzyIndex.from_catalog(catalog)
+                else:
+                    from database import get_connection
+                    with get_connection() as conn:
+                        rows = conn.execute(
+                            "SELECT ten_san_pham, model, gia, thong_so_chinh FROM products "
+                            "ORDER BY id"  # product ids == catalog rows (live_updates)
+                        ).fetchall()
+                    _index = FuzzyIndex(rows)
+                    _index.catalog = catalog
+                logger.info("Fuzzy index built: %d products, %d terms",
+                            len(_index.products), len(_index.terms))
+    return _index
+
+
+def reset_index() -> None:
+    """Drop the cached index; the next search rebuilds it from the catalog."""
+    global _index
+    with _lock:
+        _index = None
+
+
+def update_prices(prices: Dict[int, int]) -> None:
+    """
+    Patch product ids → new price in the built index. Indexes over a mapped
+    catalog read prices from it and need no patching.
+    """
+    index = _index
+    if index is not None and isinstance(index.products, list):
+        for pid, gia in prices.items():
+            index.products[pid]["gia"] = gia
+
+
+def fuzzy_search(query: str, max_results: int = 5) -> Dict:
+    """Typo-tolerant product search; same result shape as search_with_intent."""
+    return get_index().search(query, max_results)
+
+
+# ---------------------------------------------------------------------------
+# CLI test
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    for q in ["samsumg", "maygiat", "tu lanh sharp", "binh tam rosi", "iphone 15 pro max"]:
+        result = fuzzy_search(q, 3)
+        print(f"\n{q!r}: found={result['found']}")
+        for p in result.get("products", []):
+            print(f"  {p['similarity']:.2f}  {p['ten']} ({p['model']})")
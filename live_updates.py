@@ -0,0 +1,222 @@
+"""
+VIVOHOME AI - Live Price & Stock Updates
+Applies price/stock deltas without rebuilding the catalog: one SQLite
+transaction per batch, then the same values are patched into the in-memory
+catalog, the fuzzy index and the Chroma metadata, so the next search sees
+them. Rendered answer fragments are keyed on price and re-render by
+themselves.
+
+Updates arrive as JSON lines appended to LIVE_UPDATES_FEED (followed by
+FeedTailer) or via POST /v1/updates on the JSON API:
+
+    {"model": "RT20HAR8DBU", "gia": 5490000, "ton_kho": 12}
+
+    python live_updates.py apply updates.jsonl   # one-shot
+    python live_updates.py follow feed.jsonl     # tail -F
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import database
+import fuzzy_index
+import vector_store
+from app_config import LIVE_UPDATES_BATCH, LIVE_UPDATES_FEED, LIVE_UPDATES_POLL_MS
+from catalog import patching
+from logger import get_logger
+from metrics import LIVE_UPDATES, span
+
+logger = get_logger("live_updates")
+
+_FIELDS = ("gia", "ton_kho")
+
+
+# ---------------------------------------------------------------------------
+# Applying updates
+# ---------------------------------------------------------------------------
+
+def parse_update(raw) -> Dict:
+    """Validate one update; raises ValueError with a client-readable reason."""
+    if not isinstance(raw, dict):
+        raise ValueError("update must be a JSON object")
+    model = raw.get("model")
+    if not isinstance(model, str) or not model.strip():
+        raise ValueError("missing 'model'")
+    update = {"model": model.strip()}
+    for key in _FIELDS:
+        value = raw.get(key)
+        if value is None:
+            continue
+        if (isinstance(value, bool) or not isinstance(value, (int, float))
+                or value < 0 or value != int(value)):
+            raise ValueError(f"'{key}' must be a non-negative integer")
+        update[key] = int(value)
+    if len(update) == 1:
+        raise ValueError("nothing to update: give 'gia' and/or 'ton_kho'")
+    return update
+
+
+def apply_updates(updates: Iterable) -> Dict:
+    """
+    Apply updates keyed by model code (every row with that folded code).
+    Later updates in the same call win. Returns
+    ``{"applied", "rows", "unknown": [models], "invalid"}``.
+    """
+    parsed: List[Dict] = []
+    invalid = 0
+    for raw in updates:
+        try:
+            parsed.append(parse_update(raw))
+        except ValueError as exc:
+            invalid += 1
+            logger.warning("Invalid update %.200r: %s", raw, exc)
+
+    applied, rows_updated, unknown = 0, 0, []
+    repriced, changed = set(), set()
+    for start in range(0, len(parsed), max(LIVE_UPDATES_BATCH, 1)):
+        batch = parsed[start:start + LIVE_UPDATES_BATCH]
+        with span("live_update"), patching() as catalog:
+            matched = []
+            for update in batch:
+                rows = catalog.rows_for_model(update["model"])
+                if rows.size:
+                    matched.append((rows, update))
+                else:
+                    unknown.append(update["model"])
+            # Database first: if the write fails, memory still matches it
+            database.apply_product_updates([
+                (int(catalog.ids[i]), update.get("gia"), update.get("ton_kho"))
+                for rows, update in matched for i in rows])
+            for rows, update in matched:
+                catalog.update(rows, gia=update.get("gia"), stock=update.get("ton_kho"))
+                if "gia" in update:
+                    repriced.update(int(i) for i in rows)
+                changed.update(int(i) for i in rows)
+                rows_updated += rows.size
+            applied += len(matched)
+
+    if repriced:
+        fuzzy_index.update_prices({i: int(catalog.gia[i]) for i in repriced})
+    if changed:
+        # Price and stock are metadata only — nothing is re-embedded
+        vector_store.update_metadata({
+            f"product_{int(catalog.ids[i])}": vector_store.product_metadata({
+                "ten_san_pham": catalog.ten[i],
+                "model": catalog.model[i],
+                "gia": int(catalog.gia[i]),
+                "ton_kho": None if catalog.stock[i] < 0 else int(catalog.stock[i]),
+                "thong_so_chinh": catalog.specs[i],
+                "nhom_hang": catalog.nhom_hang[i],
+            }) for i in changed})
+
+    for outcome, count in (("applied", applied), ("unknown", len(unknown)),
+                           ("invalid", invalid)):
+        if count:
+            LIVE_UPDATES.inc(count, outcome=outcome)
+    if parsed or invalid:
+        logger.info("Live updates: %d applied (%d rows), %d unknown, %d invalid",
+                    applied, rows_updated, len(unknown), invalid)
+    return {"applied": applied, "rows": rows_updated, "unknown": unknown,
+            "invalid": invalid}
+
+
+# ---------------------------------------------------------------------------
+# JSON-lines feed
+# ---------------------------------------------------------------------------
+
+class FeedTailer:
+    """
+    Follows a JSON-lines file like ``tail -F``: complete new lines are
+    applied every *interval* seconds. Truncation or rotation restarts from
+    the top — updates carry absolute values, so re-applying is harmless.
+    """
+
+    def __init__(self, path: str, interval: float = LIVE_UPDATES_POLL_MS / 1000):
+        self.path = path
+        self.interval = interval
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def poll(self) -> Dict:
+        """Apply whatever complete lines were appended since the last poll."""
+        result = {"applied": 0, "rows": 0, "unknown": [], "invalid": 0}
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return result
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            self._inode, self._offset = st.st_ino, 0
+        if st.st_size == self._offset:
+            return result
+
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(st.st_size - self._offset)
+        end = chunk.rfind(b"\n") + 1
+        if not end:
+            return result  # a partial line; wait for its newline
+        self._offset += end
+
+        updates, bad = [], 0
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                updates.append(json.loads(line))
+            except ValueError:
+                bad += 1
+        if bad:
+            LIVE_UPDATES.inc(bad, outcome="invalid")
+            logger.warning("Skipped %d malformed lines in %s", bad, self.path)
+        result = apply_updates(updates)
+        result["invalid"] += bad
+        return result
+
+    def start(self) -> "FeedTailer":
+        self._thread = threading.Thread(target=self._run, name="live-updates", daemon=True)
+        self._thread.start()
+        logger.info("Following live updates in %s (every %.0f ms)",
+                    self.path, self.interval * 1000)
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as exc:
+                logger.error("Live update feed error: %s", exc, exc_info=True)
+            self._stop.wait(self.interval)
+
+
+def start_feed(path: Optional[str] = None) -> Optional[FeedTailer]:
+    """Start following LIVE_UPDATES_FEED (or *path*); None when not configured."""
+    path = path or LIVE_UPDATES_FEED
+    return FeedTailer(path).start() if path else None
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) == 3 and sys.argv[1] == "apply":
+        print(FeedTailer(sys.argv[2]).poll())
+    elif len(sys.argv) == 3 and sys.argv[1] == "follow":
+        tailer = start_feed(sys.argv[2])
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            tailer.stop()
+    else:
+        print(__doc__)
@@ -1,38 +1,164 @@
 """
 VIVOHOME AI - Logging Configuration
-Centralized logging with rotating file handler.
+Centralized logging: callers enqueue records, a background listener thread
+does the file/console I/O (rotating file, optional JSON lines).
 """
 
+import atexit
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
-from app_config import LOG_DIR
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Callable, Dict, Optional, Tuple
+
+from app_config import (LOG_ASYNC, LOG_DEBUG_SAMPLE_RATE, LOG_DIR, LOG_JSON,
+                        LOG_LEVEL, LOG_QUEUE_SIZE, LOG_RATE_LIMIT)
 
 os.makedirs(LOG_DIR, exist_ok=True)
 
 _LOG_FORMAT = "%(asctime)s | %(name)-12s | %(levelname)-8s | %(message)s"
 _LOG_FILE = os.path.join(LOG_DIR, "vivohome.log")
+_JSON_LOG_FILE = os.path.join(LOG_DIR, "vivohome.jsonl")
 
+_listener: Optional[QueueListener] = None
+_sampling: Optional["SamplingFilter"] = None  # sync mode: shared by every logger
 
-def _setup_root_logger() -> None:
-    """Configure root logger once at import time."""
-    root = logging.getLogger()
-    if root.handlers:
-        return  # Already configured
 
-    root.setLevel(logging.INFO)
+# ---------------------------------------------------------------------------
+# Formatters & filters
+# ---------------------------------------------------------------------------
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line — easy to ship to log pipelines."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Thin out high-volume lines before they reach the queue.
+
+    - DEBUG records are kept with probability ``debug_sample_rate``.
+    - Below WARNING, each call site (logger, line) may emit at most
+      ``rate_limit`` records per second (0 disables the limit).
+    Warnings and errors always pass. *clock* returns seconds (monotonic).
+    """
+
+    def __init__(self, debug_sample_rate: float = 1.0, rate_limit: float = 0,
+                 clock: Callable[[], float] = time.monotonic):
+        super().__init__()
+        self.debug_sample_rate = debug_sample_rate
+        self.rate_limit = rate_limit
+        self.clock = clock
+        self.suppressed = 0
+        self._windows: Dict[Tuple[str, int], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if (record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0
+                and random.random() >= self.debug_sample_rate):
+            self.suppressed += 1
+            return False
+        if self.rate_limit > 0:
+            now = int(self.clock())
+            key = (record.name, record.lineno)
+            with self._lock:
+                window = self._windows.setdefault(key, [now, 0])
+                if window[0] != now:
+                    window[0], window[1] = now, 0
+                window[1] += 1
+                if window[1] > self.rate_limit:
+                    self.suppressed += 1
+                    return False
+        return True
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller: drops when the queue is full."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
 
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+# ---------------------------------------------------------------------------
+# Setup
+# ---------------------------------------------------------------------------
+
+def _build_output_handlers() -> list:
+    """Handlers that do the actual I/O (run on the listener thread)."""
     # File handler with rotation (max 5MB, keep 3 backups)
     file_handler = RotatingFileHandler(
-        _LOG_FILE, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"
+        _JSON_LOG_FILE if LOG_JSON else _LOG_FILE,
+        maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8",
     )
-    file_handler.setFormatter(logging.Formatter(_LOG_FORMAT))
-    root.addHandler(file_handler)
+    file_handler.setFormatter(JsonFormatter() if LOG_JSON else logging.Formatter(_LOG_FORMAT))
 
     # Console handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(logging.Formatter(_LOG_FORMAT))
-    root.addHandler(console_handler)
+    return [file_handler, console_handler]
+
+
+def _setup_root_logger() -> None:
+    """Configure root logger once at import time."""
+    global _listener, _sampling
+    root = logging.getLogger()
+    if root.handlers:
+        return  # Already configured
+
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    handlers = _build_output_handlers()
+
+    if not LOG_ASYNC:
+        # One filter ahead of both outputs, so a record is sampled and counted
+        # once. Logger filters only see records logged on that logger, so
+        # get_logger() attaches it to each module logger too.
+        _sampling = SamplingFilter(LOG_DEBUG_SAMPLE_RATE, LOG_RATE_LIMIT)
+        root.addFilter(_sampling)
+        for h in handlers:
+            root.addHandler(h)
+        return
+
+    q: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = _DroppingQueueHandler(q)
+    queue_handler.addFilter(SamplingFilter(LOG_DEBUG_SAMPLE_RATE, LOG_RATE_LIMIT))
+    root.addHandler(queue_handler)
+
+    _listener = QueueListener(q, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Drain the queue and stop the writer thread (idempotent)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()  # Processes every queued record before returning
+        for h in _listener.handlers:
+            h.flush()
+        _listener = None
 
 
 _setup_root_logger()
@@ -40,7 +166,10 @@ _setup_root_logger()
 
 def get_logger(name: str) -> logging.Logger:
     """Get a named logger for a module."""
-    return logging.getLogger(name)
+    logger = logging.getLogger(name)
+    if _sampling is not None:
+        logger.addFilter(_sampling)  # no-op when already attached
+    return logger
 
 
 # Pre-created loggers for convenience
@@ -0,0 +1,409 @@
+"""
+VIVOHOME AI - Metrics & Tracing
+Per-request stage spans plus process-wide counters and histograms,
+exported in Prometheus text format. Search worker processes ship their
+counter and histogram deltas back with each result (drain / merge), so the
+front end's /metrics covers the whole pool.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from logger import get_logger
+
+logger = get_logger("metrics")
+
+# Latency buckets in milliseconds — SQLite hits sit at the low end,
+# Tavily timeouts at the high end.
+_LATENCY_BUCKETS_MS: Tuple[float, ...] = (
+    0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000,
+)
+
+
+# ---------------------------------------------------------------------------
+# Metric types
+# ---------------------------------------------------------------------------
+
+_REGISTRY: List = []
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 registry: Optional[List] = None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        (_REGISTRY if registry is None else registry).append(self)
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        return self._values.get(key, 0)
+
+    def take(self) -> Dict[Tuple[str, ...], float]:
+        """Values recorded so far, resetting them to zero."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def add(self, values: Dict[Tuple[str, ...], float]) -> None:
+        """Fold in values taken from another process's counter."""
+        with self._lock:
+            for key, val in values.items():
+                self._values[key] = self._values.get(key, 0) + val
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, val in items:
+            lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {val:g}")
+        return lines
+
+
+class Gauge:
+    """Point-in-time value with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 registry: Optional[List] = None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        (_REGISTRY if registry is None else registry).append(self)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels: str) -> float:
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        return self._values.get(key, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, val in items:
+            lines.append(f"{self.name}{_fmt_labels(self.labels, key)} {val:g}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram (milliseconds) with optional labels."""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = _LATENCY_BUCKETS_MS,
+                 registry: Optional[List] = None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # key -> [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+        (_REGISTRY if registry is None else registry).append(self)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 2)
+            row[idx] += 1
+            row[-1] += value
+
+    def count(self, **labels: str) -> int:
+        key = tuple(str(labels.get(l, "")) for l in self.labels)
+        row = self._values.get(key)
+        return int(sum(row[:-1])) if row else 0
+
+    def take(self) -> Dict[Tuple[str, ...], List[float]]:
+        """Rows recorded so far, resetting them to empty."""
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def add(self, values: Dict[Tuple[str, ...], List[float]]) -> None:
+        """Fold in rows taken from another process's histogram (same buckets)."""
+        with self._lock:
+            for key, row in values.items():
+                mine = self._values.get(key)
+                if mine is None:
+                    self._values[key] = list(row)
+                else:
+                    self._values[key] = [a + b for a, b in zip(mine, row)]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lbl = _fmt_labels(self.labels + ("le",), key + (le,))
+                lines.append(f"{self.name}_bucket{lbl} {cumulative:g}")
+            lbl = _fmt_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{lbl} {row[-1]:g}")
+            lines.append(f"{self.name}_count{lbl} {cumulative:g}")
+        return lines
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Linear-interpolated percentile (pct in 0..100) of raw samples."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+# ---------------------------------------------------------------------------
+# Standard metrics
+# ---------------------------------------------------------------------------
+
+REQUESTS = Counter("vivohome_requests_total",
+                   "Search requests by final source", ["source"])
+REQUEST_LATENCY = Histogram("vivohome_request_latency_ms",
+                            "End-to-end search latency (ms)")
+STAGE_LATENCY = Histogram("vivohome_stage_latency_ms",
+                          "Per-stage latency (ms)", ["stage"])
+STAGE_RESULTS = Counter("vivohome_stage_results_total",
+                        "Results returned per stage", ["stage"])
+FALLBACKS = Counter("vivohome_fallbacks_total",
+                    "Pipeline fallbacks between stages", ["from_stage", "to_stage"])
+UPSTREAM_ERRORS = Counter("vivohome_upstream_errors_total",
+                          "Errors from upstream services", ["service"])
+CACHE_HITS = Counter("vivohome_cache_hits_total", "Cache hits", ["cache"])
+CACHE_MISSES = Counter("vivohome_cache_misses_total", "Cache misses", ["cache"])
+READY = Gauge("vivohome_ready", "1 once warm-up has finished")
+SPECULATIVE_WEB_CALLS = Counter("vivohome_speculative_web_total",
+                                "Early web calls by outcome (used | cancelled | wasted | skipped)",
+                                ["outcome"])
+BUDGET_EXCEEDED = Counter("vivohome_budget_exceeded_total",
+                          "Requests that hit SEARCH_BUDGET_MS, by stage skipped", ["stage"])
+SESSION_FOLLOWUPS = Counter("vivohome_session_followups_total",
+                            "Follow-up queries by outcome (refined | more | full_search)",
+                            ["outcome"])
+SESSION_EVICTIONS = Counter("vivohome_session_evictions_total",
+                            "Chat sessions dropped", ["reason"])
+SESSIONS_ACTIVE = Gauge("vivohome_sessions_active", "Chat sessions held in memory")
+LIVE_UPDATES = Counter("vivohome_live_updates_total",
+                       "Price/stock updates by outcome (applied | unknown | invalid)",
+                       ["outcome"])
+LOAD_LEVEL = Gauge("vivohome_load_level",
+                   "Degradation level (0 normal, 1 no web, 2 DB-only, 3 busy)")
+STAGE_INFLIGHT = Gauge("vivohome_stage_inflight", "Calls holding a stage slot", ["stage"])
+SHED = Counter("vivohome_shed_total",
+               "Stage calls shed (queue_full | timeout | deadline)", ["stage", "reason"])
+COALESCED = Counter("vivohome_coalesced_total",
+                    "Calls that joined an identical in-flight call", ["call"])
+QUERY_LOG_RECORDS = Counter("vivohome_query_log_records_total",
+                            "Query log records (written | dropped)", ["outcome"])
+PROFILE_ACTIVE = Gauge("vivohome_profile_active", "1 while a profiling capture runs")
+DEGRADED = Counter("vivohome_degraded_total",
+                   "Degradation steps taken (skip_web | skip_semantic | cached | busy)",
+                   ["action"])
+
+
+# ---------------------------------------------------------------------------
+# Tracing
+# ---------------------------------------------------------------------------
+
+class Span:
+    """One timed stage inside a request trace."""
+
+    __slots__ = ("stage", "duration_ms", "count")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.duration_ms = 0.0
+        self.count: Optional[int] = None
+
+    def to_dict(self) -> Dict:
+        d = {"stage": self.stage, "ms": round(self.duration_ms, 3)}
+        if self.count is not None:
+            d["count"] = self.count
+        return d
+
+
+class Trace:
+    """Spans collected for one request, identified by ``request_id``."""
+
+    def __init__(self, request_id: Optional[str] = None):
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.spans: List[Span] = []
+        self.duration_ms = 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "request_id": self.request_id,
+            "ms": round(self.duration_ms, 3),
+            "spans": [s.to_dict() for s in self.spans],
+        }
+
+    def summary(self) -> str:
+        parts = []
+        for s in self.spans:
+            part = f"{s.stage}={s.duration_ms:.1f}ms"
+            if s.count is not None:
+                part += f"({s.count})"
+            parts.append(part)
+        return f"[{self.request_id}] total={self.duration_ms:.1f}ms " + " ".join(parts)
+
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace", default=None)
+recent_traces: Deque[Dict] = deque(maxlen=200)
+# profiler.Capture while a capture runs; otherwise spans pay one None check
+_span_hook = None
+
+
+def current_trace() -> Optional[Trace]:
+    """Return the trace of the request running in this context, if any."""
+    return _current_trace.get()
+
+
+@contextmanager
+def trace_request(request_id: Optional[str] = None) -> Iterator[Trace]:
+    """Open a request trace; nested ``span()`` calls attach to it."""
+    trace = Trace(request_id)
+    token = _current_trace.set(trace)
+    t0 = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace.duration_ms = (time.perf_counter() - t0) * 1000
+        _current_trace.reset(token)
+        REQUEST_LATENCY.observe(trace.duration_ms)
+        recent_traces.append(trace.to_dict())
+
+
+@contextmanager
+def span(stage: str) -> Iterator[Span]:
+    """
+    Time a pipeline stage. Set ``.count`` on the yielded span to record how
+    many results the stage produced. Works with or without an open trace.
+    """
+    s = Span(stage)
+    hook = _span_hook
+    if hook is not None:
+        hook.enter(stage)
+    t0 = time.perf_counter()
+    try:
+        yield s
+    finally:
+        s.duration_ms = (time.perf_counter() - t0) * 1000
+        if hook is not None:
+            hook.exit(stage)
+        STAGE_LATENCY.observe(s.duration_ms, stage=stage)
+        if s.count:
+            STAGE_RESULTS.inc(s.count, stage=stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append(s)
+
+
+# ---------------------------------------------------------------------------
+# Exposition
+# ---------------------------------------------------------------------------
+
+def render_prometheus(registry: Optional[List] = None) -> str:
+    """Render every registered metric in Prometheus text format 0.0.4."""
+    lines: List[str] = []
+    for metric in _REGISTRY if registry is None else registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def drain(registry: Optional[List] = None) -> Dict[str, Any]:
+    """
+    Counter and histogram values recorded since the last drain, by metric
+    name, and reset them — a search worker returns these with each result.
+    Gauges are per-process state and stay where they are.
+    """
+    deltas = {}
+    for metric in _REGISTRY if registry is None else registry:
+        if isinstance(metric, (Counter, Histogram)):
+            values = metric.take()
+            if values:
+                deltas[metric.name] = values
+    return deltas
+
+
+def merge(deltas: Dict[str, Any], registry: Optional[List] = None) -> None:
+    """Add a worker's drained values into this process's metrics."""
+    by_name = {m.name: m for m in (_REGISTRY if registry is None else registry)}
+    for name, values in deltas.items():
+        metric = by_name.get(name)
+        if metric is not None:
+            metric.add(values)
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Serve ``/metrics``, ``/healthz`` and ``/ready`` from a daemon thread."""
+    # http.server is imported here so library users of this module don't pay for it
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802 (http.server API)
+            path = self.path.split("?")[0]
+            if path == "/metrics":
+                self._send(200, render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+            elif path == "/healthz":
+                self._send(200, "ok\n")
+            elif path == "/ready":
+                ready = READY.value() == 1
+                self._send(200 if ready else 503, "ready\n" if ready else "warming up\n")
+            else:
+                self.send_error(404)
+
+        def _send(self, status: int, text: str,
+                  content_type: str = "text/plain; charset=utf-8") -> None:
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):  # keep scrapes out of the app log
+            pass
+
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http",
+                              daemon=True)
+    thread.start()
+    logger.info("Metrics endpoint on http://%s:%d/metrics", host, port)
+    return server
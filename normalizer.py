@@ -0,0 +1,73 @@
+"""
+VIVOHOME AI - Vietnamese Text Normalization
+One place for case/Unicode folding, tone-mark canonicalisation, diacritic
+stripping and tokenisation — shared by the query parser, database and
+vector search. All functions are pure and memoized.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Tuple
+
+# Combining tone marks (NFD): grave, acute, tilde, hook above, dot below
+_TONES = "\u0300\u0301\u0303\u0309\u0323"
+
+# "hoà" (new style) → "hòa" (old style, used throughout the catalog):
+# in open syllables oa/oe/uy the tone sits on the first vowel.
+_TONE_PLACEMENT_RE = re.compile(
+    rf"(?<!q)([ou])([aey])([{_TONES}])(?![a-z\u0300-\u036f])"
+)
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=8192)
+def normalize(text: str) -> str:
+    """
+    Canonical accented form: NFC, lowercase, old-style tone placement,
+    collapsed whitespace. ``normalize("Điều Hoà")`` → ``"điều hòa"``.
+    """
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFD", text.lower())
+    decomposed = _TONE_PLACEMENT_RE.sub(r"\1\3\2", decomposed)
+    composed = unicodedata.normalize("NFC", decomposed)
+    return _SPACES_RE.sub(" ", composed).strip()
+
+
+@lru_cache(maxsize=8192)
+def fold(text: str) -> str:
+    """Accent-free form: ``fold("Tủ Lạnh Đẹp")`` → ``"tu lanh dep"``."""
+    decomposed = unicodedata.normalize("NFD", normalize(text))
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.replace("đ", "d")
+
+
+@lru_cache(maxsize=8192)
+def tokenize(text: str) -> Tuple[str, ...]:
+    """Folded alphanumeric tokens: ``"Tủ lạnh RT-20"`` → ``("tu", "lanh", "rt", "20")``."""
+    return tuple(_TOKEN_RE.findall(fold(text)))
+
+
+def fold_padded(text: str) -> str:
+    """
+    Folded tokens joined by single spaces with a leading and trailing space,
+    so ``f" {phrase} " in fold_padded(name)`` is a whole-token phrase match.
+    This is the form stored in the catalog's ``*_fold`` columns.
+    """
+    return f" {' '.join(tokenize(text))} "
+
+
+@lru_cache(maxsize=1024)
+def accent_optional(pattern: str) -> str:
+    """
+    Rewrite an accented regex so each accented letter also matches its bare
+    letter: ``"tủ lạnh"`` → ``"t[uủ] l[aạ]nh"``. Unaccented input ("tu lanh")
+    then matches, while a *different* accent ("nơi" vs "nồi") does not.
+    """
+    out = []
+    for ch in normalize(pattern):  # patterns are lowercase; no \B/\W escapes
+        base = fold(ch) if ch.isalpha() else ch
+        out.append(f"[{base}{ch}]" if base != ch else ch)
+    return "".join(out)
@@ -0,0 +1,269 @@
+"""
+VIVOHOME AI - Overload Control
+Admission control and graceful degradation. Each expensive stage (vision,
+semantic search, live web search) gets a concurrency limit with a bounded
+wait queue; a caller that cannot get a slot before its deadline is shed
+instead of piling onto a multi-second timeout.
+
+Requests in flight per process set the load level, and search steps down
+a degradation ladder as it rises:
+
+    0 normal    full pipeline
+    1 no_web    skip the web fallback
+    2 db_only   skip semantic search too (database + fuzzy only)
+    3 busy      serve a recent cached answer, or a "busy" reply
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app_config import (ANSWER_CACHE_SIZE, OVERLOAD_COOLDOWN_S, OVERLOAD_LEVELS,
+                        OVERLOAD_MAX_INFLIGHT, STAGE_LIMITS, STAGE_QUEUE_SIZE,
+                        STAGE_QUEUE_TIMEOUT_MS)
+from logger import get_logger
+from metrics import DEGRADED, LOAD_LEVEL, SHED, STAGE_INFLIGHT
+from normalizer import normalize
+
+logger = get_logger("overload")
+
+NORMAL, NO_WEB, DB_ONLY, BUSY = range(4)
+LEVEL_NAMES = ("normal", "no_web", "db_only", "busy")
+
+
+class Overloaded(Exception):
+    """A stage slot could not be had in time; the caller should degrade."""
+
+    def __init__(self, stage: str, reason: str):
+        super().__init__(f"{stage} overloaded ({reason})")
+        self.stage = stage
+        self.reason = reason
+
+
+def _parse_limits(spec: str) -> Dict[str, int]:
+    """``"vision=2,semantic=4"`` → {"vision": 2, "semantic": 4}."""
+    limits = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, value = item.partition("=")
+        limits[name.strip()] = int(value)
+    return limits
+
+
+# ---------------------------------------------------------------------------
+# Per-stage limiter
+# ---------------------------------------------------------------------------
+
+class StageLimiter:
+    """
+    At most *limit* concurrent calls, at most *queue_size* waiting. A waiter
+    gives up at its deadline (or after *timeout* seconds), and a caller whose
+    remaining time is below the stage's typical latency is shed up front.
+    """
+
+    def __init__(self, stage: str, limit: int, queue_size: int = STAGE_QUEUE_SIZE,
+                 timeout: float = STAGE_QUEUE_TIMEOUT_MS / 1000):
+        self.stage = stage
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.latency_ms = 0.0  # EWMA of completed calls
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, deadline: Optional[float] = None) -> Iterator[None]:
+        """Hold a slot for the duration of the block; raises Overloaded."""
+        self._acquire(deadline)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._cond:
+                self.in_flight -= 1
+                self.latency_ms = (elapsed_ms if not self.latency_ms
+                                   else 0.8 * self.latency_ms + 0.2 * elapsed_ms)
+                self._cond.notify()
+            STAGE_INFLIGHT.set(self.in_flight, stage=self.stage)
+
+    def _acquire(self, deadline: Optional[float]) -> None:
+        now = time.monotonic()
+        if deadline is not None and (deadline - now) * 1000 < self.latency_ms:
+            self._shed("deadline")
+        with self._cond:
+            if self.in_flight >= self.limit:
+                if self.waiting >= self.queue_size:
+                    self._shed("queue_full")
+                give_up = now + self.timeout
+                if deadline is not None:
+                    give_up = min(give_up, deadline)
+                self.waiting += 1
+                try:
+                    while self.in_flight >= self.limit:
+                        remaining = give_up - time.monotonic()
+                        if remaining <= 0:
+                            self._shed("timeout")
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+        STAGE_INFLIGHT.set(self.in_flight, stage=self.stage)
+
+    def _shed(self, reason: str) -> None:
+        SHED.inc(stage=self.stage, reason=reason)
+        logger.warning("Shed %s call: %s", self.stage, reason)
+        raise Overloaded(self.stage, reason)
+
+
+# ---------------------------------------------------------------------------
+# Controller
+# ---------------------------------------------------------------------------
+
+class OverloadController:
+    """
+    Tracks requests in flight against *capacity* and maps the ratio to a
+    load level via *thresholds* (no_web, db_only, busy). A raised level is
+    held for *cooldown* seconds so the ladder does not flap.
+    """
+
+    def __init__(self, capacity: int = OVERLOAD_MAX_INFLIGHT,
+                 thresholds: Tuple[float, ...] = OVERLOAD_LEVELS,
+                 cooldown: float = OVERLOAD_COOLDOWN_S,
+                 limits: Optional[Dict[str, int]] = None,
+                 cache_size: int = ANSWER_CACHE_SIZE):
+        self.capacity = capacity
+        self.thresholds = tuple(sorted(thresholds))
+        self.cooldown = cooldown
+        self.stages = {name: StageLimiter(name, limit) for name, limit in
+                       (limits if limits is not None else _parse_limits(STAGE_LIMITS)).items()
+                       if limit > 0}
+        self.in_flight = 0
+        self._held = (NORMAL, 0.0)  # (level, hold until)
+        self._lock = threading.Lock()
+        self._answers: "OrderedDict[str, Dict]" = OrderedDict()
+        self._cache_size = cache_size
+
+    # -- load level ----------------------------------------------------
+
+    def _level_locked(self) -> int:
+        if self.capacity <= 0:
+            return NORMAL
+        pressure = self.in_flight / self.capacity
+        level = sum(pressure > t for t in self.thresholds)
+        now = time.monotonic()
+        held, until = self._held
+        if level < held and now < until:
+            level = held
+        else:
+            self._held = (level, now + self.cooldown)
+        LOAD_LEVEL.set(level)
+        return level
+
+    def level(self) -> int:
+        with self._lock:
+            return self._level_locked()
+
+    @contextmanager
+    def request(self) -> Iterator[int]:
+        """Admit a request; yields the load level it should run at."""
+        with self._lock:
+            self.in_flight += 1
+            level = self._level_locked()
+        try:
+            yield level
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self._level_locked()
+
+    # -- stages --------------------------------------------------------
+
+    @contextmanager
+    def stage(self, name: str, deadline: Optional[float] = None) -> Iterator[None]:
+        """Run the block in a *name* slot (unlimited stages pass through)."""
+        limiter = self.stages.get(name)
+        if limiter is None:
+            yield
+            return
+        with limiter.slot(deadline):
+            yield
+
+    def expected_ms(self, name: str) -> float:
+        """Typical latency of a *name* call (EWMA; 0 if unknown or unlimited)."""
+        limiter = self.stages.get(name)
+        return limiter.latency_ms if limiter is not None else 0.0
+
+    # -- cached answers ------------------------------------------------
+
+    def remember(self, query: str, result: Dict) -> None:
+        """Keep a found result to serve when busy."""
+        if self._cache_size <= 0 or not result.get("found"):
+            return
+        entry = {k: v for k, v in result.items() if k not in ("candidates", "request_id")}
+        key = normalize(query)
+        with self._lock:
+            self._answers[key] = entry
+            self._answers.move_to_end(key)
+            while len(self._answers) > self._cache_size:
+                self._answers.popitem(last=False)
+
+    def recall(self, query: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._answers.get(normalize(query))
+        return dict(entry) if entry is not None else None
+
+    def status(self) -> Dict:
+        """Snapshot for logs and the CLI."""
+        with self._lock:
+            level = self._level_locked()
+        return {
+            "level": LEVEL_NAMES[level],
+            "in_flight": self.in_flight,
+            "capacity": self.capacity,
+            "stages": {name: {"in_flight": s.in_flight, "waiting": s.waiting,
+                              "limit": s.limit, "latency_ms": round(s.latency_ms, 1)}
+                       for name, s in self.stages.items()},
+        }
+
+
+controller = OverloadController()
+
+
+def stage(name: str, deadline: Optional[float] = None):
+    """``with stage("vision"): ...`` on the process-wide controller."""
+    return controller.stage(name, deadline)
+
+
+def degraded(action: str) -> None:
+    """Count one degradation step (skip_web | skip_semantic | cached | busy)."""
+    DEGRADED.inc(action=action)
+    logger.info("  Degraded: %s (load level %s)", action, LEVEL_NAMES[controller.level()])
+
+
+# ---------------------------------------------------------------------------
+# CLI test
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    demo = OverloadController(capacity=8, limits={"semantic": 2}, cooldown=0)
+
+    def call(i: int) -> str:
+        with demo.request() as level:
+            if level >= DB_ONLY:
+                return LEVEL_NAMES[level]
+            try:
+                with demo.stage("semantic", time.monotonic() + 0.15):
+                    time.sleep(0.1)
+                return "ok"
+            except Overloaded as exc:
+                return exc.reason
+
+    with ThreadPoolExecutor(16) as pool:
+        outcomes: List[str] = list(pool.map(call, range(16)))
+    print({o: outcomes.count(o) for o in sorted(set(outcomes))})
+    print(demo.status())
@@ -0,0 +1,400 @@
+"""
+VIVOHOME AI - On-Demand Profiling
+Time-boxed profiles of the live process, scoped to pipeline stages (the
+``span()`` names: parse, database, fuzzy, semantic, web, format, ...).
+
+    sample     a thread samples every busy thread's stack at PROFILE_SAMPLE_HZ
+    cprofile   deterministic cProfile, enabled only inside scoped stages
+    memory     (with either mode) tracemalloc snapshot + net bytes per stage
+
+Output goes to PROFILE_DIR/profile-<time>-<mode>/ as collapsed stacks
+(``*.folded`` — flamegraph.pl, speedscope, inferno), ``*.pstats`` and a
+``summary.json``. Nothing is hooked until a capture starts: a span pays one
+``is None`` check, and the hook is removed when the capture ends.
+
+Started with ``POST /v1/admin/profile`` (PROFILE_TOKEN), ``kill -USR2 <pid>``
+or:
+
+    python profiler.py run --seconds 5 --mode cprofile --memory
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter as Tally
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+import metrics
+from app_config import (PROFILE_DIR, PROFILE_MAX_S, PROFILE_SAMPLE_HZ, PROFILE_STAGES,
+                        PROFILE_TRACEMALLOC_FRAMES)
+from logger import get_logger
+from metrics import PROFILE_ACTIVE
+
+logger = get_logger("profiler")
+
+MODES = ("sample", "cprofile")
+_TOP = 25
+
+_lock = threading.Lock()
+_current: Optional["Capture"] = None
+_last: Optional[Dict] = None
+
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _fold(stage: str, frame) -> str:
+    """Collapsed stack, root first, under a synthetic ``stage`` root frame."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.append(stage)
+    return ";".join(reversed(names))
+
+
+def pstats_to_folded(stats: pstats.Stats, root: str) -> Dict[str, int]:
+    """
+    Approximate collapsed stacks (µs of own time) from a cProfile call
+    graph: each function's time is split over its callers in proportion to
+    the time spent under each edge, the way flameprof reconstructs paths.
+    """
+    table = stats.stats  # func -> (cc, nc, tt, ct, callers)
+    callees: Dict[tuple, List[tuple]] = defaultdict(list)
+    for func, (_, _, _, _, callers) in table.items():
+        for caller, edge in callers.items():
+            if caller in table:
+                callees[caller].append((func, edge[3]))
+    folded: Dict[str, int] = {}
+
+    def walk(func: tuple, path: List[str], weight: float) -> None:
+        if len(path) > 64 or table[func][3] * weight < 1e-5:
+            return  # deeper than any real stack, or under 10 µs on this path
+        name = f"{os.path.basename(func[0])}:{func[2]}"
+        path = path + [name]
+        own = int(table[func][2] * weight * 1e6)
+        if own:
+            key = ";".join(path)
+            folded[key] = folded.get(key, 0) + own
+        for callee, edge_ct in callees.get(func, ()):
+            total = table[callee][3]
+            if total > 0 and f"{os.path.basename(callee[0])}:{callee[2]}" not in path:
+                walk(callee, path, weight * min(edge_ct / total, 1.0))
+
+    for func, (_, _, _, _, callers) in table.items():
+        if not any(c in table for c in callers):
+            walk(func, [root], 1.0)
+    return folded
+
+
+def _write_folded(path: str, folded: Dict[str, int]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in sorted(folded.items()):
+            f.write(f"{stack} {count}\n")
+
+
+# ---------------------------------------------------------------------------
+# Capture
+# ---------------------------------------------------------------------------
+
+class Capture:
+    """
+    One time-boxed profile. While running it is installed as the span hook
+    (``metrics._span_hook``): ``enter``/``exit`` track the stage stack of
+    each thread, which scopes the samples, the cProfile windows and the
+    per-stage memory deltas.
+    """
+
+    def __init__(self, seconds: float, mode: str = "sample", memory: bool = False,
+                 stages: Optional[Iterable[str]] = None, out_dir: Optional[str] = None,
+                 hz: int = PROFILE_SAMPLE_HZ):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        if not 0 < seconds <= PROFILE_MAX_S:
+            raise ValueError(f"seconds must be in (0, {PROFILE_MAX_S}]")
+        if stages is None:
+            stages = [s.strip() for s in PROFILE_STAGES.split(",") if s.strip()]
+        self.seconds = seconds
+        self.mode = mode
+        self.memory = memory
+        self.stages = frozenset(stages) or None  # None = every span
+        self.hz = max(1, hz)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(out_dir or PROFILE_DIR, f"profile-{stamp}-{mode}")
+        self.started = 0.0
+
+        self._stacks: Dict[int, List[str]] = {}
+        self._local = threading.local()
+        self._done = threading.Event()
+        self._finished = threading.Event()
+        self._summary: Optional[Dict] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._samples: Tally = Tally()
+        self._stage_samples: Tally = Tally()
+        self._profiles: Dict[str, List[cProfile.Profile]] = defaultdict(list)
+        self._mem: Dict[str, List[int]] = defaultdict(lambda: [0, 0])  # calls, net bytes
+        self._started_tracemalloc = False
+
+    # -- span hook -----------------------------------------------------
+
+    def _in_scope(self, stage: str) -> bool:
+        return self.stages is None or stage in self.stages
+
+    def enter(self, stage: str) -> None:
+        self._stacks.setdefault(threading.get_ident(), []).append(stage)
+        if not self._in_scope(stage):
+            return
+        local = self._local
+        if self.mode == "cprofile" and getattr(local, "profile", None) is None:
+            # One profile per thread at a time: nested stages count toward the outer one
+            prof = cProfile.Profile()
+            local.profile, local.profile_stage = prof, stage
+            local.profile_depth = len(self._stacks[threading.get_ident()])
+            prof.enable()
+        if self.memory:
+            local.__dict__.setdefault("mem", []).append(tracemalloc.get_traced_memory()[0])
+
+    def exit(self, stage: str) -> None:
+        stack = self._stacks.get(threading.get_ident())
+        if not stack:
+            return
+        local = self._local
+        if self._in_scope(stage):
+            if (getattr(local, "profile", None) is not None
+                    and local.profile_depth == len(stack)):
+                local.profile.disable()
+                if not self._done.is_set():
+                    self._profiles[local.profile_stage].append(local.profile)
+                local.profile = None
+            mem = getattr(local, "mem", None)
+            if mem:
+                before = mem.pop()
+                if not self._done.is_set():
+                    entry = self._mem[stage]
+                    entry[0] += 1
+                    entry[1] += tracemalloc.get_traced_memory()[0] - before
+        stack.pop()
+
+    # -- sampling ------------------------------------------------------
+
+    def _scoped_stage(self, stack: List[str]) -> Optional[str]:
+        for stage in reversed(stack):
+            if self._in_scope(stage):
+                return stage
+        return None
+
+    def _sample_loop(self) -> None:
+        me = threading.get_ident()
+        interval = 1.0 / self.hz
+        while not self._done.wait(interval):
+            frames = sys._current_frames()
+            for tid, stack in list(self._stacks.items()):
+                stage = self._scoped_stage(list(stack))
+                frame = frames.get(tid)
+                if stage is None or frame is None or tid == me:
+                    continue
+                self._samples[_fold(stage, frame)] += 1
+                self._stage_samples[stage] += 1
+
+    # -- lifecycle -----------------------------------------------------
+
+    def start(self) -> "Capture":
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self.started = time.time()
+        if self.mode == "sample":
+            self._sampler = threading.Thread(target=self._sample_loop,
+                                             name="profile-sampler", daemon=True)
+            self._sampler.start()
+        metrics._span_hook = self
+        PROFILE_ACTIVE.set(1)
+        logger.info("Profiling (%s%s) for %.0f s, stages=%s → %s", self.mode,
+                    "+memory" if self.memory else "", self.seconds,
+                    ",".join(sorted(self.stages)) if self.stages else "all", self.path)
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[Dict]:
+        self._finished.wait(timeout)
+        return self._summary
+
+    def stop(self) -> Optional[Dict]:
+        """End the capture now (idempotent); returns the summary once written."""
+        global _last
+        with _lock:
+            first = not self._done.is_set()
+            self._done.set()
+            if metrics._span_hook is self:
+                metrics._span_hook = None
+        if not first:
+            return self.wait()
+        PROFILE_ACTIVE.set(0)
+        try:
+            if self._sampler is not None:
+                self._sampler.join()
+            snapshot = tracemalloc.take_snapshot() if self.memory else None
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+            self._summary = _last = self._write(snapshot)
+            logger.info("Profile written to %s", self.path)
+        finally:
+            self._finished.set()
+        return self._summary
+
+    # -- output --------------------------------------------------------
+
+    def _write(self, snapshot: Optional[tracemalloc.Snapshot]) -> Dict:
+        os.makedirs(self.path, exist_ok=True)
+        summary: Dict = {
+            "mode": self.mode, "memory": self.memory, "path": self.path,
+            "started": round(self.started, 3),
+            "seconds": round(time.time() - self.started, 2),
+            "stages": sorted(self.stages) if self.stages else "all",
+        }
+        if self.mode == "sample":
+            _write_folded(os.path.join(self.path, "stacks.folded"), self._samples)
+            summary["samples"] = dict(self._stage_samples.most_common())
+            own = Tally()
+            for stack, count in self._samples.items():
+                own[stack.rsplit(";", 1)[-1]] += count
+            summary["top_self"] = [{"frame": f, "samples": n} for f, n in own.most_common(_TOP)]
+        else:
+            folded: Dict[str, int] = {}
+            summary["cprofile"] = {}
+            for stage, profiles in sorted(self._profiles.items()):
+                stats = pstats.Stats(profiles[0])
+                for prof in profiles[1:]:
+                    stats.add(prof)
+                stats.dump_stats(os.path.join(self.path, f"{stage}.pstats"))
+                for stack, us in pstats_to_folded(stats, stage).items():
+                    folded[stack] = folded.get(stack, 0) + us
+                text = io.StringIO()
+                stats.stream = text
+                stats.sort_stats("cumulative").print_stats(_TOP)
+                with open(os.path.join(self.path, f"{stage}.txt"), "w", encoding="utf-8") as f:
+                    f.write(text.getvalue())
+                summary["cprofile"][stage] = {"calls": len(profiles),
+                                              "seconds": round(stats.total_tt, 4)}
+            _write_folded(os.path.join(self.path, "cprofile.folded"), folded)
+
+        if snapshot is not None:
+            snapshot = snapshot.filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, __file__),
+            ])
+            snapshot.dump(os.path.join(self.path, "memory.tracemalloc"))
+            stats = snapshot.statistics("traceback")
+            _write_folded(os.path.join(self.path, "memory.folded"), {
+                ";".join(f"{os.path.basename(fr.filename)}:{fr.lineno}"
+                         for fr in reversed(stat.traceback)): stat.size
+                for stat in stats})
+            summary["memory_top"] = [
+                {"line": f"{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+                 "kb": round(s.size / 1024, 1), "blocks": s.count}
+                for s in snapshot.statistics("lineno")[:_TOP]]
+            summary["memory_by_stage"] = {
+                stage: {"calls": calls, "net_kb": round(net / 1024, 1)}
+                for stage, (calls, net) in sorted(self._mem.items())}
+
+        with open(os.path.join(self.path, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def start(seconds: float, mode: str = "sample", memory: bool = False,
+          stages: Optional[Iterable[str]] = None) -> Dict:
+    """
+    Start a capture that ends by itself after *seconds*. Raises ValueError
+    on bad arguments and RuntimeError if one is already running.
+    """
+    global _current
+    capture = Capture(seconds, mode, memory, stages)
+    with _lock:
+        if _current is not None and not _current._done.is_set():
+            raise RuntimeError(f"a capture is already running ({_current.path})")
+        _current = capture
+    capture.start()
+    timer = threading.Timer(seconds, _finish, args=(capture,))
+    timer.daemon = True
+    timer.start()
+    return status()
+
+
+def _finish(capture: Capture) -> None:
+    try:
+        capture.stop()
+    except Exception as exc:
+        logger.error("Profile capture failed: %s", exc, exc_info=True)
+
+
+def status() -> Dict:
+    current = _current
+    running = current is not None and not current._finished.is_set()
+    out: Dict = {"running": running, "last": _last}
+    if running:
+        out["current"] = {"mode": current.mode, "memory": current.memory,
+                          "path": current.path,
+                          "ends_in_s": round(current.started + current.seconds - time.time(), 1)}
+    return out
+
+
+def install_signal_handler(seconds: float = 30.0, signum: Optional[int] = None) -> bool:
+    """``kill -USR2 <pid>`` starts a sampled + memory capture (main thread only)."""
+    signum = signum if signum is not None else getattr(signal, "SIGUSR2", None)
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def handler(_signum, _frame):
+        # Capture setup takes a lock; do it off the interrupted frame
+        def begin():
+            try:
+                start(min(seconds, PROFILE_MAX_S), "sample", memory=True)
+            except RuntimeError as exc:
+                logger.warning("Profile signal ignored: %s", exc)
+        threading.Thread(target=begin, name="profile-signal", daemon=True).start()
+
+    signal.signal(signum, handler)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Profile the search pipeline locally")
+    parser.add_argument("command", choices=["run"])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--mode", choices=MODES, default="sample")
+    parser.add_argument("--memory", action="store_true")
+    args = parser.parse_args()
+
+    from formatter import format_result
+    from rag_engine import RAGEngine
+
+    engine = RAGEngine(use_web_fallback=False)
+    queries = ["tivi samsung 55 inch", "tủ lạnh giá rẻ nhất", "so sánh lg và samsung",
+               "máy giặt cửa trước", "điều hòa tiết kiệm điện"]
+    capture = Capture(args.seconds, args.mode, args.memory).start()
+    deadline = time.monotonic() + args.seconds
+    runs = 0
+    while time.monotonic() < deadline:
+        format_result(engine.search(queries[runs % len(queries)]))
+        runs += 1
+    print(json.dumps(capture.stop(), ensure_ascii=False, indent=2)[:3000])
+    print(f"\n{runs} searches profiled")
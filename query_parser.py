@@ -5,7 +5,10 @@ Rule-based intent detection from user queries (Vietnamese + English).
 
 import re
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from functools import lru_cache
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from normalizer import accent_optional, normalize
 
 
 # ---------------------------------------------------------------------------
@@ -50,19 +53,22 @@ INTENT_PATTERNS: Dict[str, List[str]] = {
     ],
 }
 
+# Accented patterns also match unaccented input ("tu lanh") and either tone
+# placement ("hoà"/"hòa") — see normalizer.accent_optional — so only the
+# canonical accented spelling is listed here.
 CATEGORY_PATTERNS: Dict[str, List[str]] = {
     "TV":              [r"\btv\b", r"tivi", r"ti vi", r"television", r"tele"],
-    "Tủ lạnh":         [r"tủ lạnh", r"tu lanh", r"tủ mát", r"fridge", r"refrigerator"],
-    "Tủ đông":         [r"tủ đông", r"tu dong", r"freezer"],
-    "Máy lọc nước":    [r"máy lọc nước", r"may loc nuoc", r"lọc nước", r"water filter"],
-    "Bàn là":          [r"bàn là", r"ban la", r"bàn ủi", r"iron"],
-    "Bình tắm":        [r"bình tắm", r"binh tam", r"nước nóng", r"water heater"],
-    "Bếp":             [r"\bbếp\b", r"\bbep\b", r"stove", r"cooker", r"bếp từ", r"bếp gas"],
-    "Nồi":             [r"\bnồi\b", r"\bnoi\b", r"nồi cơm", r"pot"],
-    "Máy giặt":        [r"máy giặt", r"may giat", r"washing machine"],
-    "Máy hút ẩm":      [r"máy hút ẩm", r"may hut am", r"dehumidifier"],
-    "Điều hòa":        [r"điều hòa", r"dieu hoa", r"máy lạnh", r"air con"],
-    "Quạt":            [r"\bquạt\b", r"\bquat\b", r"fan"],
+    "Tủ lạnh":         [r"tủ lạnh", r"tủ mát", r"fridge", r"refrigerator"],
+    "Tủ đông":         [r"tủ đông", r"freezer"],
+    "Máy lọc nước":    [r"máy lọc nước", r"lọc nước", r"water filter"],
+    "Bàn là":          [r"bàn là", r"bàn ủi", r"iron"],
+    "Bình tắm":        [r"bình tắm", r"nước nóng", r"water heater"],
+    "Bếp":             [r"\bbếp\b", r"stove", r"cooker", r"bếp từ", r"bếp gas"],
+    "Nồi":             [r"\bnồi\b", r"nồi cơm", r"pot"],
+    "Máy giặt":        [r"máy giặt", r"washing machine"],
+    "Máy hút ẩm":      [r"máy hút ẩm", r"dehumidifier"],
+    "Điều hòa":        [r"điều hòa", r"máy lạnh", r"air con"],
+    "Quạt":            [r"\bquạt\b", r"fan"],
 }
 
 BRAND_PATTERNS: Dict[str, List[str]] = {
@@ -72,12 +78,32 @@ BRAND_PATTERNS: Dict[str, List[str]] = {
     "Toshiba":   [r"toshiba"],
     "Rossi":     [r"rossi"],
     "Sunhouse":  [r"sunhouse", r"sun house"],
-    "Hòa Phát":  [r"hòa phát", r"hoa phat", r"hoà phát"],
+    "Hòa Phát":  [r"hòa phát"],
     "Korichi":   [r"korichi"],
     "Karofi":    [r"karofi"],
     "Kangaroo":  [r"kangaroo"],
 }
 
+# Follow-ups that refine the previous turn's results (see session_store.py)
+FOLLOWUP_PATTERNS: Dict[str, List[str]] = {
+    "cheaper": [r"rẻ hơn", r"thấp hơn", r"mềm hơn", r"cheaper"],
+    "pricier": [r"đắt hơn", r"cao hơn", r"mắc hơn", r"xịn hơn", r"more expensive"],
+    "compare": [r"so sánh với", r"\bvs\b", r"compare with"],
+    "more":    [r"xem thêm", r"còn nữa", r"thêm nữa", r"show more", r"^more\b"],
+    "brand":   [r"^còn\s+(?!hàng\b)", r"thì sao", r"what about", r"how about"],
+}
+
+
+def _compile(table: Dict[str, List[str]]) -> List[Tuple[str, List[Pattern]]]:
+    return [(key, [re.compile(accent_optional(p)) for p in patterns])
+            for key, patterns in table.items()]
+
+
+_INTENT_RES = _compile(INTENT_PATTERNS)
+_CATEGORY_RES = _compile(CATEGORY_PATTERNS)
+_BRAND_RES = _compile(BRAND_PATTERNS)
+_FOLLOWUP_RES = _compile(FOLLOWUP_PATTERNS)
+
 
 # ---------------------------------------------------------------------------
 # Public API
@@ -90,30 +116,47 @@ def parse_query(query: str) -> Dict:
     Returns a dict (not QueryIntent) for backward compatibility with
     existing callers.
     """
-    q = query.lower()
-    result = QueryIntent(original_query=query)
+    intent, category, brands = _detect(normalize(query))
+    result = QueryIntent(intent=intent, category=category,
+                         brands=list(brands) if brands else None,
+                         original_query=query)
+    return result.to_dict()
+
 
+def parse_followup(query: str) -> Optional[Dict]:
+    """
+    Detect a follow-up that refines the previous results instead of starting
+    a new search: ``{"refine": "cheaper" | "pricier" | "compare" | "more" |
+    "brand", "brands": [...]}``. "compare" adds brands, "brand" switches to
+    them, "more" asks for the next page of the previous listing.
+    Returns None when the query names its own category (a fresh search) or
+    a brand follow-up names no brand.
+    """
+    q = normalize(query)
+    _, category, brands = _detect(q)
+    if category:
+        return None
+    refine = next((name for name, res in _FOLLOWUP_RES
+                   if any(r.search(q) for r in res)), None)
+    if refine is None or (refine in ("compare", "brand") and not brands):
+        return None
+    return {"refine": refine, "brands": list(brands)}
+
+
+@lru_cache(maxsize=4096)
+def _detect(q: str) -> Tuple[str, Optional[str], Tuple[str, ...]]:
+    """Pattern matching on the normalized query (memoized)."""
     # Detect intent
-    for intent_type, patterns in INTENT_PATTERNS.items():
-        if any(re.search(p, q) for p in patterns):
-            result.intent = intent_type
-            break
+    intent = next((name for name, res in _INTENT_RES
+                   if any(r.search(q) for r in res)), "search")
 
     # Detect category
-    for category, patterns in CATEGORY_PATTERNS.items():
-        if any(re.search(p, q) for p in patterns):
-            result.category = category
-            break
+    category = next((name for name, res in _CATEGORY_RES
+                     if any(r.search(q) for r in res)), None)
 
     # Detect brands
-    detected = [
-        brand for brand, patterns in BRAND_PATTERNS.items()
-        if any(re.search(p, q) for p in patterns)
-    ]
-    if detected:
-        result.brands = detected
-
-    return result.to_dict()
+    brands = tuple(name for name, res in _BRAND_RES if any(r.search(q) for r in res))
+    return intent, category, brands
 
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,268 @@
+"""
+VIVOHOME AI - Query Log & Warm-up Replay
+Append-only JSON-lines record of every search, written by a background
+thread so the request path only enqueues:
+
+    {"t": 1760850000.1, "q": "tv giá cao nhất", "intent": "highest_price",
+     "cat": "TV", "brands": [], "path": "database", "ms": 3.2,
+     "ids": ["QA55Q60D", ...]}
+
+At startup the hottest recent queries are replayed (warm-up step
+"query_replay") so catalog masks, the embedding cache, rendered fragments,
+the busy-answer cache and the local web snapshot are warm before /ready.
+
+    python querylog.py report [--top 20] [--json]
+    python querylog.py hot [--top 50]
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter as Tally
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from app_config import (QUERY_LOG_ENABLED, QUERY_LOG_MAX_MB, QUERY_LOG_PATH,
+                        QUERY_LOG_REPLAY, QUERY_LOG_WINDOW)
+from logger import get_logger
+from metrics import QUERY_LOG_RECORDS, percentile
+from normalizer import normalize
+
+logger = get_logger("querylog")
+
+_QUEUE_SIZE = 10_000
+
+
+# ---------------------------------------------------------------------------
+# Writer
+# ---------------------------------------------------------------------------
+
+class QueryLog:
+    """Bounded queue + writer thread; records are dropped, never blocked on."""
+
+    def __init__(self, path: str = QUERY_LOG_PATH, max_bytes: int = QUERY_LOG_MAX_MB << 20,
+                 enabled: bool = QUERY_LOG_ENABLED):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._queue: queue.Queue = queue.Queue(_QUEUE_SIZE)  # entries + flush markers
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def record(self, query: str, result: Dict, ms: float) -> None:
+        """Enqueue one search (cheap; serialization happens on the writer)."""
+        self._ensure_thread()
+        intent = result.get("intent") or {}
+        entry = {
+            "t": round(time.time(), 3),
+            "q": normalize(query),
+            "intent": intent.get("intent"),
+            "cat": intent.get("category"),
+            "brands": intent.get("brands") or [],
+            "path": (result.get("sources") or ["none"])[-1],
+            "ms": round(ms, 2),
+            "ids": [p.get("model") for p in result.get("products") or []],
+        }
+        if result.get("degraded"):
+            entry["degraded"] = result["degraded"]
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            QUERY_LOG_RECORDS.inc(outcome="dropped")
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait until everything enqueued so far is on disk."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)  # type: ignore[arg-type]
+        done.wait(timeout)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    self._thread = threading.Thread(target=self._run, name="querylog",
+                                                    daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            markers = [b for b in batch if isinstance(b, threading.Event)]
+            entries = [b for b in batch if isinstance(b, dict)]
+            try:
+                if entries:
+                    self._write(entries)
+            except OSError as exc:
+                QUERY_LOG_RECORDS.inc(len(entries), outcome="dropped")
+                logger.warning("Query log write failed: %s", exc)
+            for marker in markers:
+                marker.set()
+
+    def _write(self, entries: List[Dict]) -> None:
+        data = "".join(json.dumps(e, ensure_ascii=False, separators=(",", ":")) + "\n"
+                       for e in entries)
+        try:
+            if os.path.getsize(self.path) + len(data) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")  # keep one generation
+        except FileNotFoundError:
+            pass
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(data)
+        QUERY_LOG_RECORDS.inc(len(entries), outcome="written")
+
+
+query_log = QueryLog()
+_local = threading.local()
+
+
+def record(query: str, result: Dict, ms: float) -> None:
+    """Log one user search (skipped while replaying, see ``muted``)."""
+    if query_log.enabled and not getattr(_local, "muted", False):
+        query_log.record(query, result, ms)
+
+
+@contextmanager
+def muted() -> Iterator[None]:
+    """Searches made by this thread inside the block are not logged."""
+    _local.muted = True
+    try:
+        yield
+    finally:
+        _local.muted = False
+
+
+# ---------------------------------------------------------------------------
+# Reading
+# ---------------------------------------------------------------------------
+
+def read_records(path: str = QUERY_LOG_PATH, window: int = QUERY_LOG_WINDOW) -> List[Dict]:
+    """The most recent *window* records, oldest first (previous generation included)."""
+    recent: deque = deque(maxlen=window)
+    for p in (path + ".1", path):
+        try:
+            with open(p, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        recent.append(json.loads(line))
+                    except ValueError:
+                        continue  # torn last line after a crash
+        except FileNotFoundError:
+            continue
+    return list(recent)
+
+
+def hot_queries(records: Sequence[Dict], top: int = QUERY_LOG_REPLAY) -> List[Dict]:
+    """Most frequent queries with the path their latest run took."""
+    counts = Tally(r["q"] for r in records)
+    latest = {r["q"]: r for r in records}
+    return [{"q": q, "count": n, "path": latest[q]["path"]}
+            for q, n in counts.most_common(top)]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    return round(percentile(values, pct), 2)
+
+
+def query_class(record: Dict) -> str:
+    """Intent shape of a query: ``intent/category/brand-count → path``."""
+    brands = len(record.get("brands") or [])
+    return (f"{record.get('intent') or 'search'}/{record.get('cat') or '-'}"
+            f"/{brands}b → {record.get('path')}")
+
+
+def report(records: Sequence[Dict], top: int = 20) -> Dict:
+    """Hottest and slowest query classes, and the hottest raw queries."""
+    by_class: Dict[str, List[float]] = defaultdict(list)
+    for r in records:
+        by_class[query_class(r)].append(r["ms"])
+    classes = [{"class": c, "count": len(ms), "p50_ms": _percentile(ms, 50),
+                "p95_ms": _percentile(ms, 95), "total_ms": round(sum(ms), 1)}
+               for c, ms in by_class.items()]
+    return {
+        "records": len(records),
+        "hottest_classes": sorted(classes, key=lambda c: -c["count"])[:top],
+        "slowest_classes": sorted(classes, key=lambda c: -c["p95_ms"])[:top],
+        "hottest_queries": hot_queries(records, top),
+        "paths": dict(Tally(r["path"] for r in records).most_common()),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Warm-up replay
+# ---------------------------------------------------------------------------
+
+def replay(engine=None, top: int = QUERY_LOG_REPLAY,
+           records: Optional[Sequence[Dict]] = None) -> Dict:
+    """
+    Run the hottest logged queries through *engine* (default: a local
+    RAGEngine without live web calls) and format their answers. Queries that
+    last ended on the web, or found nothing (the engine would fall back to
+    the web), only warm the local web snapshot, so a replay is not a burst
+    of Tavily calls even through a web-enabled engine or worker pool.
+    """
+    from formatter import format_result
+    from web_knowledge import lookup
+
+    if engine is None:
+        from rag_engine import RAGEngine
+        engine = RAGEngine(use_web_fallback=False)
+    hot = hot_queries(read_records() if records is None else records, top)
+    start = time.perf_counter()
+    searched = web = 0
+    with muted():  # replayed traffic must not make itself hotter
+        for item in hot:
+            if item["path"] in ("web", "none"):
+                lookup(item["q"])
+                web += 1
+            else:
+                format_result(engine.search(item["q"]))
+                searched += 1
+    stats = {"replayed": searched, "web_lookups": web,
+             "ms": round((time.perf_counter() - start) * 1000, 1)}
+    logger.info("Query replay: %s", stats)
+    return stats
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+def _print_report(rep: Dict) -> None:
+    print(f"{rep['records']} records; paths: {rep['paths']}")
+    for title, key in (("Hottest query classes", "hottest_classes"),
+                       ("Slowest query classes (p95)", "slowest_classes")):
+        print(f"\n{title}:")
+        print(f"  {'count':>6} {'p50 ms':>8} {'p95 ms':>8}  class")
+        for c in rep[key]:
+            print(f"  {c['count']:>6} {c['p50_ms']:>8} {c['p95_ms']:>8}  {c['class']}")
+    print("\nHottest queries:")
+    for h in rep["hottest_queries"]:
+        print(f"  {h['count']:>6}  {h['q']}  ({h['path']})")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query log tools")
+    parser.add_argument("command", choices=["report", "hot"])
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    recs = read_records()
+    out = report(recs, args.top) if args.command == "report" else hot_queries(recs, args.top)
+    if args.json or args.command == "hot":
+        print(json.dumps(out, ensure_ascii=False, indent=2))
+    else:
+        _print_report(out)
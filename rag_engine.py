@@ -1,19 +1,106 @@
 """
 VIVOHOME AI - RAG Engine
-Orchestrates: Intent Parsing → Semantic Search → Database Search → Web Fallback.
+Orchestrates: Intent Parsing → Database Search → Fuzzy Match → Semantic Search
+→ Web Fallback.
 """
 
-from typing import Dict, List, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Callable, Dict, List, Optional
 
-from app_config import SIMILARITY_THRESHOLD, MAX_SEARCH_RESULTS
+from app_config import (FUZZY_ENABLED, MAX_SEARCH_RESULTS, SEARCH_BUDGET_MS,
+                        SESSION_MAX_CANDIDATES, SIMILARITY_THRESHOLD, SPECULATIVE_WEB,
+                        SPECULATIVE_WEB_SIMILARITY, SPECULATIVE_WEB_SLOTS,
+                        WEB_SEARCH_CONCURRENCY)
 from query_parser import parse_query
-from database import search_with_intent
-from vector_store import semantic_search
+from database import search_with_intent, search_with_intent_many
+from formatter import format_result
+from fuzzy_index import fuzzy_search
+from normalizer import normalize
+import overload
+import querylog
+from overload import BUSY, DB_ONLY, NO_WEB, Overloaded
+from singleflight import SingleFlight
+from vector_store import PriceRange, semantic_search, semantic_search_many
 from web_search import web_search
 from logger import get_logger
+from metrics import (BUDGET_EXCEEDED, FALLBACKS, REQUESTS, SPECULATIVE_WEB_CALLS,
+                     UPSTREAM_ERRORS, span, trace_request)
 
 logger = get_logger("rag")
 
+# Shared by every engine for single-query web calls under a latency budget.
+# Speculative calls get their own, smaller pool: one made redundant by a
+# local hit keeps running until its upstream answers, and must not hold a
+# thread that a needed fallback is waiting for.
+_web_pool: Optional[ThreadPoolExecutor] = None
+_spec_pool: Optional[ThreadPoolExecutor] = None
+_spec_slots = threading.BoundedSemaphore(max(SPECULATIVE_WEB_SLOTS, 1))
+_web_pool_lock = threading.Lock()
+
+# Concurrent identical searches share one pipeline run
+_search_flight = SingleFlight("search")
+
+
+def busy_result(query: str) -> Dict:
+    """Overloaded: a recent answer to the same query, else a busy reply."""
+    cached = overload.controller.recall(query)
+    if cached is not None:
+        overload.degraded("cached")
+        cached["degraded"] = ["cached"]
+        return cached
+    overload.degraded("busy")
+    return {"found": False, "busy": True, "intent": parse_query(query),
+            "products": [], "web_results": None, "sources": [], "degraded": ["busy"]}
+
+
+def admit(query: str, run: Callable[[int], Dict]) -> Dict:
+    """
+    One request under this process's overload controller: *run(level)* at
+    the admitted load level, or a cached/"busy" answer once busy. Front ends
+    that hand searches to other processes (worker_pool) admit them here, so
+    the load level reflects every request the process is waiting on.
+    """
+    with overload.controller.request() as level:
+        if level >= BUSY:
+            return busy_result(query)
+        result = run(level)
+        overload.controller.remember(query, result)
+        return result
+
+
+def _get_web_pool(speculative: bool = False) -> ThreadPoolExecutor:
+    global _web_pool, _spec_pool
+    with _web_pool_lock:
+        if speculative:
+            if _spec_pool is None:
+                _spec_pool = ThreadPoolExecutor(max_workers=max(SPECULATIVE_WEB_SLOTS, 1),
+                                                thread_name_prefix="web-spec")
+            return _spec_pool
+        if _web_pool is None:
+            _web_pool = ThreadPoolExecutor(max_workers=WEB_SEARCH_CONCURRENCY,
+                                           thread_name_prefix="web")
+        return _web_pool
+
+
+class _WebCall:
+    """A web_search on a pool thread that can be called off."""
+
+    def __init__(self, query: str, speculative: bool = False):
+        self.cancelled = threading.Event()
+        self.future = _get_web_pool(speculative).submit(web_search, query, 3,
+                                                       cancelled=self.cancelled)
+
+    def cancel(self) -> bool:
+        """
+        Stop the call: not started → never runs; running → stops before the
+        paid live request if it hasn't reached it. False if already finished.
+        """
+        self.cancelled.set()
+        return self.future.cancel() or not self.future.done()
+
 
 class RAGEngine:
     """
@@ -21,77 +108,352 @@ class RAGEngine:
 
     Pipeline order:
         1. Parse intent (rule-based)
-        2. Semantic search (ChromaDB embeddings)
-        3. Database search (SQLite keyword/intent)
-        4. Web search fallback (Tavily API)
-        5. Format response
+        2. Database search (SQLite keyword/intent)
+        3. Fuzzy name/model match (typos, missing accents)
+        4. Semantic search (ChromaDB embeddings)
+        5. Web search fallback (Tavily API)
+        6. Format response
+
+    Speculation (``speculation``) starts step 5 early when the local stages
+    are unlikely to answer, and cancels it once they do:
+        off        — strictly sequential
+        generic    — at parse time for generic queries (no category/brand),
+                     and before semantic search when the fuzzy stage's best
+                     similarity is weak (SPECULATIVE_WEB_SIMILARITY)
+        aggressive — also as soon as the database stage misses
+    Early calls run on a pool of their own (SPECULATIVE_WEB_SLOTS) and are
+    skipped when it is full or the remaining budget can't cover one.
+    ``budget_ms`` caps the whole request, from arrival: stages that would
+    start past the deadline are skipped, a web call still pending at the
+    deadline is abandoned, and the request returns what it has.
+
+    Under load (overload.py) a request skips the web fallback, then
+    semantic search, and finally gets a cached or "busy" answer. Identical
+    concurrent searches run once and share the result (singleflight.py).
     """
 
-    def __init__(self, *, use_web_fallback: bool = True, use_semantic: bool = True):
+    def __init__(self, *, use_web_fallback: bool = True, use_semantic: bool = True,
+                 use_fuzzy: bool = FUZZY_ENABLED,
+                 semantic_backend: Optional[Callable[..., Dict]] = None,
+                 semantic_backend_many: Optional[Callable[..., List[Dict]]] = None,
+                 speculation: str = SPECULATIVE_WEB, budget_ms: int = SEARCH_BUDGET_MS):
+        if speculation not in ("off", "generic", "aggressive"):
+            raise ValueError(f"unknown speculation mode: {speculation!r}")
         self.use_web_fallback = use_web_fallback
         self.use_semantic = use_semantic
-        logger.info("RAG Engine initialized (semantic=%s, web=%s)",
-                     use_semantic, use_web_fallback)
+        self.use_fuzzy = use_fuzzy
+        self.speculation = speculation if use_web_fallback else "off"
+        self.budget_ms = budget_ms
+        # Same signature as vector_store.semantic_search; worker processes
+        # pass a proxy to the shared embedding server instead. The batch form
+        # mirrors semantic_search_many; without it a backend is called per query.
+        self.semantic_backend = semantic_backend or semantic_search
+        self.semantic_backend_many = semantic_backend_many
+        logger.info("RAG Engine initialized (fuzzy=%s, semantic=%s, web=%s)",
+                     use_fuzzy, use_semantic, use_web_fallback)
 
     # ------------------------------------------------------------------
     # Search
     # ------------------------------------------------------------------
 
-    def search(self, query: str, max_results: int = MAX_SEARCH_RESULTS) -> Dict:
-        """Run the full search pipeline and return raw results."""
+    def search(self, query: str, max_results: int = MAX_SEARCH_RESULTS, *,
+               with_candidates: bool = False, level: Optional[int] = None) -> Dict:
+        """
+        Run the full search pipeline and return raw results. With
+        *with_candidates*, a category search also returns its candidate rows
+        (``"candidates"``) for in-memory follow-ups (see session_store.py).
+        *level* is the load level a front end already admitted the request
+        at (worker_pool); None admits it in this process.
+        """
+        deadline = time.monotonic() + self.budget_ms / 1000 if self.budget_ms else None
+        with trace_request() as trace:
+            result = _search_flight.do(
+                (id(self), normalize(query), max_results, with_candidates),
+                self._admitted_search, query, max_results, with_candidates, level, deadline)
+        result["request_id"] = trace.request_id
+        REQUESTS.inc(source=(result["sources"] or ["none"])[-1])
+        logger.info("  Trace %s", trace.summary())
+        querylog.record(query, result, trace.duration_ms)
+        return result
+
+    def _admitted_search(self, query: str, max_results: int, with_candidates: bool,
+                         level: Optional[int], deadline: Optional[float]) -> Dict:
+        if level is not None:
+            return self._search(query, max_results, with_candidates, level, deadline)
+        return admit(query, lambda lvl: self._search(query, max_results, with_candidates,
+                                                     lvl, deadline))
+
+    def _search(self, query: str, max_results: int, with_candidates: bool = False,
+                level: int = 0, deadline: Optional[float] = None) -> Dict:
         logger.info("RAG search: '%s'", query[:80])
+        use_web = self.use_web_fallback and level < NO_WEB
+        use_semantic = self.use_semantic and level < DB_ONLY
+        speculation = self.speculation if use_web else "off"
+        skipped: List[str] = []
 
-        intent = parse_query(query)
+        with span("parse"):
+            intent = parse_query(query)
         logger.info("  Intent=%s  Category=%s  Brands=%s",
                      intent["intent"], intent["category"], intent.get("brands"))
 
         results: List[Dict] = []
         sources: List[str] = []
+        candidates = next_cursor = None
+        stage = None
+        web_call: Optional[_WebCall] = None
 
-        # Strategy: if intent has category/brands/compare → DB first, semantic fallback
-        #           if generic query → keyword check first, web fallback if not found
-        use_db_first = (
-            intent["intent"] in ("compare", "highest_price", "lowest_price")
-            or intent.get("category")
-            or intent.get("brands")
-        )
-
-        if use_db_first:
+        if self._use_db_first(intent):
             # 1a. Database search (structured, precise)
-            results, sources = self._database_search(query, intent, max_results)
-            # 1b. Semantic fallback if DB found nothing
-            if not results and self.use_semantic:
-                results, sources = self._semantic_search(query, max_results)
+            results, sources, candidates, next_cursor = self._database_search(
+                query, intent, max_results,
+                SESSION_MAX_CANDIDATES if with_candidates else 0)
+            stage = "database"
+            if not results and speculation == "aggressive":
+                web_call = self._start_web(query, deadline)
         else:
-            # Generic query (no category/brand/intent)
-            # Try semantic search — if nothing good, go straight to web
-            # Do NOT fall back to DB (stop words like "giá" match everything)
-            if self.use_semantic:
-                results, sources = self._semantic_search(query, max_results)
+            # Generic queries (no category/brand/intent) skip the DB —
+            # stop words like "giá" match everything — and often end on the web
+            if speculation != "off":
+                web_call = self._start_web(query, deadline)
+
+        # 1b. Fuzzy match: every query token must resemble a name/model term
+        best = None
+        if not results and self.use_fuzzy:
+            if stage:
+                FALLBACKS.inc(from_stage=stage, to_stage="fuzzy")
+            results, sources, best = self._fuzzy_search(query, max_results)
+            stage = "fuzzy"
+
+        # 1c. Semantic search — if nothing good, go straight to web
+        if not results and use_semantic and self._budget_spent(deadline, "semantic"):
+            skipped.append("semantic")
+        elif not results and use_semantic:
+            if (web_call is None and speculation != "off" and best is not None
+                    and best < SPECULATIVE_WEB_SIMILARITY):
+                # Nothing in the catalog even looks like the query
+                web_call = self._start_web(query, deadline)
+            if stage:
+                FALLBACKS.inc(from_stage=stage, to_stage="semantic")
+            try:
+                results, sources = self._semantic_search(query, max_results, deadline)
+            except Overloaded:
+                skipped.append("semantic")  # shed: answer without it
             if not results:
-                logger.info("  Generic query, no good semantic match → web fallback")
+                logger.info("  No good semantic match → web fallback")
+        elif not results and self.use_semantic:
+            overload.degraded("skip_semantic")
+            skipped.append("semantic")
 
         # 2. Web fallback
         web_results = None
-        if not results and self.use_web_fallback:
+        if results and web_call is not None:
+            # Local stages answered: drop the speculative call
+            outcome = "cancelled" if web_call.cancel() else "wasted"
+            SPECULATIVE_WEB_CALLS.inc(outcome=outcome)
+            logger.info("  Speculative web call %s", outcome)
+        elif not results and self.use_web_fallback and not use_web:
+            overload.degraded("skip_web")
+            skipped.append("web")
+        elif not results and self.use_web_fallback:
             logger.info("  Trying web search...")
-            web_result = web_search(query, max_results=3)
+            FALLBACKS.inc(from_stage=sources[-1] if sources else "local", to_stage="web")
+            if web_call is not None:
+                SPECULATIVE_WEB_CALLS.inc(outcome="used")
+            with span("web") as sp:
+                web_result = self._finish_web(query, web_call, deadline)
+                sp.count = web_result.get("count", 0)
             if web_result.get("found"):
                 web_results = web_result["results"]
                 sources.append("web")
                 logger.info("  Web: %d results", len(web_results))
 
-        return {
+        result = {
             "found": bool(results) or web_results is not None,
             "intent": intent,
             "products": results[:max_results],
             "web_results": web_results,
             "sources": sources,
         }
+        if with_candidates:
+            result["candidates"] = candidates
+        if next_cursor and sources == ["database"]:
+            result["next_cursor"] = next_cursor  # more of this listing; see session_store
+        if skipped:
+            result["degraded"] = skipped
+        return result
+
+    def search_many(self, queries: List[str], max_results: int = MAX_SEARCH_RESULTS, *,
+                    level: Optional[int] = None) -> List[Dict]:
+        """
+        Batch form of search() for offline jobs. Shares one SQLite read,
+        one embedding pass and one multi-query vector search across all
+        queries, and runs web fallbacks concurrently (WEB_SEARCH_CONCURRENCY).
+        Results are returned in input order. The batch is admitted as one
+        request and degrades as a whole (*level* as in search()).
+        """
+        if level is None:
+            with overload.controller.request() as level:
+                return self.search_many(queries, max_results, level=level)
+        if level >= BUSY:
+            return [busy_result(q) for q in queries]
+        use_web = self.use_web_fallback and level < NO_WEB
+        use_semantic = self.use_semantic and level < DB_ONLY
+        n = len(queries)
+        results: List[List[Dict]] = [[] for _ in range(n)]
+        sources: List[List[str]] = [[] for _ in range(n)]
+        web_results: List[Optional[List[Dict]]] = [None] * n
+
+        with trace_request() as trace:
+            logger.info("RAG batch search: %d queries", n)
+            with span("parse"):
+                intents = [parse_query(q) for q in queries]
+
+            # 1. Database — grouped by intent inside search_with_intent_many
+            db_idx = [i for i in range(n) if self._use_db_first(intents[i])]
+            if db_idx:
+                with span("database") as sp:
+                    db_results = search_with_intent_many(
+                        [(queries[i], intents[i]) for i in db_idx], max_results)
+                    sp.count = sum(r.get("count", 0) for r in db_results)
+                for i, db_result in zip(db_idx, db_results):
+                    results[i], sources[i] = self._tag_db_products(db_result)
+
+            # 2. Fuzzy — cheap, in-process, per query
+            fuzzy_idx = [i for i in range(n) if not results[i]] if self.use_fuzzy else []
+            if fuzzy_idx:
+                db_misses = len(set(fuzzy_idx) & set(db_idx))
+                if db_misses:
+                    FALLBACKS.inc(db_misses, from_stage="database", to_stage="fuzzy")
+                for i in fuzzy_idx:
+                    results[i], sources[i], _ = self._fuzzy_search(queries[i], max_results)
+
+            # 3. Semantic — every query still empty, in one batch
+            sem_idx = [i for i in range(n) if not results[i]] if use_semantic else []
+            if sem_idx:
+                from_stage = "fuzzy" if self.use_fuzzy else "database"
+                misses = len(sem_idx) if self.use_fuzzy else len(set(sem_idx) & set(db_idx))
+                if misses:
+                    FALLBACKS.inc(misses, from_stage=from_stage, to_stage="semantic")
+                sem_results = self._semantic_search_many([queries[i] for i in sem_idx],
+                                                         max_results)
+                for i, sem_result in zip(sem_idx, sem_results):
+                    results[i], sources[i] = self._filter_semantic(sem_result)
+
+            # 4. Web — bounded concurrency
+            web_idx = [i for i in range(n) if not results[i]] if use_web else []
+            if web_idx:
+                FALLBACKS.inc(len(web_idx), from_stage="local", to_stage="web")
+                with span("web") as sp, ThreadPoolExecutor(
+                        max_workers=min(WEB_SEARCH_CONCURRENCY, len(web_idx))) as pool:
+                    web_hits = list(pool.map(lambda i: web_search(queries[i], max_results=3),
+                                             web_idx))
+                    sp.count = sum(w.get("count", 0) for w in web_hits)
+                for i, web_result in zip(web_idx, web_hits):
+                    if web_result.get("found"):
+                        web_results[i] = web_result["results"]
+                        sources[i].append("web")
+
+        logger.info("  Trace %s", trace.summary())
+        skipped = [stage for stage, wanted, used in (("semantic", self.use_semantic, use_semantic),
+                                                     ("web", self.use_web_fallback, use_web))
+                   if wanted and not used]
+        if skipped and not all(results):
+            for stage in skipped:
+                overload.degraded(f"skip_{stage}")
+        out = []
+        for i in range(n):
+            REQUESTS.inc(source=(sources[i] or ["none"])[-1])
+            out.append({
+                "found": bool(results[i]) or web_results[i] is not None,
+                "intent": intents[i],
+                "products": results[i][:max_results],
+                "web_results": web_results[i],
+                "sources": sources[i],
+                "request_id": trace.request_id,
+            })
+            if skipped and not results[i]:
+                out[-1]["degraded"] = skipped
+        return out
+
+    def semantic_search_many(self, queries: List[str], n_results: int = MAX_SEARCH_RESULTS,
+                             price_range: Optional[PriceRange] = None) -> List[Dict]:
+        """
+        Raw vector_store.semantic_search_many (no threshold, no fallbacks)
+        through this engine's batch backend — for /v1/semantic.
+        """
+        if self.semantic_backend_many is not None:
+            return self.semantic_backend_many(queries, n_results=n_results,
+                                              price_range=price_range)
+        return semantic_search_many(queries, n_results=n_results, price_range=price_range)
+
+    @staticmethod
+    def _start_web(query: str, deadline: Optional[float]) -> Optional[_WebCall]:
+        """An early web call, unless the budget can't cover one or no slot is free."""
+        remaining_ms = (deadline - time.monotonic()) * 1000 if deadline is not None else None
+        if remaining_ms is not None and remaining_ms <= overload.controller.expected_ms("web"):
+            SPECULATIVE_WEB_CALLS.inc(outcome="skipped")
+            return None
+        if not _spec_slots.acquire(blocking=False):
+            SPECULATIVE_WEB_CALLS.inc(outcome="skipped")
+            return None
+        try:
+            call = _WebCall(query, speculative=True)
+        except BaseException:
+            _spec_slots.release()
+            raise
+        call.future.add_done_callback(lambda _: _spec_slots.release())
+        logger.info("  Speculative web call started")
+        return call
+
+    def _finish_web(self, query: str, call: Optional[_WebCall],
+                    deadline: Optional[float]) -> Dict:
+        """Wait for the web call (starting it if needed) within the deadline."""
+        if deadline is None:
+            return call.future.result() if call is not None else web_search(query, max_results=3)
+        if self._budget_spent(deadline, "web"):
+            if call is not None:
+                call.cancel()
+            return {"found": False, "error": "latency budget exhausted"}
+        if call is None:
+            call = _WebCall(query)
+        try:
+            return call.future.result(timeout=deadline - time.monotonic())
+        except FutureTimeout:
+            BUDGET_EXCEEDED.inc(stage="web")
+            call.cancel()
+            logger.warning("  Web search abandoned: %d ms budget spent", self.budget_ms)
+            return {"found": False, "error": "latency budget exhausted"}
+
+    @staticmethod
+    def _budget_spent(deadline: Optional[float], stage: str) -> bool:
+        """True (and counted) when *stage* would start past the request's deadline."""
+        if deadline is None or time.monotonic() < deadline:
+            return False
+        BUDGET_EXCEEDED.inc(stage=stage)
+        logger.warning("  Skipping %s: latency budget spent", stage)
+        return True
+
+    @staticmethod
+    def _use_db_first(intent: Dict) -> bool:
+        # Strategy: if intent has category/brands/compare → DB first, semantic fallback
+        #           if generic query → keyword check first, web fallback if not found
+        return bool(
+            intent["intent"] in ("compare", "highest_price", "lowest_price")
+            or intent.get("category")
+            or intent.get("brands")
+        )
 
-    def _database_search(self, query: str, intent: Dict, max_results: int):
+    def _database_search(self, query: str, intent: Dict, max_results: int,
+                         candidates: int = 0):
         """Run intent-based database search."""
-        db_result = search_with_intent(query, intent, max_results)
+        with span("database") as sp:
+            db_result = search_with_intent(query, intent, max_results, candidates)
+            sp.count = db_result.get("count", 0)
+        return (*self._tag_db_products(db_result), db_result.get("candidates"),
+                db_result.get("next_cursor"))
+
+    @staticmethod
+    def _tag_db_products(db_result: Dict):
         if db_result.get("found"):
             for p in db_result["products"]:
                 p["source"] = "database"
@@ -100,123 +462,84 @@ class RAGEngine:
             return db_result["products"], ["database"]
         return [], []
 
-    def _semantic_search(self, query: str, max_results: int):
+    @staticmethod
+    def _fuzzy_search(query: str, max_results: int):
+        """Run the typo-tolerant name/model index; also returns the best score."""
+        with span("fuzzy") as sp:
+            result = fuzzy_search(query, max_results)
+            sp.count = result.get("count", 0)
+        if result.get("found"):
+            for p in result["products"]:
+                p["source"] = "fuzzy"
+            logger.info("  Fuzzy: %d results", result["count"])
+            return result["products"], ["fuzzy"], result["products"][0]["similarity"]
+        return [], [], result.get("best", 0.0)
+
+    def _semantic_search(self, query: str, max_results: int,
+                         deadline: Optional[float] = None):
         """Run semantic search with threshold filtering."""
         try:
-            result = semantic_search(query, n_results=max_results)
-            if result.get("found"):
-                good = [p for p in result["products"]
-                        if p.get("similarity", 0) >= SIMILARITY_THRESHOLD]
-                if good:
-                    logger.info("  Semantic: %d/%d above threshold (%.1f)",
-                                len(good), len(result["products"]),
-                                SIMILARITY_THRESHOLD)
-                    return good, ["vector_db"]
-                else:
-                    logger.info("  Semantic: all %d results below threshold",
-                                len(result["products"]))
+            with overload.stage("semantic", deadline), span("semantic") as sp:
+                result = self.semantic_backend(query, n_results=max_results)
+                sp.count = result.get("count", 0)
+            return self._filter_semantic(result)
+        except Overloaded:
+            raise
         except Exception as exc:
+            UPSTREAM_ERRORS.inc(service="vector_store")
             logger.warning("  Semantic search failed: %s", exc)
         return [], []
 
-    # ------------------------------------------------------------------
-    # Response generation
-    # ------------------------------------------------------------------
-
-    def generate_response(self, query: str, search_result: Dict) -> str:
-        """Format search results into a user-friendly response."""
-        intent = search_result.get("intent", {})
-        products = search_result.get("products", [])
-        web_results = search_result.get("web_results")
-        sources = search_result.get("sources", [])
-
-        if products:
-            return self._format_product_response(intent, products, sources)
-        if web_results:
-            return self._format_web_response(web_results)
-        return self._format_no_results()
+    def _semantic_search_many(self, queries: List[str], max_results: int) -> List[Dict]:
+        """Batch semantic search; injected backends without a batch form go per query."""
+        try:
+            with overload.stage("semantic"), span("semantic") as sp:
+                if self.semantic_backend is semantic_search:
+                    batch = semantic_search_many(queries, n_results=max_results)
+                elif self.semantic_backend_many is not None:
+                    batch = self.semantic_backend_many(queries, n_results=max_results)
+                else:
+                    batch = [self.semantic_backend(q, n_results=max_results)
+                             for q in queries]
+                sp.count = sum(r.get("count", 0) for r in batch)
+            return batch
+        except Overloaded:
+            return [{"found": False} for _ in queries]
+        except Exception as exc:
+            UPSTREAM_ERRORS.inc(service="vector_store")
+            logger.warning("  Semantic search failed: %s", exc)
+            return [{"found": False} for _ in queries]
 
-    def process(self, query: str) -> str:
-        """Full RAG pipeline: search → generate response."""
-        return self.generate_response(query, self.search(query))
+    @staticmethod
+    def _filter_semantic(result: Dict):
+        """Keep semantic hits above SIMILARITY_THRESHOLD."""
+        if result.get("found"):
+            good = [p for p in result["products"]
+                    if p.get("similarity", 0) >= SIMILARITY_THRESHOLD]
+            if good:
+                logger.info("  Semantic: %d/%d above threshold (%.1f)",
+                            len(good), len(result["products"]),
+                            SIMILARITY_THRESHOLD)
+                return good, ["vector_db"]
+            logger.info("  Semantic: all %d results below threshold",
+                        len(result["products"]))
+        return [], []
 
     # ------------------------------------------------------------------
-    # Private formatters
+    # Response generation
     # ------------------------------------------------------------------
 
     @staticmethod
-    def _format_product_response(intent: Dict, products: List[Dict],
-                                 sources: List[str]) -> str:
-        intent_type = intent.get("intent", "search")
-        category = intent.get("category", "")
-        src_label = ", ".join(sources)
-
-        if intent_type == "highest_price":
-            p = products[0]
-            return (
-                f"💎 **Sản phẩm {category} giá cao nhất:**\n\n"
-                f"📦 **{p['ten']}**\n"
-                f"- Model: {p.get('model', 'N/A')}\n"
-                f"- Giá: **{p['gia']:,} VND**\n"
-                f"- Độ phù hợp: {p.get('similarity', 0.9)*100:.0f}%\n\n"
-                f"📍 Nguồn: {src_label}"
-            )
-
-        if intent_type == "lowest_price":
-            p = products[0]
-            return (
-                f"💰 **Sản phẩm {category} giá rẻ nhất:**\n\n"
-                f"📦 **{p['ten']}**\n"
-                f"- Model: {p.get('model', 'N/A')}\n"
-                f"- Giá: **{p['gia']:,} VND**\n"
-                f"- Độ phù hợp: {p.get('similarity', 0.9)*100:.0f}%\n\n"
-                f"📍 Nguồn: {src_label}"
-            )
-
-        if intent_type == "compare":
-            lines = [f"📊 **So sánh {category or 'sản phẩm'}:**\n"]
-            for i, p in enumerate(products[:5], 1):
-                lines.append(f"{i}. **{p['ten']}** ({p.get('model', 'N/A')})")
-                lines.append(f"   - Giá: **{p['gia']:,} VND**")
-                if p.get("similarity"):
-                    lines.append(f"   - Độ phù hợp: {p['similarity']*100:.0f}%")
-            lines.append(f"\n📍 Nguồn: {src_label}")
-            return "\n".join(lines)
-
-        # Default search
-        lines = ["📦 **Sản phẩm tìm được:**\n"]
-        for p in products[:5]:
-            sim = p.get("similarity", 0)
-            icon = "🟢" if sim > 0.7 else "🟡" if sim > 0.5 else "🔴"
-            lines.append(f"{icon} **{p['ten']}** ({p.get('model', 'N/A')})")
-            lines.append(f"   - Giá: **{p['gia']:,} VND**")
-        lines.append(f"\n📍 Nguồn: {src_label}")
-        return "\n".join(lines)
-
-    @staticmethod
-    def _format_web_response(web_results: List[Dict]) -> str:
-        lines = ["🌐 **Không tìm thấy trong kho VIVOHOME. Kết quả từ web:**\n"]
-        for r in web_results:
-            if r["type"] == "answer":
-                lines.append(f"💡 **Tóm tắt:** {r['content']}\n")
-            else:
-                lines.append(f"🔗 **{r['title']}**")
-                lines.append(f"   {r['content'][:150]}...")
-                if r.get("url"):
-                    lines.append(f"   [Xem thêm]({r['url']})")
-                lines.append("")
-        return "\n".join(lines)
-
-    @staticmethod
-    def _format_no_results() -> str:
-        return (
-            "❌ **Không tìm thấy sản phẩm**\n\n"
-            "Xin lỗi, tôi không tìm thấy sản phẩm phù hợp.\n"
-            "Bạn có thể thử:\n"
-            '- Mô tả sản phẩm khác đi\n'
-            '- Kiểm tra lại tên sản phẩm\n'
-            '- Hỏi cụ thể hơn (ví dụ: "TV Samsung 55 inch")'
-        )
+    def generate_response(query: str, search_result: Dict, structured: bool = False):
+        """
+        Format search results into a user-friendly markdown answer, or the
+        structured view (formatter.to_view) for client-side rendering.
+        """
+        return format_result(search_result, structured)
+
+    def process(self, query: str, structured: bool = False):
+        """Full RAG pipeline: search → generate response."""
+        return self.generate_response(query, self.search(query), structured)
 
 
 # ---------------------------------------------------------------------------
@@ -231,6 +554,12 @@ def rag_search(query: str) -> str:
     return rag_engine.process(query)
 
 
+def rag_search_many(queries: List[str]) -> List[str]:
+    """Batch variant of rag_search for offline jobs (prefill, evaluation)."""
+    return [rag_engine.generate_response(q, r)
+            for q, r in zip(queries, rag_engine.search_many(queries))]
+
+
 # ---------------------------------------------------------------------------
 # CLI test
 # ---------------------------------------------------------------------------
@@ -0,0 +1,243 @@
+"""
+VIVOHOME AI - Chat Sessions
+Per-session conversation state so follow-ups ("còn cái rẻ hơn không?",
+"so sánh với LG") refine the previous turn's candidate set in memory
+instead of re-running the whole search pipeline.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from app_config import MAX_SEARCH_RESULTS, SESSION_IDLE_TTL, SESSION_MAX
+from database import rank_candidates, search_price_range, search_with_intent
+from logger import get_logger
+from metrics import SESSION_EVICTIONS, SESSION_FOLLOWUPS, SESSIONS_ACTIVE, span
+from query_parser import parse_followup
+
+logger = get_logger("session")
+
+
+# ---------------------------------------------------------------------------
+# Session state
+# ---------------------------------------------------------------------------
+
+@dataclass
+class SessionState:
+    """What the last turn searched for and what it showed."""
+    intent: Optional[Dict] = None
+    candidates: Optional[List[Dict]] = None   # category rows; None over the cap
+    shown: List[Dict] = field(default_factory=list)
+    cursor: Optional[str] = None              # next page of a listing answer
+    last_active: float = field(default_factory=time.monotonic)
+
+
+class SessionStore:
+    """
+    Bounded session map: least-recently-used sessions are dropped beyond
+    *max_sessions*, and sessions idle longer than *idle_ttl* seconds are
+    swept on access.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_MAX, idle_ttl: float = SESSION_IDLE_TTL):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> SessionState:
+        """Return the session's state, creating it if needed."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = self._sessions[session_id] = SessionState()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    SESSION_EVICTIONS.inc(reason="capacity")
+            else:
+                self._sessions.move_to_end(session_id)
+            state.last_active = now
+            SESSIONS_ACTIVE.set(len(self._sessions))
+            return state
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            SESSIONS_ACTIVE.set(len(self._sessions))
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_idle(self, now: float) -> None:
+        # Oldest first, so stop at the first session that is still live
+        while self._sessions:
+            sid, state = next(iter(self._sessions.items()))
+            if now - state.last_active < self.idle_ttl:
+                break
+            del self._sessions[sid]
+            SESSION_EVICTIONS.inc(reason="idle")
+
+
+# ---------------------------------------------------------------------------
+# Conversational search
+# ---------------------------------------------------------------------------
+
+class ConversationalSearch:
+    """
+    Wraps a search engine (RAGEngine or SearchWorkerPool). Fresh queries go
+    through the engine; follow-ups are answered from the session's
+    candidates, or narrowed in the catalog when the last category had more
+    rows than SESSION_MAX_CANDIDATES, counted in SESSION_FOLLOWUPS.
+    """
+
+    def __init__(self, engine=None, store: Optional[SessionStore] = None):
+        if engine is None:
+            from rag_engine import rag_engine as engine
+        self.engine = engine
+        self.store = store or SessionStore()
+
+    def search(self, query: str, session_id: Optional[str] = None,
+               max_results: int = MAX_SEARCH_RESULTS) -> Dict:
+        if session_id is None:
+            return self.engine.search(query, max_results)
+
+        state = self.store.get(session_id)
+        followup = parse_followup(query)
+        if followup:
+            if followup["refine"] == "more" and state.intent is not None:
+                SESSION_FOLLOWUPS.inc(outcome="more")
+                with span("refine"):
+                    return self._more(state, max_results)
+            if followup["refine"] != "more" and state.shown and self._refinable(state):
+                SESSION_FOLLOWUPS.inc(outcome="refined")
+                with span("refine"):
+                    return self._refine(state, followup, query, max_results)
+            SESSION_FOLLOWUPS.inc(outcome="full_search")
+
+        result = self.engine.search(query, max_results, with_candidates=True)
+        if result.get("busy"):
+            return result  # keep the session's last answer for follow-ups
+        state.intent = result["intent"]
+        state.candidates = result.pop("candidates", None)
+        state.shown = result["products"]
+        state.cursor = result.get("next_cursor")
+        return result
+
+    def more(self, session_id: str, max_results: int = MAX_SEARCH_RESULTS) -> Dict:
+        """Next page of the session's last listing (the UI's "show more")."""
+        state = self.store.get(session_id)
+        if state.intent is None:
+            return {"found": False, "intent": {}, "products": [], "web_results": None,
+                    "sources": []}
+        SESSION_FOLLOWUPS.inc(outcome="more")
+        with span("refine"):
+            return self._more(state, max_results)
+
+    def process(self, query: str, session_id: Optional[str] = None,
+                structured: bool = False):
+        return self.engine.generate_response(query, self.search(query, session_id),
+                                             structured)
+
+    def process_more(self, session_id: str, structured: bool = False):
+        return self.engine.generate_response("", self.more(session_id), structured)
+
+    @staticmethod
+    def _more(state: SessionState, max_results: int) -> Dict:
+        """Seek the listing's keyset cursor: the page costs what page 1 did."""
+        intent = state.intent
+        page = ({"found": False} if state.cursor is None else
+                search_with_intent(intent.get("original_query", ""), intent, max_results,
+                                   cursor=state.cursor))
+        products = page.get("products", [])
+        for p in products:
+            p["source"] = "database"
+            p.setdefault("similarity", 0.8)
+        logger.info("  Show more: %d results", len(products))
+        state.cursor = page.get("next_cursor")
+        if products:
+            state.shown = products
+        return {
+            "found": bool(products),
+            "exhausted": not products,
+            "intent": intent,
+            "products": products,
+            "web_results": None,
+            "sources": ["database"] if products else [],
+            "next_cursor": state.cursor,
+        }
+
+    @staticmethod
+    def _refinable(state: SessionState) -> bool:
+        """Candidates to rank, or a category the catalog can narrow instead."""
+        return bool(state.candidates or
+                    (state.candidates is None and state.intent and state.intent.get("category")))
+
+    def _refine(self, state: SessionState, followup: Dict, query: str,
+                max_results: int) -> Dict:
+        prev = state.intent
+        refine = followup["refine"]
+        intent = {"intent": "search", "category": prev.get("category"),
+                  "brands": prev.get("brands"), "original_query": query}
+
+        rows = state.candidates
+        ref = state.shown[0]["gia"] or 0
+        cheaper = refine == "cheaper"
+        if refine in ("cheaper", "pricier") and rows is not None:
+            rows = [c for c in rows
+                    if ((c["gia"] or 0) < ref if cheaper else (c["gia"] or 0) > ref)]
+            # Nearest price first: the next cheaper / next pricier product
+            rows.sort(key=lambda c: c["gia"] or 0, reverse=cheaper)
+        elif refine == "compare":
+            brands = list(dict.fromkeys((prev.get("brands") or []) + followup["brands"]))
+            intent.update(intent="compare", brands=brands)
+        elif refine == "brand":
+            intent["brands"] = followup["brands"]
+
+        if rows is not None:
+            # cheaper/pricier rows are already nearest price first
+            ranked = rank_candidates(rows, intent, max_results,
+                                     keep_order=refine in ("cheaper", "pricier"))
+        elif refine in ("cheaper", "pricier"):
+            # Category over the candidate cap: the same cut, on the catalog listing
+            ranked = search_price_range(intent, max_results,
+                                        below=ref if cheaper else None,
+                                        above=None if cheaper else ref)
+        else:
+            ranked = search_with_intent(query, intent, max_results)
+        products = ranked.get("products", [])
+        if refine == "compare" and not prev.get("brands") and products:
+            # "so sánh với LG" after an unbranded answer: compare against it
+            anchor = {k: v for k, v in state.shown[0].items() if k != "source"}
+            products = [anchor] + [p for p in products
+                                   if p["model"] != anchor["model"]][:max_results - 1]
+        for p in products:
+            p["source"] = "session"
+            p.setdefault("similarity", 0.8)
+        logger.info("  Follow-up '%s' refined in session: %d results", refine, len(products))
+
+        state.intent = intent
+        state.cursor = ranked.get("next_cursor")  # only a catalog brand listing pages
+        if products:
+            state.shown = products
+        return {
+            "found": bool(products),
+            "intent": intent,
+            "products": products,
+            "web_results": None,
+            "sources": ["session"] if products else [],
+        }
+
+
+# ---------------------------------------------------------------------------
+# CLI test
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    chat = ConversationalSearch()
+    for q in ["Tủ lạnh giá cao nhất", "còn cái rẻ hơn không?", "so sánh với Panasonic"]:
+        print(f"\n> {q}")
+        print(chat.process(q, session_id="cli"))
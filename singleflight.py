@@ -0,0 +1,98 @@
+"""
+VIVOHOME AI - Single-Flight Calls
+Coalesces concurrent identical calls: the first caller for a key runs the
+function, callers arriving while it is in flight wait and share its result
+(or exception). Nothing is kept once the call returns — this is not a cache,
+it only stops a burst of identical queries from each doing the same work.
+"""
+
+import copy
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from app_config import SINGLE_FLIGHT_ENABLED
+from logger import get_logger
+from metrics import COALESCED
+
+logger = get_logger("singleflight")
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Per-call-site group of in-flight calls. Followers get a deep copy of
+    the leader's result, so callers may mutate what they receive.
+    """
+
+    def __init__(self, name: str, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.name = name
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs):
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            COALESCED.inc(call=self.name)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.debug("%s: %d callers shared one call", self.name, call.waiters + 1)
+                # Copy before the leader's caller can mutate the result
+                call.result = copy.deepcopy(call.result)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+# ---------------------------------------------------------------------------
+# CLI test
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    runs = []
+
+    def slow_lookup(q: str) -> Dict:
+        runs.append(q)
+        time.sleep(0.2)
+        return {"query": q}
+
+    group = SingleFlight("demo", enabled=True)
+    with ThreadPoolExecutor(32) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda i: group.do("tv", slow_lookup, "tv"), range(32)))
+    print(f"32 callers, {len(runs)} execution(s), {(time.perf_counter() - start) * 1000:.0f} ms")
@@ -36,6 +36,18 @@ else
     echo "✅ Database already exists"
 fi
 
+# Export the ONNX embedding model once when that backend is selected
+if [ "$EMBEDDING_BACKEND" = "onnx" ] && [ ! -f "${EMBEDDING_ONNX_DIR:-onnx_model}/manifest.json" ]; then
+    echo "🧮 Exporting ONNX embedding model..."
+    python3 embeddings.py export
+fi
+
+# Build the catalog artifact if one is configured (no-op when up to date)
+if [ -n "$CATALOG_ARTIFACT_DIR" ]; then
+    echo "🗂️  Building catalog artifact..."
+    python3 catalog_build.py build
+fi
+
 # Run Gradio app
 echo "🌐 Starting Gradio app..."
 python3 app.py
@@ -0,0 +1,121 @@
+"""
+VIVOHOME AI - Startup & Warm-up
+Loads heavy dependencies in a background thread once the UI is serving,
+and exposes a readiness signal for health checks.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app_config import QUERY_LOG_REPLAY, WARMUP_SEMANTIC
+from logger import get_logger
+from metrics import READY
+
+logger = get_logger("startup")
+
+_steps: List[Tuple[str, Callable[[], None]]] = []
+_status: Dict = {"state": "cold", "steps": {}}
+_ready = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+# ---------------------------------------------------------------------------
+# Warm-up steps
+# ---------------------------------------------------------------------------
+
+def register_warmup_step(name: str, fn: Callable[[], None]) -> None:
+    """
+    Add a step to the warm-up sequence (runs in registration order).
+    Registering an existing name replaces that step in place.
+    """
+    for i, (existing, _) in enumerate(_steps):
+        if existing == name:
+            _steps[i] = (name, fn)
+            return
+    _steps.append((name, fn))
+
+
+def _warm_database() -> None:
+    from database import get_connection
+    with get_connection() as conn:
+        conn.execute("SELECT COUNT(*) FROM products").fetchone()
+
+
+def _warm_fuzzy_index() -> None:
+    from fuzzy_index import get_index
+    get_index()
+
+
+def _warm_facet_index() -> None:
+    from facets import get_index
+    get_index()
+
+
+def _warm_vector_store() -> None:
+    from vector_store import warm_up
+    warm_up()
+
+
+def _replay_queries() -> None:
+    from querylog import replay
+    replay()
+
+
+register_warmup_step("database", _warm_database)
+register_warmup_step("fuzzy_index", _warm_fuzzy_index)
+register_warmup_step("facet_index", _warm_facet_index)
+if WARMUP_SEMANTIC:
+    register_warmup_step("vector_store", _warm_vector_store)
+if QUERY_LOG_REPLAY > 0:
+    # Last, so the hottest queries run against loaded indexes before /ready
+    register_warmup_step("query_replay", _replay_queries)
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def run_warmup() -> Dict:
+    """
+    Run every warm-up step in order. A failing step is logged and skipped —
+    the app still serves (e.g. DB-only when chromadb is unavailable).
+    """
+    _status["state"] = "warming"
+    started = time.perf_counter()
+    for name, fn in _steps:
+        t0 = time.perf_counter()
+        try:
+            fn()
+            _status["steps"][name] = {"ok": True, "ms": round((time.perf_counter() - t0) * 1000, 1)}
+        except Exception as exc:
+            _status["steps"][name] = {"ok": False, "error": str(exc)}
+            logger.warning("Warm-up step '%s' failed: %s", name, exc)
+    _status["state"] = "ready"
+    _status["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    READY.set(1)
+    _ready.set()
+    logger.info("Warm-up finished in %.0f ms: %s", _status["ms"], _status["steps"])
+    return status()
+
+
+def start_warmup() -> threading.Thread:
+    """Run the warm-up sequence on a daemon thread (idempotent)."""
+    global _thread
+    if _thread is None:
+        _thread = threading.Thread(target=run_warmup, name="warmup", daemon=True)
+        _thread.start()
+    return _thread
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+def wait_until_ready(timeout: Optional[float] = None) -> bool:
+    return _ready.wait(timeout)
+
+
+def status() -> Dict:
+    return {"state": _status["state"], "ms": _status.get("ms"),
+            "steps": dict(_status["steps"])}
@@ -18,6 +18,21 @@ def setup_database():
     yield
     # Cleanup not needed - keep DB for future tests
 
+
+@pytest.fixture(scope="session", autouse=True)
+def mute_query_log():
+    """Keep test searches out of the production query log (and its replay)"""
+    import querylog
+    enabled, env = querylog.query_log.enabled, os.environ.get("QUERY_LOG_ENABLED")
+    querylog.query_log.enabled = False
+    os.environ["QUERY_LOG_ENABLED"] = "false"  # subprocesses and spawned workers
+    yield
+    querylog.query_log.enabled = enabled
+    if env is None:
+        os.environ.pop("QUERY_LOG_ENABLED", None)
+    else:
+        os.environ["QUERY_LOG_ENABLED"] = env
+
 # ============================================================
 # TEST 1: Query Parser - Intent Detection
 # ============================================================
@@ -233,6 +248,2141 @@ class TestPerformance:
         avg_time = elapsed / 100
         assert avg_time < 0.01, f"Intent parsing took {avg_time*1000:.2f}ms, should be < 10ms"
 
+# ============================================================
+# TEST 6: Benchmark Harness
+# ============================================================
+
+class TestBenchmark:
+    """Test benchmark helpers (stats, synthetic catalog, regression diff)"""
+
+    def test_percentile(self):
+        """Test: Percentiles interpolate between samples"""
+        from benchmark import percentile
+        values = list(range(1, 101))
+        assert percentile(values, 50) == pytest.approx(50.5)
+        assert percentile(values, 99) == pytest.approx(99.01)
+        assert percentile([], 95) == 0.0
+
+    def test_generate_catalog(self, tmp_path):
+        """Test: Synthetic catalog has the requested size and unique models"""
+        import sqlite3
+        from benchmark import generate_catalog
+        db_path = str(tmp_path / "bench.db")
+        generate_catalog(500, db_path)
+        conn = sqlite3.connect(db_path)
+        count, models = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT model) FROM products").fetchone()
+        conn.close()
+        assert count == 500
+        assert models == 500, "Synthetic rows should not duplicate model codes"
+
+    def test_compare_flags_regressions(self):
+        """Test: Only metrics beyond tolerance are reported"""
+        from benchmark import compare
+        base = {"results": {"parse_query": {"p50_ms": 1.0, "p95_ms": 2.0, "p99_ms": 3.0}}}
+        cur = {"results": {"parse_query": {"p50_ms": 1.05, "p95_ms": 3.0, "p99_ms": 3.0}}}
+        lines = compare(cur, base, tolerance=10)
+        assert len(lines) == 1 and lines[0].startswith("parse_query.p95_ms")
+
+    def test_suite_is_not_query_logged(self, tmp_path, monkeypatch):
+        """Test: Benchmark searches never reach the query log (or its replay)"""
+        import querylog
+        from benchmark import run_suite
+        log = querylog.QueryLog(str(tmp_path / "queries.jsonl"), enabled=True)
+        monkeypatch.setattr(querylog, "query_log", log)
+        run_suite(["TV giá cao nhất"], iterations=1, concurrency=2, duration=0.1,
+                  only=["rag_engine.search"])
+        log.flush()
+        assert querylog.read_records(log.path) == [] and log.enabled
+
+    def test_rows_ignore_published_artifact(self, tmp_path, monkeypatch):
+        """Test: --rows benchmarks the synthetic DB even with CATALOG_ARTIFACT_DIR set"""
+        import benchmark
+        import catalog
+        from catalog_build import build_artifact
+        out = str(tmp_path / "art")
+        build_artifact(TestCatalogArtifact._csv(tmp_path / "a.csv", ("Quạt A", "QA1", 100)), out)
+        monkeypatch.setattr(catalog, "CATALOG_ARTIFACT_DIR", out)
+        sizes = []
+        monkeypatch.setattr(benchmark, "run_suite",
+                            lambda *a, **k: sizes.append(catalog.get_catalog().size) or {})
+        benchmark.main(["--rows", "300", "--no-startup", "--output", str(tmp_path / "r.json")])
+        assert sizes == [300] and catalog.get_catalog().size == 1
+
+# ============================================================
+# TEST 7: Tracing & Metrics
+# ============================================================
+
+class TestMetrics:
+    """Test per-request tracing and Prometheus exposition"""
+
+    def test_spans_attach_to_trace(self):
+        """Test: Spans opened inside a trace are recorded with counts"""
+        from metrics import span, trace_request
+        with trace_request() as trace:
+            with span("unit_stage") as sp:
+                sp.count = 3
+        assert [s.stage for s in trace.spans] == ["unit_stage"]
+        assert trace.to_dict()["spans"][0]["count"] == 3
+        assert trace.duration_ms >= trace.spans[0].duration_ms
+
+    def test_prometheus_rendering(self):
+        """Test: Histogram buckets are cumulative and labelled"""
+        from metrics import Histogram, render_prometheus
+        registry = []
+        h = Histogram("vivohome_test_latency_ms", "test", ["stage"], buckets=(1, 10),
+                      registry=registry)
+        h.observe(0.5, stage="a")
+        h.observe(5, stage="a")
+        text = render_prometheus(registry)
+        assert 'vivohome_test_latency_ms_bucket{stage="a",le="1"} 1' in text
+        assert 'vivohome_test_latency_ms_bucket{stage="a",le="+Inf"} 2' in text
+        assert 'vivohome_test_latency_ms_count{stage="a"} 2' in text
+        assert "vivohome_test_latency_ms" not in render_prometheus()
+
+    def test_worker_deltas_merge(self):
+        """Test: Values drained in a worker add up in the front end's metrics"""
+        from metrics import Counter, Gauge, Histogram, drain, merge
+        worker, front = [], []
+        for registry in (worker, front):
+            Counter("t_total", "t", ["stage"], registry=registry)
+            Histogram("t_ms", "t", buckets=(1, 10), registry=registry)
+            Gauge("t_gauge", "t", registry=registry)
+        w_count, w_hist, w_gauge = worker
+        f_count, f_hist, f_gauge = front
+        f_count.inc(stage="a")
+        f_hist.observe(5)
+        for _ in range(2):  # two results shipped back
+            w_count.inc(2, stage="a")
+            w_hist.observe(0.5)
+            w_gauge.set(7)
+            merge(drain(worker), front)
+        assert f_count.value(stage="a") == 5 and f_hist.count() == 3
+        assert f_gauge.value() == 0 and w_count.value(stage="a") == 0
+        assert drain(worker) == {}
+
+    def test_pool_merges_worker_metrics(self, monkeypatch):
+        """Test: The pool folds a worker's stage latencies into its own"""
+        from concurrent.futures import Future
+        import worker_pool
+        from metrics import STAGE_LATENCY
+        from rag_engine import RAGEngine
+        from singleflight import SingleFlight
+        monkeypatch.setattr(worker_pool, "_engine",
+                            RAGEngine(use_web_fallback=False, use_semantic=False))
+
+        class Executor:  # runs the worker function in this process
+            def submit(self, fn, *args):
+                done = Future()
+                done.set_result(fn(*args))
+                return done
+        pool = worker_pool.SearchWorkerPool.__new__(worker_pool.SearchWorkerPool)
+        pool.workers, pool._executor, pool._flight = 1, Executor(), SingleFlight("t")
+        before = STAGE_LATENCY.count(stage="parse")
+        assert pool.search("TV giá cao nhất")["found"]
+        # drained in the "worker", then merged back: nothing lost
+        assert STAGE_LATENCY.count(stage="parse") == before + 1
+
+    def test_rag_search_has_request_id(self):
+        """Test: RAGEngine.search tags results and records stage latency"""
+        from metrics import STAGE_LATENCY
+        from rag_engine import RAGEngine
+        engine = RAGEngine(use_web_fallback=False, use_semantic=False)
+        before = STAGE_LATENCY.count(stage="database")
+        result = engine.search("TV giá cao nhất")
+        assert result["request_id"]
+        assert STAGE_LATENCY.count(stage="database") == before + 1
+
+# ============================================================
+# TEST 8: Queued Logging
+# ============================================================
+
+class TestLogging:
+    """Test non-blocking log handler, sampling and JSON output"""
+
+    @staticmethod
+    def _record(level, msg="hot path", lineno=1):
+        import logging
+        return logging.LogRecord("rag", level, __file__, lineno, msg, None, None)
+
+    def test_rate_limit_per_call_site(self):
+        """Test: Info lines beyond the per-second limit are suppressed"""
+        import logging
+        from logger import SamplingFilter
+        now = [100.2]
+        f = SamplingFilter(rate_limit=3, clock=lambda: now[0])
+        kept = sum(f.filter(self._record(logging.INFO)) for _ in range(10))
+        assert kept == 3
+        assert f.filter(self._record(logging.INFO, lineno=2)), "Other call sites unaffected"
+        assert f.filter(self._record(logging.ERROR)), "Errors always pass"
+        now[0] = 100.9  # same second
+        assert not f.filter(self._record(logging.INFO))
+        now[0] = 101.0  # next second: a fresh window
+        assert sum(f.filter(self._record(logging.INFO)) for _ in range(5)) == 3
+
+    def test_sync_mode_filters_once_per_record(self, monkeypatch):
+        """Test: Without the queue, one shared filter gates every handler"""
+        import logging
+        import logger
+        f = logger.SamplingFilter(rate_limit=3, clock=lambda: 0.0)
+        monkeypatch.setattr(logger, "_sampling", f)
+        log = logger.get_logger("unit_sync")
+        monkeypatch.setattr(log, "propagate", False)
+        monkeypatch.setattr(log, "level", logging.INFO)
+        seen = ([], [])
+        handlers = [logging.Handler() for _ in seen]
+        for h, out in zip(handlers, seen):
+            h.emit = out.append
+            log.addHandler(h)
+        try:
+            for _ in range(10):
+                log.info("hot path")
+        finally:
+            for h in handlers:
+                log.removeHandler(h)
+            log.removeFilter(f)
+        assert [len(out) for out in seen] == [3, 3]
+        assert f.suppressed == 7
+
+    def test_debug_sampling(self):
+        """Test: Sample rate 0 drops every debug line"""
+        import logging
+        from logger import SamplingFilter
+        f = SamplingFilter(debug_sample_rate=0.0)
+        assert not f.filter(self._record(logging.DEBUG))
+        assert f.filter(self._record(logging.INFO))
+
+    def test_queue_handler_never_blocks(self):
+        """Test: A full queue drops records instead of blocking"""
+        import logging
+        import queue
+        from logger import _DroppingQueueHandler
+        handler = _DroppingQueueHandler(queue.Queue(maxsize=2))
+        for _ in range(5):
+            handler.handle(self._record(logging.INFO))
+        assert handler.queue.qsize() == 2
+        assert handler.dropped == 3
+
+    def test_json_formatter(self):
+        """Test: JSON lines keep Vietnamese text readable"""
+        import json
+        import logging
+        from logger import JsonFormatter
+        line = JsonFormatter().format(self._record(logging.INFO, "tủ lạnh"))
+        entry = json.loads(line)
+        assert entry["msg"] == "tủ lạnh" and entry["level"] == "INFO"
+        assert "tủ lạnh" in line
+
+# ============================================================
+# TEST 9: Cold Start
+# ============================================================
+
+class TestStartup:
+    """Test lazy imports and the warm-up readiness signal"""
+
+    def test_search_modules_do_not_import_pandas(self):
+        """Test: Importing the search path must not pull in pandas/requests"""
+        import subprocess
+        import sys
+        code = ("import sys, rag_engine; "
+                "print(','.join(m for m in ('pandas', 'requests', 'gradio') if m in sys.modules))")
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                             text=True, timeout=60)
+        assert out.returncode == 0, out.stderr
+        assert out.stdout.strip() == "", f"Eagerly imported: {out.stdout.strip()}"
+
+    def test_warmup_sets_ready(self, monkeypatch):
+        """Test: Warm-up runs registered steps and flips readiness"""
+        import threading
+        import startup
+        from metrics import READY
+        # Only this test's step: the real warm-up loads models and replays logs
+        monkeypatch.setattr(startup, "_steps", [])
+        monkeypatch.setattr(startup, "_status", {"state": "cold", "steps": {}})
+        monkeypatch.setattr(startup, "_ready", threading.Event())
+        calls = []
+        startup.register_warmup_step("unit", lambda: calls.append(1))
+        assert not startup.is_ready()
+        status = startup.run_warmup()
+        assert calls == [1] and list(status["steps"]) == ["unit"]
+        assert startup.is_ready() and READY.value() == 1
+        assert status["steps"]["unit"]["ok"] is True
+
+# ============================================================
+# TEST 10: Multi-process Serving
+# ============================================================
+
+class TestWorkerPool:
+    """Test the read-only shared catalog and the process pool"""
+
+    def test_read_only_connection(self):
+        """Test: Worker connections cannot write to the shared catalog"""
+        import sqlite3
+        import database
+        database.use_read_only_connections()
+        try:
+            conn = database.get_connection()
+            assert conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] > 0
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM products")
+            conn.close()
+        finally:
+            database.use_read_only_connections(False)
+
+    def test_engine_uses_injected_semantic_backend(self):
+        """Test: RAGEngine routes semantic search through the given backend"""
+        from rag_engine import RAGEngine
+        calls = []
+
+        def backend(query, n_results=5):
+            calls.append(query)
+            return {"found": True, "count": 1, "products": [
+                {"ten": "Máy giặt X", "model": "MG1", "gia": 1000, "similarity": 0.9}]}
+
+        engine = RAGEngine(use_web_fallback=False, semantic_backend=backend)
+        result = engine.search("đồ dùng thông minh cho gia đình")
+        assert calls == ["đồ dùng thông minh cho gia đình"]
+        assert result["sources"] == ["vector_db"]
+
+    def test_engine_batches_through_injected_backend(self):
+        """Test: A batch reaches the embedding server as one call"""
+        from rag_engine import RAGEngine
+        calls = []
+
+        def backend_many(queries, n_results=5):
+            calls.append(list(queries))
+            return [{"found": False} for _ in queries]
+
+        engine = RAGEngine(use_web_fallback=False,
+                           semantic_backend=lambda q, n_results=5: pytest.fail("per query"),
+                           semantic_backend_many=backend_many)
+        engine.search_many(["đồ dùng thông minh", "quà tặng gia đình"])
+        assert calls == [["đồ dùng thông minh", "quà tặng gia đình"]]
+
+    def test_pool_sends_batch_to_one_worker(self):
+        """Test: search_many is one task, so the worker embeds the batch at once"""
+        from concurrent.futures import Future
+        import worker_pool
+        from singleflight import SingleFlight
+        submitted = []
+
+        class Executor:
+            def submit(self, fn, *args):
+                submitted.append((fn.__name__, args[0]))
+                done = Future()
+                done.set_result(([{"found": False} for _ in args[0]], {}))
+                return done
+        pool = worker_pool.SearchWorkerPool.__new__(worker_pool.SearchWorkerPool)
+        pool.workers, pool._executor, pool._flight = 4, Executor(), SingleFlight("t")
+        queries = [f"q{i}" for i in range(6)]
+        assert len(pool.search_many(queries)) == 6
+        assert submitted == [("_worker_search_many", queries)]
+
+    def test_warm_up_reaches_every_worker(self):
+        """Test: Each worker process runs a warm-up search, not just the first free one"""
+        from worker_pool import SearchWorkerPool
+        with SearchWorkerPool(2, use_web_fallback=False) as pool:
+            pids = pool._warm_workers()
+        assert len(set(pids)) == 2
+
+    def test_pool_matches_in_process_results(self):
+        """Test: A worker process returns the same answer as in-process search"""
+        from metrics import STAGE_LATENCY
+        from rag_engine import RAGEngine
+        from worker_pool import SearchWorkerPool
+        local = RAGEngine(use_web_fallback=False, use_semantic=False)
+        queries = ["TV giá cao nhất", "Tủ lạnh rẻ nhất"]
+        with SearchWorkerPool(1, use_web_fallback=False) as pool:
+            remote = pool.search("TV giá cao nhất")
+            parses = STAGE_LATENCY.count(stage="parse")
+            batch = pool.search_many(queries)
+        assert remote["products"] == local.search("TV giá cao nhất")["products"]
+        assert [r["products"] for r in batch] == [r["products"] for r in local.search_many(queries)]
+        assert STAGE_LATENCY.count(stage="parse") > parses, "worker metrics reach this process"
+
+# ============================================================
+# TEST 11: JSON API
+# ============================================================
+
+@pytest.fixture(scope="module")
+def server():
+    """JSON API on an ephemeral port, DB-only engine"""
+    from api_server import start_api_server
+    from rag_engine import RAGEngine
+    srv = start_api_server(0, host="127.0.0.1",
+                           engine=RAGEngine(use_web_fallback=False, use_semantic=False))
+    yield srv
+    srv.shutdown()
+
+
+class TestAPI:
+    """Test the headless JSON/HTTP search API"""
+
+    @staticmethod
+    def _request(conn, method, path, body=None, headers=None):
+        import json
+        conn.request(method, path, body=json.dumps(body) if body is not None else None,
+                     headers=headers or {})
+        resp = conn.getresponse()
+        return resp, resp.read()
+
+    def test_search_keep_alive_and_pagination(self, server):
+        """Test: Two requests reuse one connection; pages don't overlap"""
+        import http.client
+        import json
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        body = {"query": "So sánh TV Samsung và LG", "limit": 2}
+        resp, raw = self._request(conn, "POST", "/v1/search", body)
+        page1 = json.loads(raw)
+        assert resp.status == 200 and len(page1["items"]) <= 2
+        resp, raw = self._request(conn, "POST", "/v1/search", dict(body, offset=2))
+        page2 = json.loads(raw)
+        assert resp.status == 200, "Connection should be reused (HTTP/1.1 keep-alive)"
+        models1 = {p["model"] for p in page1["items"]}
+        assert not models1 & {p["model"] for p in page2["items"]}
+        assert page1["intent"]["intent"] == "compare"
+        conn.close()
+
+    def test_batch_and_gzip(self, server):
+        """Test: Batched queries return results in order, gzip when asked"""
+        import gzip
+        import http.client
+        import json
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        queries = ["TV giá cao nhất", "Tủ lạnh rẻ nhất", "Bình tắm Rossi"]
+        resp, raw = self._request(conn, "POST", "/v1/search",
+                                  {"queries": queries, "limit": 10},
+                                  {"Accept-Encoding": "gzip"})
+        if resp.getheader("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        results = json.loads(raw)["results"]
+        assert [r["query"] for r in results] == queries
+        assert all(r["found"] for r in results)
+        conn.close()
+
+    def test_product_lookup_and_errors(self, server):
+        """Test: Product lookup, 404 and 400 responses are JSON"""
+        import http.client
+        import json
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        resp, raw = self._request(conn, "GET", "/v1/products/RPG%2015SQ")
+        assert resp.status == 200 and json.loads(raw)["found"] is True
+        resp, raw = self._request(conn, "GET", "/v1/products/NOTEXIST123")
+        assert resp.status == 404 and "error" in json.loads(raw)
+        resp, raw = self._request(conn, "POST", "/v1/search", {"limit": 5})
+        assert resp.status == 400
+        conn.close()
+
+    def test_bad_bodies_are_client_errors(self, server):
+        """Test: Bad Content-Length is 400, oversized is 413; both close the connection"""
+        import http.client
+        import json
+        port = server.server_address[1]
+        for length, status in (("abc", 400), ("-5", 400), (str(2 * 1024 * 1024), 413)):
+            conn = http.client.HTTPConnection("127.0.0.1", port)
+            conn.putrequest("POST", "/v1/search")
+            conn.putheader("Content-Length", length)
+            conn.endheaders(b"{}")
+            resp = conn.getresponse()
+            assert resp.status == status and "error" in json.loads(resp.read())
+            assert resp.getheader("Connection") == "close"
+            conn.close()
+
+    def test_malformed_intent_is_400(self, server):
+        """Test: A client intent is validated; missing keys are filled in"""
+        import http.client
+        import json
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        for intent in ({"category": 5}, {"intent": "cheapest"}, "TV", {"brands": "LG"}):
+            resp, raw = self._request(conn, "POST", "/v1/intent-search",
+                                      {"query": "tv", "intent": intent})
+            assert resp.status == 400, intent
+        resp, raw = self._request(conn, "POST", "/v1/intent-search",
+                                  {"query": "tv", "intent": {"category": "TV"}})
+        page = json.loads(raw)
+        assert resp.status == 200 and page["intent"]["intent"] == "search" and page["items"]
+        conn.close()
+
+# ============================================================
+# TEST 12: Batch Search
+# ============================================================
+
+class TestBatchSearch:
+    """Test RAGEngine.search_many and batched embeddings"""
+
+    QUERIES = ["TV giá cao nhất", "Tủ lạnh rẻ nhất", "iPhone 15 Pro Max",
+               "So sánh TV Samsung và LG", "TV giá cao nhất"]
+
+    def test_matches_single_search_in_order(self):
+        """Test: Batch results equal per-query results, in input order"""
+        from rag_engine import RAGEngine
+        engine = RAGEngine(use_web_fallback=False, use_semantic=False)
+        batch = engine.search_many(self.QUERIES)
+        assert len(batch) == len(self.QUERIES)
+        for q, got in zip(self.QUERIES, batch):
+            assert got["products"] == engine.search(q)["products"]
+            assert got["intent"]["original_query"] == q
+
+    def test_single_sqlite_read(self):
+        """Test: The batch reads SQLite at most once (catalog snapshot reuse)"""
+        from metrics import STAGE_LATENCY
+        from rag_engine import RAGEngine
+        engine = RAGEngine(use_web_fallback=False, use_semantic=False)
+        before = STAGE_LATENCY.count(stage="sqlite")
+        engine.search_many(self.QUERIES)
+        assert STAGE_LATENCY.count(stage="sqlite") <= before + 1
+        loaded = STAGE_LATENCY.count(stage="sqlite")
+        engine.search_many(self.QUERIES)
+        assert STAGE_LATENCY.count(stage="sqlite") == loaded
+
+    def test_web_fallbacks_run_for_misses_only(self, monkeypatch):
+        """Test: Only queries with no local hit go to the web"""
+        import rag_engine
+        seen = []
+
+        def fake_web(query, max_results=3):
+            seen.append(query)
+            return {"found": True, "count": 1,
+                    "results": [{"type": "answer", "content": "x", "source": "tavily_ai"}]}
+
+        monkeypatch.setattr(rag_engine, "web_search", fake_web)
+        engine = rag_engine.RAGEngine(use_web_fallback=True, use_semantic=False)
+        batch = engine.search_many(["TV giá cao nhất", "iPhone 15 Pro Max"])
+        assert seen == ["iPhone 15 Pro Max"]
+        assert batch[1]["sources"] == ["web"] and batch[0]["sources"] == ["database"]
+
+    def test_embedding_cache_batches_misses(self, monkeypatch):
+        """Test: One forward pass for new texts; repeats come from cache"""
+        import vector_store
+        calls = []
+
+        def fake_embed(texts):
+            calls.append(list(texts))
+            return [[float(len(t))] for t in texts]
+
+        monkeypatch.setattr(vector_store, "_collection", object())
+        monkeypatch.setattr(vector_store, "_embedding_fn", fake_embed)
+        monkeypatch.setattr(vector_store, "_embedding_cache", type(vector_store._embedding_cache)())
+        vecs = vector_store.embed_queries(["a", "bb", "a"])
+        assert vecs == [[1.0], [2.0], [1.0]]
+        vector_store.embed_queries(["bb", "ccc"])
+        assert calls == [["a", "bb"], ["ccc"]]
+
+# ============================================================
+# TEST 13: Vietnamese Normalization
+# ============================================================
+
+class TestNormalizer:
+    """Test accent/tone folding shared by parser, database and vectors"""
+
+    def test_normalize_and_fold(self):
+        """Test: NFD input and new-style tones map to one canonical form"""
+        import unicodedata
+        from normalizer import fold, normalize, tokenize
+        assert normalize(unicodedata.normalize("NFD", "Điều  Hoà")) == "điều hòa"
+        assert fold("Tủ Lạnh Đẹp") == "tu lanh dep"
+        assert tokenize("Tủ lạnh RT-20") == ("tu", "lanh", "rt", "20")
+
+    def test_unaccented_query_parses(self):
+        """Test: 'tu lanh re nhat' parses like 'Tủ lạnh rẻ nhất'"""
+        assert parse_query("tu lanh re nhat") == {**parse_query("Tủ lạnh rẻ nhất"),
+                                                  "original_query": "tu lanh re nhat"}
+
+    def test_tone_placement_brand(self):
+        """Test: 'hoà phát' (new-style tone) detects Hòa Phát"""
+        assert parse_query("Máy lọc nước hoà phát")["brands"] == ["Hòa Phát"]
+
+    def test_different_accent_does_not_match(self):
+        """Test: 'nơi' is not the category Nồi, but 'noi com' is"""
+        assert parse_query("mua ở nơi nào")["category"] is None
+        assert parse_query("noi com dien")["category"] == "Nồi"
+
+    def test_unaccented_keyword_search(self):
+        """Test: 'binh tam' finds accented 'BÌNH TẮM ... ROSSI' rows"""
+        result = search_by_keywords("binh tam")
+        assert result["found"]
+        assert any("ROSSI" in p["ten"].upper() for p in result["products"])
+
+    def test_legacy_catalog_is_migrated(self, tmp_path, monkeypatch):
+        """Test: A catalog without fold columns gets them on first connect"""
+        import sqlite3
+        import database
+        path = str(tmp_path / "old.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, ten_san_pham TEXT, "
+                     "model TEXT, thong_so_chinh TEXT, gia INTEGER)")
+        conn.execute("INSERT INTO products VALUES (1, 'Tủ lạnh Samsung', 'RT20', NULL, 1)")
+        conn.commit()
+        conn.close()
+        monkeypatch.setattr(database, "DB_PATH", path)
+        monkeypatch.setattr(database, "_schema_checked", False)
+        row = database.get_connection().execute("SELECT * FROM products").fetchone()
+        assert row["ten_fold"] == " tu lanh samsung "
+        assert row["search_fold"] == " tu lanh samsung  rt20  "
+
+# ============================================================
+# TEST 14: Fuzzy Matching
+# ============================================================
+
+class TestFuzzyIndex:
+    """Test the typo-tolerant stage between database and semantic search"""
+
+    def test_misspelled_brand(self):
+        """Test: 'samsumg' finds Samsung products"""
+        from fuzzy_index import fuzzy_search
+        result = fuzzy_search("samsumg")
+        assert result["found"]
+        assert all("samsung" in p["ten"].lower() for p in result["products"])
+
+    def test_joined_words(self):
+        """Test: 'maygiat' (no space) finds washing machines"""
+        from fuzzy_index import fuzzy_search
+        result = fuzzy_search("maygiat")
+        assert result["found"]
+        assert all("giặt" in p["ten"].lower() for p in result["products"])
+
+    def test_unrelated_and_stop_words_miss(self):
+        """Test: Off-catalog queries and short stop words do not match"""
+        from fuzzy_index import fuzzy_search
+        assert not fuzzy_search("iPhone 15 Pro Max")["found"]
+        assert not fuzzy_search("giá")["found"]
+
+    def test_engine_skips_semantic_on_fuzzy_hit(self):
+        """Test: A fuzzy hit answers before the embedding model is called"""
+        from rag_engine import RAGEngine
+        calls = []
+
+        def backend(query, n_results=5):
+            calls.append(query)
+            return {"found": False}
+
+        engine = RAGEngine(use_web_fallback=False, use_semantic=True,
+                           semantic_backend=backend)
+        result = engine.search("samsumg")
+        assert result["sources"] == ["fuzzy"] and not calls
+        assert engine.search_many(["samsumg"])[0]["sources"] == ["fuzzy"]
+
+# ============================================================
+# TEST 15: Chat Sessions
+# ============================================================
+
+class TestSessions:
+    """Test follow-up refinement from per-session state"""
+
+    @staticmethod
+    def _chat():
+        from rag_engine import RAGEngine
+        from session_store import ConversationalSearch, SessionStore
+        engine = RAGEngine(use_web_fallback=False, use_semantic=False)
+        return ConversationalSearch(engine, SessionStore(max_sessions=2, idle_ttl=60))
+
+    def test_followup_detection(self):
+        """Test: Follow-ups are recognised; fresh category queries are not"""
+        from query_parser import parse_followup
+        assert parse_followup("còn cái rẻ hơn không?")["refine"] == "cheaper"
+        assert parse_followup("so sánh với LG") == {"refine": "compare", "brands": ["LG"]}
+        assert parse_followup("tủ lạnh rẻ hơn") is None
+        assert parse_followup("TV giá cao nhất") is None
+        assert parse_followup("còn Samsung?") == {"refine": "brand", "brands": ["Samsung"]}
+        # Stock questions name a brand but are not brand follow-ups
+        assert parse_followup("còn hàng không?") is None
+        assert parse_followup("Samsung còn hàng không?") is None
+        assert parse_followup("còn hàng LG không") is None
+
+    def test_cheaper_refines_without_search(self):
+        """Test: 'rẻ hơn' answers from the candidate set, no SQLite read"""
+        from metrics import SESSION_FOLLOWUPS, STAGE_LATENCY
+        chat = self._chat()
+        first = chat.search("Tủ lạnh giá cao nhất", session_id="s1")
+        top = first["products"][0]["gia"]
+        reads = STAGE_LATENCY.count(stage="sqlite")
+        refined = SESSION_FOLLOWUPS.value(outcome="refined")
+        result = chat.search("còn cái rẻ hơn không?", session_id="s1")
+        assert STAGE_LATENCY.count(stage="sqlite") == reads
+        assert SESSION_FOLLOWUPS.value(outcome="refined") == refined + 1
+        assert result["sources"] == ["session"]
+        assert all(p["gia"] < top and "lạnh" in p["ten"].lower() for p in result["products"])
+        # Nearest price first: the next fridge down, not the cheapest ones
+        below = [c["gia"] for c in chat.store.get("s1").candidates if c["gia"] < top]
+        prices = [p["gia"] for p in result["products"]]
+        assert prices[0] == max(below) and prices == sorted(prices, reverse=True)
+
+    def test_refines_category_over_candidate_cap(self, monkeypatch):
+        """Test: A category too large to keep is narrowed in the catalog"""
+        import rag_engine
+        from database import search_price_range, search_with_intent
+        from metrics import SESSION_FOLLOWUPS
+        monkeypatch.setattr(rag_engine, "SESSION_MAX_CANDIDATES", 1)
+        chat = self._chat()
+        first = chat.search("Tủ lạnh giá cao nhất", session_id="s1")
+        assert chat.store.get("s1").candidates is None
+        top = first["products"][0]["gia"]
+        refined = SESSION_FOLLOWUPS.value(outcome="refined")
+        result = chat.search("còn cái rẻ hơn không?", session_id="s1")
+        assert SESSION_FOLLOWUPS.value(outcome="refined") == refined + 1
+        assert result["found"] and result["sources"] == ["session"]
+        assert all(p["gia"] < top and "lạnh" in p["ten"].lower() for p in result["products"])
+        listing = search_with_intent("", first["intent"] | {"intent": "search"}, 1000)
+        below = [p["gia"] for p in listing["products"] if p["gia"] < top]
+        prices = [p["gia"] for p in result["products"]]
+        assert prices[0] == max(below) and prices == sorted(prices, reverse=True)
+        pricier = search_price_range(first["intent"], 3, above=below[0])
+        above = [p["gia"] for p in listing["products"] if p["gia"] > below[0]]
+        assert [p["gia"] for p in pricier["products"]] == above[:3]
+        result = chat.search("còn Samsung?", session_id="s1")
+        assert SESSION_FOLLOWUPS.value(outcome="refined") == refined + 2
+        assert result["found"] and all("samsung" in p["ten"].lower() and "lạnh" in p["ten"].lower()
+                                       for p in result["products"])
+
+    def test_compare_followup_keeps_category(self):
+        """Test: 'so sánh với Panasonic' compares within the last category"""
+        chat = self._chat()
+        chat.search("Tủ lạnh Samsung", session_id="s1")
+        result = chat.search("so sánh với Panasonic", session_id="s1")
+        assert result["intent"]["intent"] == "compare"
+        names = " ".join(p["ten"].lower() for p in result["products"])
+        assert "samsung" in names and "panasonic" in names and "ti vi" not in names
+
+    def test_followup_without_state_runs_full_search(self):
+        """Test: A follow-up in a new session falls back to the pipeline"""
+        from metrics import SESSION_FOLLOWUPS
+        before = SESSION_FOLLOWUPS.value(outcome="full_search")
+        self._chat().search("còn cái rẻ hơn không?", session_id="new")
+        assert SESSION_FOLLOWUPS.value(outcome="full_search") == before + 1
+
+    def test_store_is_bounded(self, monkeypatch):
+        """Test: LRU capacity and idle TTL both evict sessions"""
+        import session_store
+        store = session_store.SessionStore(max_sessions=2, idle_ttl=10)
+        now = [100.0]
+        monkeypatch.setattr(session_store.time, "monotonic", lambda: now[0])
+        store.get("a"), store.get("b"), store.get("c")
+        assert len(store) == 2 and "a" not in store._sessions
+        now[0] += 11
+        store.get("d")
+        assert list(store._sessions) == ["d"]
+
+# ============================================================
+# TEST 16: Local Web Knowledge
+# ============================================================
+
+class TestWebKnowledge:
+    """Test the local snapshot checked before the Tavily API"""
+
+    @pytest.fixture(autouse=True)
+    def store(self, tmp_path, monkeypatch):
+        import web_knowledge
+        path = str(tmp_path / "web.db")
+        monkeypatch.setattr(web_knowledge, "WEB_KNOWLEDGE_PATH", path)
+        return path
+
+    def test_price_sheet_lookup(self, tmp_path):
+        """Test: Ingested price rows are found accent-insensitively"""
+        from web_knowledge import ingest_price_sheet, lookup
+        sheet = tmp_path / "prices.csv"
+        sheet.write_text("product,price,retailer,url\n"
+                         "iPhone 15 Pro Max,29990000,Điện Máy X,https://x.vn/ip15\n",
+                         encoding="utf-8")
+        assert ingest_price_sheet(str(sheet)) == 1
+        result = lookup("iphone 15 pro max")
+        assert result["found"] and result["results"][0]["source"] == "price_sheet"
+        assert "29,990,000 VND" in result["results"][0]["content"]
+        assert lookup("dien may x")["found"]
+        assert not lookup("iphone 16")["found"]
+
+    def test_live_results_are_harvested(self, monkeypatch):
+        """Test: A live answer is stored, so the repeat query stays local"""
+        import web_search
+        calls = []
+
+        def fake_tavily(query, max_results):
+            calls.append(query)
+            return {"found": True, "count": 1, "results": [
+                {"type": "answer", "content": "Khoảng 30 triệu", "source": "tavily_ai"}]}
+
+        monkeypatch.setattr(web_search, "_tavily_search", fake_tavily)
+        first = web_search.web_search("giá iPhone 15 Pro Max")
+        second = web_search.web_search("giá iPhone 15 Pro Max")
+        assert calls == ["giá iPhone 15 Pro Max"]
+        assert second["results"] == first["results"]
+
+    def test_offline_mode_never_calls_api(self, monkeypatch):
+        """Test: WEB_SEARCH_MODE=offline answers from the store or misses"""
+        import web_search
+        monkeypatch.setattr(web_search, "WEB_SEARCH_MODE", "offline")
+        monkeypatch.setattr(web_search, "_tavily_search",
+                            lambda *a: pytest.fail("live API called offline"))
+        result = web_search.web_search("máy rửa bát Bosch")
+        assert not result["found"] and "Offline" in result["error"]
+
+# ============================================================
+# TEST 17: Speculative Web Fallback
+# ============================================================
+
+class TestSpeculation:
+    """Test early web calls, cancellation and the latency budget"""
+
+    ANSWER = {"found": True, "count": 1,
+              "results": [{"type": "answer", "content": "x", "source": "tavily_ai"}]}
+
+    @classmethod
+    def _web(cls, calls, release=None):
+        """Fake web_search recording each call's cancel event; blocks until *release*."""
+        def fake_web(query, max_results=3, cancelled=None):
+            calls.append(cancelled)
+            if release is not None:
+                release.wait(5)
+            return cls.ANSWER
+        return fake_web
+
+    def test_generic_query_overlaps_web_with_semantic(self, monkeypatch):
+        """Test: The web call is already running while the semantic stage works"""
+        import threading
+        import rag_engine
+        calls, started = [], threading.Event()
+
+        def web(query, max_results=3, cancelled=None):
+            calls.append(cancelled)
+            started.set()
+            return self.ANSWER
+
+        def semantic(query, n_results=5):
+            assert started.wait(5), "web call should start before semantic search"
+            return {"found": False}
+        monkeypatch.setattr(rag_engine, "web_search", web)
+        engine = rag_engine.RAGEngine(use_semantic=True, semantic_backend=semantic,
+                                      speculation="generic")
+        result = engine.search("đồ dùng thông minh cho gia đình")
+        assert result["sources"] == ["web"] and len(calls) == 1
+
+    def test_weak_similarity_triggers_speculation(self, monkeypatch):
+        """Test: A DB-first miss whose fuzzy best score is weak starts the web early"""
+        import threading
+        import rag_engine
+        started = threading.Event()
+
+        def web(query, max_results=3, cancelled=None):
+            started.set()
+            return self.ANSWER
+
+        def semantic(query, n_results=5):
+            assert started.wait(5), "weak fuzzy score should start the web call"
+            return {"found": False}
+        monkeypatch.setattr(rag_engine, "web_search", web)
+        monkeypatch.setattr(rag_engine, "search_with_intent", lambda *a, **k: {"found": False})
+        engine = rag_engine.RAGEngine(semantic_backend=semantic, speculation="generic")
+        assert engine.search("tủ lạnh qwxzy")["sources"] == ["web"]
+
+    def test_local_hit_cancels_speculation(self, monkeypatch):
+        """Test: A fuzzy hit drops the speculative call before its paid request"""
+        import threading
+        import rag_engine
+        from metrics import SPECULATIVE_WEB_CALLS
+        calls, release = [], threading.Event()
+        monkeypatch.setattr(rag_engine, "web_search", self._web(calls, release))
+        before = sum(SPECULATIVE_WEB_CALLS.value(outcome=o) for o in ("cancelled", "wasted"))
+        engine = rag_engine.RAGEngine(use_semantic=False, speculation="generic")
+        result = engine.search("samsumg")
+        release.set()
+        assert result["sources"] == ["fuzzy"] and result["web_results"] is None
+        after = sum(SPECULATIVE_WEB_CALLS.value(outcome=o) for o in ("cancelled", "wasted"))
+        assert after == before + 1
+        assert not calls or calls[0].is_set()
+
+    def test_cancelled_call_skips_live_api(self, monkeypatch):
+        """Test: web_search stops before Tavily once its cancel event is set"""
+        import threading
+        import web_search as ws
+        monkeypatch.setattr(ws, "WEB_SEARCH_MODE", "live")
+        monkeypatch.setattr(ws, "_tavily_search", lambda q, n: pytest.fail("paid call made"))
+        cancelled = threading.Event()
+        cancelled.set()
+        assert ws.web_search("iphone 15", cancelled=cancelled)["error"] == "cancelled"
+
+    def test_speculation_bounded_and_budgeted(self, monkeypatch):
+        """Test: No early call without a free slot or when the budget can't cover one"""
+        import threading
+        import overload
+        import rag_engine
+        from metrics import SPECULATIVE_WEB_CALLS
+        calls = []
+        monkeypatch.setattr(rag_engine, "web_search", self._web(calls))
+        monkeypatch.setattr(rag_engine, "_spec_slots", threading.BoundedSemaphore(1))
+        engine = rag_engine.RAGEngine(use_semantic=False, speculation="generic")
+        before = SPECULATIVE_WEB_CALLS.value(outcome="skipped")
+        rag_engine._spec_slots.acquire()  # the only slot is busy
+        assert engine.search("đồ dùng thông minh")["sources"] == ["web"]
+        rag_engine._spec_slots.release()
+        assert calls == [None]  # the plain fallback, not an early call
+
+        controller = overload.OverloadController(limits={"web": 4})
+        controller.stages["web"].latency_ms = 10_000  # slower than any budget below
+        monkeypatch.setattr(overload, "controller", controller)
+        engine.budget_ms = 5_000
+        engine.search("đồ gia dụng tiện lợi")
+        assert SPECULATIVE_WEB_CALLS.value(outcome="skipped") == before + 2
+
+    def test_budget_abandons_slow_web(self, monkeypatch):
+        """Test: A web call past SEARCH_BUDGET_MS is abandoned and called off"""
+        import threading
+        import rag_engine
+        from metrics import BUDGET_EXCEEDED
+        calls, release = [], threading.Event()
+        monkeypatch.setattr(rag_engine, "web_search", self._web(calls, release))
+        before = BUDGET_EXCEEDED.value(stage="web")
+        engine = rag_engine.RAGEngine(use_semantic=False, budget_ms=100)
+        result = engine.search("iPhone 15 Pro Max")
+        release.set()
+        assert not result["found"] and calls[0].is_set()
+        assert BUDGET_EXCEEDED.value(stage="web") == before + 1
+
+    def test_budget_covers_whole_request(self, monkeypatch):
+        """Test: Local stages that use up the budget skip semantic and web"""
+        import itertools
+        import types
+        import rag_engine
+        from metrics import BUDGET_EXCEEDED
+        monkeypatch.setattr(rag_engine, "web_search", lambda *a, **k: pytest.fail("web ran"))
+        engine = rag_engine.RAGEngine(semantic_backend=lambda *a, **k: pytest.fail("semantic ran"),
+                                      budget_ms=1)
+        clock = itertools.chain([0.0], itertools.repeat(1.0))  # arrival, then past the deadline
+        monkeypatch.setattr(rag_engine, "time",
+                            types.SimpleNamespace(monotonic=lambda: next(clock)))
+        before = [BUDGET_EXCEEDED.value(stage=s) for s in ("semantic", "web")]
+        result = engine.search("iPhone 15 Pro Max")
+        assert result["degraded"] == ["semantic"] and not result["found"]
+        assert [BUDGET_EXCEEDED.value(stage=s) for s in ("semantic", "web")] == \
+            [before[0] + 1, before[1] + 1]
+
+    def test_unknown_mode_rejected(self):
+        """Test: A typo in SPECULATIVE_WEB fails fast"""
+        from rag_engine import RAGEngine
+        with pytest.raises(ValueError):
+            RAGEngine(speculation="always")
+
+# ============================================================
+# TEST 18: Columnar Catalog
+# ============================================================
+
+class TestCatalog:
+    """Test the array-backed ranking against the row-list reference"""
+
+    def test_matches_row_reference(self):
+        """Test: Catalog.rank == _rank_rows for every category/brand/intent"""
+        from catalog import get_catalog
+        from database import _rank_rows, get_connection
+        from query_parser import BRAND_PATTERNS, CATEGORY_PATTERNS
+        with get_connection() as conn:
+            rows = [dict(r) for r in conn.execute("SELECT * FROM products")]
+        catalog = get_catalog()
+        brand_sets = [None, ["Samsung", "LG"]] + [[b] for b in BRAND_PATTERNS]
+        for kind in ("search", "highest_price", "lowest_price", "compare"):
+            for category in [None, *CATEGORY_PATTERNS]:
+                for brands in brand_sets:
+                    intent = {"intent": kind, "category": category, "brands": brands}
+                    assert catalog.rank(intent, 3) == _rank_rows(rows, intent, 3), intent
+
+    def test_top_k_is_stable(self):
+        """Test: argpartition top-k keeps input order among equal prices"""
+        import numpy as np
+        from catalog import Catalog
+        rows = [{"ten_san_pham": f"P{i}", "model": f"M{i}", "gia": g, "thong_so_chinh": "",
+                 "ten_fold": " p ", "search_fold": " p "}
+                for i, g in enumerate([5, 9, 5, 9, 1])]
+        cat = Catalog(rows)
+        idx = np.arange(5)
+        assert cat.top_k(idx, 3, descending=True).tolist() == [1, 3, 0]
+        assert cat.top_k(idx, 2, descending=False).tolist() == [4, 0]
+
+    def test_reloads_after_db_change(self, tmp_path, monkeypatch):
+        """Test: A rebuilt database file is picked up on the next search"""
+        import sqlite3
+        import catalog
+        import database
+        path = str(tmp_path / "c.db")
+        monkeypatch.setattr(database, "DB_PATH", path)
+        conn = sqlite3.connect(path)
+        database.create_products_table(conn)
+        conn.execute("INSERT INTO products (ten_san_pham, model, gia) VALUES ('Quạt A', 'Q1', 1)")
+        conn.commit()
+        database.ensure_schema(conn)
+        intent = {"intent": "search", "category": "Quạt", "brands": None}
+        assert catalog.get_catalog().rank(intent, 5)["count"] == 1
+        conn.execute("INSERT INTO products (ten_san_pham, model, gia) VALUES ('Quạt B', 'Q2', 2)")
+        conn.commit()
+        database.ensure_schema(conn)
+        conn.close()
+        assert catalog.get_catalog().rank(intent, 5)["count"] == 2
+
+# ============================================================
+# TEST 19: Response Formatter
+# ============================================================
+
+class TestFormatter:
+    """Test template rendering, the fragment cache and the structured view"""
+
+    RESULT = {
+        "intent": {"intent": "compare", "category": "TV"},
+        "sources": ["database"],
+        "products": [{"ten": "TV Samsung A", "model": "QA1", "gia": 12_500_000,
+                      "similarity": 0.95},
+                     {"ten": "TV LG B", "model": "LG1", "gia": 9_000_000}],
+        "web_results": None,
+    }
+
+    def test_markdown_layout(self):
+        """Test: Compare answers keep numbering, prices and sources"""
+        import formatter
+        text = formatter.render(self.RESULT)
+        assert text == ("📊 **So sánh TV:**\n\n"
+                        "1. **TV Samsung A** (QA1)\n   - Giá: **12,500,000 VND**\n"
+                        "   - Độ phù hợp: 95%\n"
+                        "2. **TV LG B** (LG1)\n   - Giá: **9,000,000 VND**\n"
+                        "\n📍 Nguồn: database")
+
+    def test_fragments_cached_per_catalog_version(self, monkeypatch):
+        """Test: Repeat renders reuse fragments; a new catalog version re-renders"""
+        import formatter
+        formatter.clear_cache()
+        monkeypatch.setattr(formatter, "catalog_version", lambda: 1)
+        first = formatter.render(self.RESULT)
+        assert formatter.cache_size() == 2
+        assert formatter.render(self.RESULT) == first
+        assert formatter.cache_size() == 2
+        monkeypatch.setattr(formatter, "catalog_version", lambda: 2)
+        assert formatter.render(self.RESULT) == first
+        assert formatter.cache_size() == 4
+
+    def test_structured_view(self):
+        """Test: The structured view carries the rows the markdown shows"""
+        from rag_engine import RAGEngine
+        view = RAGEngine.generate_response("q", self.RESULT, structured=True)
+        assert view["kind"] == "products" and view["intent"] == "compare"
+        assert [i["model"] for i in view["items"]] == ["QA1", "LG1"]
+        empty = RAGEngine.generate_response("q", {"products": [], "web_results": None},
+                                            structured=True)
+        assert empty["kind"] == "empty" and empty["items"] == []
+
+    def test_answer_endpoint(self, server):
+        """Test: /v1/answer returns markdown or the structured view"""
+        import http.client
+        import json
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1])
+        resp, raw = TestAPI._request(conn, "POST", "/v1/answer",
+                                     {"query": "TV giá cao nhất", "format": "structured"})
+        body = json.loads(raw)
+        assert resp.status == 200 and body["answer"]["kind"] == "products"
+        assert len(body["answer"]["items"]) == 1
+        resp, raw = TestAPI._request(conn, "POST", "/v1/answer", {"query": "TV giá cao nhất"})
+        assert json.loads(raw)["answer"].startswith("💎")
+        resp, _ = TestAPI._request(conn, "POST", "/v1/answer", {"query": "TV", "format": "html"})
+        assert resp.status == 400
+
+# ============================================================
+# TEST 20: Catalog Artifact
+# ============================================================
+
+class TestCatalogArtifact:
+    """Test the offline-built, memory-mapped catalog artifact"""
+
+    @staticmethod
+    def _csv(path, *products):
+        lines = ["STT;Nhóm hàng;Nhóm hàng/Loại;Tên sản phẩm;Model;Thông số chính;Giá (VND)"]
+        lines += [f"{i};Điện gia dụng;Quạt;{ten};{model};;{gia}"
+                  for i, (ten, model, gia) in enumerate(products, 1)]
+        path.write_text("\n".join(lines), encoding="utf-8")
+        return str(path)
+
+    def test_matches_sqlite_catalog(self, tmp_path):
+        """Test: A mapped artifact ranks and looks up models like the SQLite catalog"""
+        from catalog import Catalog, get_catalog
+        from catalog_build import build_artifact
+        from query_parser import CATEGORY_PATTERNS
+        path = build_artifact(directory=str(tmp_path))
+        art, ref = Catalog.from_artifact(path), get_catalog()
+        assert not art.gia.flags.writeable
+        for kind in ("search", "highest_price", "compare"):
+            for category in [None, *CATEGORY_PATTERNS]:
+                for brands in (None, ["Samsung", "LG"]):
+                    intent = {"intent": kind, "category": category, "brands": brands}
+                    assert art.rank(intent, 3, 100) == ref.rank(intent, 3, 100), intent
+        model = next(m for m in ref.model if m)
+        assert art.find_model(model.lower()) == ref.find_model(model) is not None
+
+    def test_atomic_version_swap(self, tmp_path, monkeypatch):
+        """Test: Publishing a new version switches serving on the next search"""
+        import catalog
+        import fuzzy_index
+        from catalog_build import build_artifact
+        out = str(tmp_path / "art")
+        monkeypatch.setattr(catalog, "CATALOG_ARTIFACT_DIR", out)
+        first = build_artifact(self._csv(tmp_path / "a.csv", ("Quạt A", "QA1", 100)), out)
+        assert build_artifact(self._csv(tmp_path / "a.csv", ("Quạt A", "QA1", 100)), out) == first
+        assert catalog.get_catalog().product(0)["gia"] == 100
+        second = build_artifact(self._csv(tmp_path / "b.csv", ("Quạt A", "QA1", 90),
+                                          ("Quạt B", "QB2", 80)), out)
+        assert second != first
+        intent = {"intent": "lowest_price", "category": "Quạt", "brands": None}
+        assert catalog.get_catalog().rank(intent, 1)["products"][0]["model"] == "QB2"
+        assert fuzzy_index.fuzzy_search("quat b")["products"][0]["model"] == "QB2"
+
+    def test_semantic_search_over_mapped_embeddings(self, tmp_path, monkeypatch):
+        """Test: Artifact embeddings answer semantic search without Chroma"""
+        import numpy as np
+        import catalog
+        import vector_store
+        from catalog_build import build_artifact
+        vectors = {"QA1": [1.0, 0.0], "QB2": [0.0, 1.0]}
+        embed = lambda docs: [vectors["QA1" if "QA1" in d else "QB2"] for d in docs]
+        out = str(tmp_path / "art")
+        monkeypatch.setattr(catalog, "CATALOG_ARTIFACT_DIR", out)
+        build_artifact(self._csv(tmp_path / "a.csv", ("Quạt A", "QA1", 100),
+                                 ("Quạt B", "QB2", 80)), out, embed=embed)
+        monkeypatch.setattr(vector_store, "_embedding_fn",
+                            lambda texts: np.array([[0.1, 0.9]] * len(texts)))
+        monkeypatch.setattr(vector_store, "_embedding_cache", type(vector_store._embedding_cache)())
+        result = vector_store.semantic_search("quạt nào mát", n_results=2)
+        assert [p["model"] for p in result["products"]] == ["QB2", "QA1"]
+        assert result["products"][0]["similarity"] == round(1 - (0.1 ** 2 + 0.1 ** 2), 3)
+
+# ============================================================
+# TEST 21: Live Price/Stock Updates
+# ============================================================
+
+class TestLiveUpdates:
+    """Test applying price/stock deltas in place and following the feed"""
+
+    @pytest.fixture
+    def db(self, tmp_path, monkeypatch):
+        import sqlite3
+        import database
+        import fuzzy_index
+        import vector_store
+        path = str(tmp_path / "live.db")
+        monkeypatch.setattr(database, "DB_PATH", path)
+        monkeypatch.setattr(fuzzy_index, "_index", None)
+        monkeypatch.setattr(vector_store, "_pending_metadata", {})
+        conn = sqlite3.connect(path)
+        database.create_products_table(conn)
+        conn.executemany(
+            "INSERT INTO products (ten_san_pham, model, gia) VALUES (?, ?, ?)",
+            [("Quạt Sharp A", "Q-1", 900_000), ("Quạt Sharp B", "Q2", 500_000)])
+        conn.commit()
+        database.ensure_schema(conn)
+        conn.close()
+        return path
+
+    def test_parse_update_validates(self):
+        """Test: Model is required, values are non-negative integers"""
+        from live_updates import parse_update
+        assert parse_update({"model": " q2 ", "gia": 5.0}) == {"model": "q2", "gia": 5}
+        for bad in [{"gia": 1}, {"model": "Q2"}, {"model": "Q2", "gia": -1},
+                    {"model": "Q2", "ton_kho": "3"}, {"model": "Q2", "gia": True}, []]:
+            with pytest.raises(ValueError):
+                parse_update(bad)
+
+    def test_update_reranks_without_reload(self, db):
+        """Test: A price change reorders results in place and persists"""
+        import sqlite3
+        import catalog
+        from database import search_by_model
+        from live_updates import apply_updates
+        intent = {"intent": "lowest_price", "category": "Quạt", "brands": None}
+        assert catalog.get_catalog().rank(intent, 1)["products"][0]["model"] == "Q2"
+        version = catalog.catalog_version()
+
+        result = apply_updates([{"model": "q-1", "gia": 100_000, "ton_kho": 3},
+                                {"model": "NOPE", "gia": 1}, {"model": "Q2"}])
+        assert result == {"applied": 1, "rows": 1, "unknown": ["NOPE"], "invalid": 1}
+        assert catalog.get_catalog().rank(intent, 1)["products"][0]["model"] == "Q-1"
+        assert catalog.catalog_version() == version
+        product = search_by_model("Q-1")
+        assert (product["gia"], product["ton_kho"]) == (100_000, 3)
+        conn = sqlite3.connect(db)
+        assert conn.execute("SELECT gia, ton_kho FROM products WHERE model = 'Q-1'"
+                            ).fetchone() == (100_000, 3)
+        conn.close()
+
+    @pytest.mark.parametrize("mapped", [False, True])
+    def test_update_reaches_other_processes(self, db, tmp_path, monkeypatch, mapped):
+        """Test: A write in another process reprices this one, and survives restart/republish"""
+        import subprocess
+        import sys
+        import catalog
+        import fuzzy_index
+        from catalog_build import build_artifact
+        out = str(tmp_path / "art") if mapped else ""
+        monkeypatch.setattr(catalog, "CATALOG_ARTIFACT_DIR", out)
+        if mapped:
+            build_artifact(directory=out, db_path=db)
+        intent = {"intent": "lowest_price", "category": "Quạt", "brands": None}
+        assert catalog.get_catalog().rank(intent, 1)["products"][0]["model"] == "Q2"
+        assert fuzzy_index.fuzzy_search("quat sharp a")["products"][0]["gia"] == 900_000
+
+        code = (f"import catalog, database; database.DB_PATH = {db!r}; "
+                f"catalog.CATALOG_ARTIFACT_DIR = {out!r}; "
+                "from live_updates import apply_updates; "
+                "print(apply_updates([{'model': 'Q-1', 'gia': 100000, 'ton_kho': 2}])['applied'])")
+        done = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        assert done.stdout.split()[-1] == "1"
+
+        assert catalog.get_catalog().rank(intent, 1)["products"][0]["model"] == "Q-1"
+        assert fuzzy_index.fuzzy_search("quat sharp a")["products"][0]["gia"] == 100_000
+        if mapped:
+            csv = TestCatalogArtifact._csv(tmp_path / "a.csv", ("Quạt Sharp A", "Q-1", 900_000),
+                                           ("Quạt Sharp B", "Q2", 500_000))
+            build_artifact(csv, out, force=True)
+        catalog.reset_catalog()
+        reloaded = catalog.get_catalog()
+        assert (reloaded.gia[0], reloaded.stock[0]) == (100_000, 2)
+
+    def test_feed_tailer_applies_complete_lines(self, db, tmp_path):
+        """Test: Appended lines are applied once; partial lines wait"""
+        from database import search_by_model
+        from live_updates import FeedTailer
+        feed = tmp_path / "feed.jsonl"
+        feed.write_text('{"model": "Q2", "gia": 450000}\nnot json\n{"model": "Q-1"',
+                        encoding="utf-8")
+        tailer = FeedTailer(str(feed))
+        assert tailer.poll()["applied"] == 1
+        assert tailer.poll()["applied"] == 0
+        with open(feed, "a", encoding="utf-8") as f:
+            f.write(', "ton_kho": 0}\n')
+        assert tailer.poll() == {"applied": 1, "rows": 1, "unknown": [], "invalid": 0}
+        assert search_by_model("Q2")["gia"] == 450_000
+        assert search_by_model("Q-1")["ton_kho"] == 0
+
+    def test_api_requires_token(self, db, monkeypatch):
+        """Test: /v1/updates is off without a token and checks it"""
+        import api_server
+        api = api_server.SearchAPI(engine=object())
+        body = {"token": "s3cret", "updates": [{"model": "Q2", "gia": 1}]}
+        monkeypatch.setattr(api_server, "LIVE_UPDATES_TOKEN", "")
+        with pytest.raises(api_server.ApiError) as exc:
+            api.updates(body)
+        assert exc.value.status == 403
+        monkeypatch.setattr(api_server, "LIVE_UPDATES_TOKEN", "other")
+        with pytest.raises(api_server.ApiError):
+            api.updates(body)
+        monkeypatch.setattr(api_server, "LIVE_UPDATES_TOKEN", "s3cret")
+        assert api.updates(body)["applied"] == 1
+
+# ============================================================
+# TEST 22: Embedding Backends
+# ============================================================
+
+class TestEmbeddings:
+    """Test the backend-independent parts of the embedding backends"""
+
+    def test_mean_pool_ignores_padding(self):
+        """Test: Padded positions do not change a sentence vector"""
+        import numpy as np
+        from embeddings import _mean_pool
+        hidden = np.array([[[1.0, 2.0], [3.0, 4.0], [99.0, 99.0]]], dtype=np.float32)
+        pooled = _mean_pool(hidden, np.array([[1, 1, 0]]))
+        assert pooled.tolist() == [[2.0, 3.0]]
+
+    def test_parity_report(self):
+        """Test: Identical vectors give perfect parity, shuffled ones do not"""
+        import numpy as np
+        from embeddings import parity
+        rng = np.random.default_rng(0)
+        docs, queries = rng.normal(size=(20, 8)), rng.normal(size=(4, 8))
+        same = parity(docs, queries, docs.copy(), queries.copy(), k=5)
+        assert same == {"cosine_min": 1.0, "cosine_mean": 1.0, "top5_overlap": 1.0}
+        other = parity(docs, queries, docs[::-1], queries, k=5)
+        assert other["cosine_min"] < 0.9 and other["top5_overlap"] < 1.0
+
+    def test_missing_onnx_model(self, tmp_path):
+        """Test: The ONNX backend explains how to export a missing model"""
+        from embeddings import OnnxEmbedder, load_embedder
+        with pytest.raises(FileNotFoundError, match="embeddings.py export"):
+            OnnxEmbedder(str(tmp_path))
+        with pytest.raises(ValueError):
+            load_embedder("tensorflow")
+
+# ============================================================
+# TEST 23: Overload Control
+# ============================================================
+
+class TestOverload:
+    """Test stage limits, shedding and the degradation ladder"""
+
+    def test_stage_sheds_when_queue_full(self):
+        """Test: A full stage with no queue sheds the next caller at once"""
+        from overload import Overloaded, StageLimiter
+        limiter = StageLimiter("vision", limit=1, queue_size=0)
+        with limiter.slot():
+            with pytest.raises(Overloaded) as exc:
+                with limiter.slot():
+                    pass
+        assert exc.value.reason == "queue_full"
+        with limiter.slot():  # released again
+            pass
+
+    def test_stage_sheds_on_deadline(self):
+        """Test: Waiters give up at their deadline; hopeless calls are shed up front"""
+        import threading
+        import time
+        from overload import Overloaded, StageLimiter
+        limiter = StageLimiter("semantic", limit=1, queue_size=4)
+        held, release = threading.Event(), threading.Event()
+
+        def hold():
+            with limiter.slot():
+                held.set()
+                release.wait()
+        threading.Thread(target=hold).start()
+        held.wait()
+        with pytest.raises(Overloaded) as exc:
+            with limiter.slot(time.monotonic() + 0.05):
+                pass
+        release.set()
+        assert exc.value.reason == "timeout"
+        limiter.latency_ms = 500
+        with pytest.raises(Overloaded) as exc:
+            with limiter.slot(time.monotonic() + 0.1):
+                pass
+        assert exc.value.reason == "deadline"
+
+    def test_load_levels(self):
+        """Test: In-flight requests step through the ladder; raised levels are held"""
+        import time
+        from contextlib import ExitStack
+        from overload import OverloadController
+        controller = OverloadController(capacity=4, cooldown=0.05, limits={})
+        levels = []
+        with ExitStack() as stack:
+            for _ in range(5):
+                levels.append(stack.enter_context(controller.request()))
+        assert levels == [0, 0, 1, 2, 3]
+        assert controller.level() == 3  # cooldown
+        time.sleep(0.06)
+        assert controller.level() == 0
+
+    def test_engine_degrades(self, monkeypatch):
+        """Test: Level 1 skips web, level 2 skips semantic, level 3 is busy or cached"""
+        import overload
+        import rag_engine
+
+        def no_call(*args, **kwargs):
+            raise AssertionError("stage should have been skipped")
+        monkeypatch.setattr(rag_engine, "web_search", no_call)
+        engine = rag_engine.RAGEngine(semantic_backend=lambda q, n_results=5: {"found": False})
+
+        def at(thresholds):
+            monkeypatch.setattr(overload, "controller", overload.OverloadController(
+                capacity=1, thresholds=thresholds, cooldown=0, limits={}))
+
+        at((0.5, 5, 10))
+        assert engine.search("iPhone 15 Pro Max")["degraded"] == ["web"]
+        at((0.1, 0.5, 10))
+        engine.semantic_backend = no_call
+        assert engine.search("iPhone 15 Pro Max")["degraded"] == ["semantic", "web"]
+        found = engine.search("TV giá cao nhất")
+        assert found["found"] and "degraded" not in found
+
+        overload.controller.thresholds = (0.1, 0.2, 0.5)
+        cached = engine.search("tv  GIÁ cao nhất")
+        assert cached["degraded"] == ["cached"]
+        assert cached["products"] == found["products"]
+        busy = engine.search("Tủ lạnh rẻ nhất")
+        assert busy["busy"] and not busy["found"]
+        assert "bận" in engine.generate_response("Tủ lạnh rẻ nhất", busy)
+
+    def test_batch_admitted_as_one_request(self, monkeypatch):
+        """Test: search_many degrades with the load level like search()"""
+        import overload
+        import rag_engine
+
+        def no_call(*args, **kwargs):
+            raise AssertionError("stage should have been skipped")
+        monkeypatch.setattr(rag_engine, "web_search", no_call)
+        monkeypatch.setattr(overload, "controller", overload.OverloadController(
+            capacity=1, thresholds=(0.5, 5, 10), cooldown=0, limits={}))
+        engine = rag_engine.RAGEngine(semantic_backend=lambda q, n_results=5: {"found": False})
+        monkeypatch.setattr(engine, "_semantic_search_many",
+                            lambda queries, n: [{"found": False}] * len(queries))
+        batch = engine.search_many(["iPhone 15 Pro Max", "TV giá cao nhất"])
+        assert batch[0]["degraded"] == ["web"] and "degraded" not in batch[1]
+        busy = engine.search_many(["TV giá cao nhất"], level=overload.BUSY)
+        assert busy[0]["busy"]
+
+    def test_front_end_admits_worker_requests(self, monkeypatch):
+        """Test: The pool's process counts requests and passes the level to workers"""
+        from concurrent.futures import Future
+        from contextlib import ExitStack
+        import overload
+        import worker_pool
+        from singleflight import SingleFlight
+        monkeypatch.setattr(overload, "controller", overload.OverloadController(
+            capacity=4, cooldown=0, limits={}))
+        submitted = []
+
+        class Executor:
+            def submit(self, fn, *args):
+                submitted.append((fn.__name__, args[-1]))
+                done = Future()
+                done.set_result(([{"found": True}] if fn.__name__ == "_worker_search_many"
+                                 else {"found": True, "products": [], "sources": []}, {}))
+                return done
+        pool = worker_pool.SearchWorkerPool.__new__(worker_pool.SearchWorkerPool)
+        pool.workers, pool._executor, pool._flight = 1, Executor(), SingleFlight("t")
+        pool.search("TV giá cao nhất")
+        with ExitStack() as stack:
+            for _ in range(2):
+                stack.enter_context(overload.controller.request())
+            pool.search_many(["TV giá cao nhất"])
+            for _ in range(2):
+                stack.enter_context(overload.controller.request())
+            busy = pool.search("Tủ lạnh rẻ nhất")
+        assert submitted == [("_worker_search", overload.NORMAL),
+                             ("_worker_search_many", overload.NO_WEB)]
+        assert busy["busy"]
+
+    def test_api_sheds_engine_bypassing_handlers(self, monkeypatch):
+        """Test: /v1/intent-search and /v1/semantic answer 503 under load"""
+        from contextlib import ExitStack
+        import overload
+        from api_server import ApiError, SearchAPI
+        monkeypatch.setattr(overload, "controller", overload.OverloadController(
+            capacity=2, cooldown=0, limits={}))
+        api = SearchAPI(engine=object())
+        with ExitStack() as stack:
+            stack.enter_context(overload.controller.request())
+            with pytest.raises(ApiError) as exc:
+                api.semantic({"query": "quạt mát"})  # db_only: no semantic search
+            assert exc.value.status == 503
+            assert api.intent_search({"query": "TV giá cao nhất"})["items"]
+            stack.enter_context(overload.controller.request())
+            with pytest.raises(ApiError) as exc:
+                api.intent_search({"query": "TV giá cao nhất"})
+            assert exc.value.status == 503
+
+# ============================================================
+# TEST 24: Single-Flight Coalescing
+# ============================================================
+
+class TestSingleFlight:
+    """Test that identical concurrent calls share one execution"""
+
+    @staticmethod
+    def _burst(fn, n=8):
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(n) as pool:
+            return list(pool.map(lambda i: fn(), range(n)))
+
+    def test_shares_result_and_copies(self):
+        """Test: One execution; each caller gets its own copy; no caching after"""
+        import time
+        from singleflight import SingleFlight
+        group, runs = SingleFlight("test", enabled=True), []
+
+        def work():
+            runs.append(1)
+            time.sleep(0.1)
+            return {"products": [{"gia": 1}]}
+
+        results = self._burst(lambda: group.do("k", work))
+        assert len(runs) == 1 and all(r == results[0] for r in results)
+        results[0]["products"][0]["gia"] = 2
+        assert all(r["products"][0]["gia"] == 1 for r in results[1:])
+        group.do("k", work)
+        assert len(runs) == 2 and group.in_flight() == 0
+
+    def test_error_shared(self):
+        """Test: Waiters see the leader's exception"""
+        import time
+        from singleflight import SingleFlight
+        group = SingleFlight("test", enabled=True)
+
+        def fail():
+            time.sleep(0.1)
+            raise RuntimeError("upstream down")
+
+        def call():
+            try:
+                return group.do("k", fail)
+            except RuntimeError as exc:
+                return str(exc)
+        assert self._burst(call) == ["upstream down"] * 8
+
+    def test_engine_coalesces_identical_queries(self, monkeypatch):
+        """Test: A burst of one query runs semantic + web once, with per-caller request ids"""
+        import time
+        import rag_engine
+        import singleflight
+        from metrics import COALESCED
+        monkeypatch.setattr(rag_engine, "_search_flight",
+                            singleflight.SingleFlight("search", enabled=True))
+        calls = {"semantic": 0, "web": 0}
+
+        def semantic(query, n_results=5):
+            calls["semantic"] += 1
+            time.sleep(0.1)
+            return {"found": False}
+
+        def web(query, max_results=3):
+            calls["web"] += 1
+            return {"found": False}
+        monkeypatch.setattr(rag_engine, "web_search", web)
+        engine = rag_engine.RAGEngine(semantic_backend=semantic)
+        before = COALESCED.value(call="search")
+        queries = iter(["Đồ dùng thông minh", "đồ dùng thông minh"] * 4)
+        results = self._burst(lambda: engine.search(next(queries)))
+        assert calls == {"semantic": 1, "web": 1}
+        assert COALESCED.value(call="search") == before + 7
+        assert len({r["request_id"] for r in results}) == 8
+
+    def test_vision_coalesces_same_image(self, monkeypatch, tmp_path):
+        """Test: The same photo under two paths makes one vLLM request"""
+        import time
+        import singleflight
+        import tools
+        monkeypatch.setattr(tools, "_vision_flight",
+                            singleflight.SingleFlight("vision", enabled=True))
+        posts = []
+
+        def post(prompt, b64, temperature, max_tokens):
+            posts.append(b64)
+            time.sleep(0.1)
+            return "RT20HAR8DBU"
+        monkeypatch.setattr(tools, "_post_vision", post)
+        paths = []
+        for name in ("a.jpg", "b.jpg"):
+            (tmp_path / name).write_bytes(b"same image")
+            paths.append(str(tmp_path / name))
+        picks = iter(paths * 4)
+        results = self._burst(lambda: tools.extract_model(next(picks)))
+        assert len(posts) == 1 and all(r["model"] == "RT20HAR8DBU" for r in results)
+
+# ============================================================
+# TEST 25: Query Log & Warm-up Replay
+# ============================================================
+
+class TestQueryLog:
+    """Test the off-path query log, its report and the warm-up replay"""
+
+    @pytest.fixture
+    def qlog(self, tmp_path, monkeypatch):
+        import querylog
+        log = querylog.QueryLog(str(tmp_path / "queries.jsonl"), enabled=True)
+        monkeypatch.setattr(querylog, "query_log", log)
+        return log
+
+    @staticmethod
+    def _result(source="database", models=("RT20HAR8DBU",)):
+        return {"found": True, "sources": [source],
+                "intent": {"intent": "search", "category": "Tủ lạnh", "brands": ["samsung"]},
+                "products": [{"model": m} for m in models]}
+
+    def test_engine_search_is_logged(self, qlog):
+        """Test: RAGEngine.search writes one compact record per call"""
+        import querylog
+        from rag_engine import RAGEngine
+        engine = RAGEngine(use_semantic=False, use_web_fallback=False)
+        result = engine.search("Tủ lạnh  SAMSUNG")
+        qlog.flush()
+        records = querylog.read_records(qlog.path)
+        assert len(records) == 1
+        rec = records[0]
+        assert rec["q"] == "tủ lạnh samsung" and rec["path"] == result["sources"][-1]
+        assert rec["ids"] == [p["model"] for p in result["products"]]
+        assert rec["ms"] >= 0 and rec["intent"] == result["intent"]["intent"]
+
+    def test_rotation_and_torn_lines(self, qlog):
+        """Test: The log rotates to .1 and a torn last line is skipped"""
+        import querylog
+        qlog.max_bytes = 400
+        for i in range(10):
+            qlog.record(f"query {i}", self._result(), 1.0)
+            qlog.flush()
+        with open(qlog.path, "a", encoding="utf-8") as f:
+            f.write('{"q": "torn')
+        assert os.path.exists(qlog.path + ".1")
+        assert os.path.getsize(qlog.path + ".1") <= qlog.max_bytes
+        # One previous generation is kept: a contiguous tail, oldest first
+        queries = [r["q"] for r in querylog.read_records(qlog.path)]
+        assert 2 <= len(queries) < 10
+        assert queries == [f"query {i}" for i in range(10 - len(queries), 10)]
+
+    def test_full_queue_drops(self, qlog, monkeypatch):
+        """Test: A full queue drops records instead of blocking the request"""
+        import queue
+        from metrics import QUERY_LOG_RECORDS
+        monkeypatch.setattr(qlog, "_ensure_thread", lambda: None)
+        qlog._queue = queue.Queue(1)
+        before = QUERY_LOG_RECORDS.value(outcome="dropped")
+        for _ in range(3):
+            qlog.record("tv", self._result(), 1.0)
+        assert QUERY_LOG_RECORDS.value(outcome="dropped") == before + 2
+
+    def test_pool_process_is_logged(self, qlog):
+        """Test: Answers formatted in a worker are logged by the front end"""
+        from concurrent.futures import Future
+        import querylog
+        import worker_pool
+        from singleflight import SingleFlight
+
+        class Executor:  # a worker: the answer plus the raw result, no metrics
+            def submit(self, fn, query, *args):
+                done = Future()
+                done.set_result((("answer", TestQueryLog._result()), {}))
+                return done
+        pool = worker_pool.SearchWorkerPool.__new__(worker_pool.SearchWorkerPool)
+        pool.workers, pool._executor, pool._flight = 1, Executor(), SingleFlight("t")
+        assert pool.process("Tủ lạnh Samsung") == "answer"
+        qlog.flush()
+        records = querylog.read_records(qlog.path)
+        assert [(r["q"], r["path"], r["ids"]) for r in records] == [
+            ("tủ lạnh samsung", "database", ["RT20HAR8DBU"])]
+
+    def test_report_classes(self):
+        """Test: Report ranks query classes by count and by p95 latency"""
+        import querylog
+        records = ([{"q": "tv", "intent": "search", "cat": "TV", "brands": [],
+                     "path": "database", "ms": 2.0}] * 5
+                   + [{"q": "máy lọc nước", "intent": "search", "cat": None,
+                       "brands": [], "path": "web", "ms": 900.0}] * 2)
+        rep = querylog.report(records, top=5)
+        assert rep["records"] == 7 and rep["paths"] == {"database": 5, "web": 2}
+        assert rep["hottest_classes"][0]["count"] == 5
+        assert rep["slowest_classes"][0]["class"] == "search/-/0b → web"
+        assert rep["hottest_queries"][0] == {"q": "tv", "count": 5, "path": "database"}
+
+    def test_replay_hot_queries(self, qlog, monkeypatch):
+        """Test: Replay searches hot queries, only looks web ones up locally, logs nothing"""
+        import querylog
+        import web_knowledge
+        searched, looked_up = [], []
+
+        class Engine:
+            def search(self, query):
+                searched.append(query)
+                querylog.record(query, TestQueryLog._result(), 1.0)
+                return {"found": False, "products": [], "web_results": None, "sources": []}
+        monkeypatch.setattr(web_knowledge, "lookup", lambda q: looked_up.append(q))
+        records = ([{"q": "tv", "path": "database"}] * 3
+                   + [{"q": "máy lọc nước", "path": "web"}] * 2
+                   + [{"q": "iphone", "path": "none"}] * 2 + [{"q": "quạt", "path": "none"}])
+        stats = querylog.replay(Engine(), top=3, records=records)
+        assert stats["replayed"] == 1 and stats["web_lookups"] == 2
+        assert searched == ["tv"] and looked_up == ["máy lọc nước", "iphone"]
+        qlog.flush()
+        assert querylog.read_records(qlog.path) == []
+
+# ============================================================
+# TEST 26: On-Demand Profiling
+# ============================================================
+
+class TestProfiler:
+    """Test stage-scoped profiling captures and the admin endpoint"""
+
+    @staticmethod
+    def _busy(stage, seconds=0.0, allocate=False):
+        import time
+        from metrics import span
+        keep = []
+        with span(stage):
+            end = time.perf_counter() + seconds
+            while True:
+                sum(i * i for i in range(2000))
+                if allocate:
+                    keep.append(bytearray(64 * 1024))
+                if time.perf_counter() >= end:
+                    break
+        return keep
+
+    def test_sampling_scoped_to_stages(self, tmp_path):
+        """Test: Samples land under their stage root; unscoped stages are ignored"""
+        import threading
+        import metrics
+        from profiler import Capture
+        assert metrics._span_hook is None
+        capture = Capture(5, "sample", stages=["parse"], out_dir=str(tmp_path), hz=200).start()
+        workers = [threading.Thread(target=self._busy, args=(s, 0.3)) for s in ("parse", "web")]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        summary = capture.stop()
+        assert metrics._span_hook is None
+        assert summary["samples"].get("parse", 0) > 5 and "web" not in summary["samples"]
+        with open(os.path.join(capture.path, "stacks.folded"), encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert lines and all(line.startswith("parse;") for line in lines)
+        assert any("_busy" in line for line in lines)
+
+    def test_cprofile_and_memory(self, tmp_path):
+        """Test: cProfile runs only inside scoped stages; memory is attributed per stage"""
+        import sys
+        import tracemalloc
+        from profiler import Capture
+        capture = Capture(5, "cprofile", memory=True, stages=["format"],
+                          out_dir=str(tmp_path)).start()
+        kept = self._busy("format", allocate=True)
+        self._busy("database")
+        summary = capture.stop()
+        assert sys.getprofile() is None and not tracemalloc.is_tracing()
+        assert summary["cprofile"]["format"]["calls"] == 1
+        assert sorted(f for f in os.listdir(capture.path) if f.endswith(".pstats")) == ["format.pstats"]
+        with open(os.path.join(capture.path, "cprofile.folded"), encoding="utf-8") as f:
+            assert all(line.startswith("format;") for line in f)
+        assert summary["memory_by_stage"]["format"]["net_kb"] >= 60
+        assert os.path.exists(os.path.join(capture.path, "memory.tracemalloc"))
+        del kept
+
+    def test_admin_endpoint(self, tmp_path, monkeypatch):
+        """Test: Token required, bad args are 400, one capture at a time (409)"""
+        import api_server
+        import profiler
+        from api_server import ApiError, SearchAPI
+        api = SearchAPI(engine=object())
+        with pytest.raises(ApiError) as exc:
+            api.profile({"token": "x"})
+        assert exc.value.status == 403
+        monkeypatch.setattr(api_server, "PROFILE_TOKEN", "secret")
+        monkeypatch.setattr(profiler, "PROFILE_DIR", str(tmp_path))
+        for params, status in (({"token": "nope"}, 403),
+                               ({"token": "secret", "mode": "perf"}, 400),
+                               ({"token": "secret", "seconds": 10_000}, 400)):
+            with pytest.raises(ApiError) as exc:
+                api.profile(params)
+            assert exc.value.status == status
+        started = api.profile({"token": "secret", "seconds": 0.2})
+        assert started["running"] and started["current"]["mode"] == "sample"
+        with pytest.raises(ApiError) as exc:
+            api.profile({"token": "secret"})
+        assert exc.value.status == 409
+        profiler._current.wait(5)
+        done = api.profile_status({"token": "secret"})
+        assert not done["running"] and done["last"]["path"].startswith(str(tmp_path))
+
+# ============================================================
+# TEST 27: Keyset-Paginated Listings
+# ============================================================
+
+class TestKeysetPagination:
+    """Test cursor paging over (category, price, id) and the "show more" path"""
+
+    LISTING = {"intent": "search", "category": "Quạt", "brands": None,
+               "original_query": "có những loại quạt nào"}
+
+    @pytest.fixture
+    def db(self, tmp_path, monkeypatch):
+        import sqlite3
+        import database
+        path = str(tmp_path / "pages.db")
+        monkeypatch.setattr(database, "DB_PATH", path)
+        conn = sqlite3.connect(path)
+        database.create_products_table(conn)
+        # 23 fans with tied prices, a duplicate model and a non-fan
+        rows = [(f"Quạt Sharp {i}", f"Q{i}", 100_000 * (i % 7)) for i in range(23)]
+        rows += [("Quạt Sharp 3 (cũ)", "Q3", 1), ("Tủ lạnh LG", "T1", 5)]
+        conn.executemany("INSERT INTO products (ten_san_pham, model, gia) VALUES (?, ?, ?)", rows)
+        conn.commit()
+        database.ensure_schema(conn)
+        conn.close()
+        return path
+
+    def _walk(self, intent, limit):
+        from database import search_with_intent
+        pages, cursor = [], None
+        while True:
+            page = search_with_intent("", intent, limit, cursor=cursor)
+            pages.append([p["model"] for p in page.get("products", [])])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_listing_once(self, db):
+        """Test: Pages concatenate to the full listing, cheapest first, ids break ties"""
+        from database import search_with_intent
+        full = [p["model"] for p in search_with_intent("", self.LISTING, 100)["products"]]
+        assert len(full) == 23 and full[:4] == ["Q0", "Q7", "Q14", "Q21"]
+        pages = self._walk(self.LISTING, 5)
+        assert [len(p) for p in pages] == [5, 5, 5, 5, 3]
+        assert sum(pages, []) == full
+        assert self._walk(self.LISTING, 23) == [full]
+
+    def test_cursor_survives_price_update(self, db):
+        """Test: A repriced row moves; the cursor still resumes after its keyset"""
+        import catalog
+        from database import search_with_intent
+        page = search_with_intent("", self.LISTING, 5)
+        with catalog.patching() as c:
+            c.update(c.rows_for_model("Q22"), gia=0)  # jumps before the cursor
+        rest = search_with_intent("", self.LISTING, 100, cursor=page["next_cursor"])
+        models = [p["model"] for p in page["products"] + rest["products"]]
+        assert "Q22" not in models and len(models) == 22
+
+    def test_cursor_validation(self, db):
+        """Test: Garbage, another listing's cursor and non-listing intents are rejected"""
+        from database import search_with_intent
+        cursor = search_with_intent("", self.LISTING, 5)["next_cursor"]
+        other = dict(self.LISTING, brands=["LG"])
+        for intent, bad in ((self.LISTING, "not-a-cursor"), (other, cursor),
+                            (dict(self.LISTING, intent="lowest_price"), cursor)):
+            with pytest.raises(ValueError):
+                search_with_intent("", intent, 5, cursor=bad)
+
+    def test_api_cursor(self, db):
+        """Test: /v1/search pages by cursor; offset plus cursor is a 400"""
+        from api_server import ApiError, SearchAPI
+        api = SearchAPI(engine=object())
+        q = "có những loại quạt nào"
+        first = api.search({"q": q, "limit": "10", "cursor": ""})
+        second = api.search({"q": q, "limit": "10", "cursor": first["next_cursor"]})
+        assert first["has_more"] and len(first["items"]) == 10
+        assert not {p["model"] for p in first["items"]} & {p["model"] for p in second["items"]}
+        with pytest.raises(ApiError) as exc:
+            api.search({"q": q, "offset": "5", "cursor": first["next_cursor"]})
+        assert exc.value.status == 400
+
+    def test_api_cursor_needs_listing(self, db):
+        """Test: An unfiltered query with a cursor goes through the engine, not the catalog"""
+        from api_server import ApiError, SearchAPI
+
+        class Engine:
+            def search(self, query, max_results=5):
+                return {"found": False, "products": [], "intent": {}, "sources": [],
+                        "web_results": None}
+        api = SearchAPI(engine=Engine())
+        page = api.search({"q": "iphone 15 pro max", "cursor": ""})
+        assert page["items"] == [] and "next_cursor" not in page
+        cursor = api.search({"q": "có những loại quạt nào", "cursor": ""})["next_cursor"]
+        with pytest.raises(ApiError) as exc:
+            api.search({"q": "iphone 15 pro max", "cursor": cursor})
+        assert exc.value.status == 400
+
+    def test_api_semantic_goes_through_engine(self, monkeypatch):
+        """Test: /v1/semantic uses the engine's backend, never a model in this process"""
+        import vector_store
+        from api_server import SearchAPI
+        calls = []
+
+        class Engine:  # e.g. the worker pool, whose embedding server owns the model
+            def semantic_search_many(self, queries, n_results, price_range=None):
+                calls.append((queries, n_results, price_range))
+                return [{"found": True, "products": [{"model": f"M{i}"} for i in range(4)]}
+                        for _ in queries]
+        monkeypatch.setattr(vector_store, "semantic_search_many",
+                            lambda *a, **k: pytest.fail("front end loaded the model"))
+        api = SearchAPI(engine=Engine())
+        page = api.semantic({"query": "quạt mát", "max_price": "500000", "limit": "2"})
+        assert calls == [(["quạt mát"], 3, (None, 500000))]
+        assert [p["model"] for p in page["items"]] == ["M0", "M1"] and page["has_more"]
+
+    def test_session_show_more(self, db):
+        """Test: "xem thêm" and the button continue the listing without the engine"""
+        from session_store import ConversationalSearch
+        from database import search_with_intent
+
+        class Engine:
+            calls = 0
+
+            def search(self, query, max_results, with_candidates=False):
+                Engine.calls += 1
+                result = search_with_intent(query, TestKeysetPagination.LISTING, max_results)
+                return {"found": True, "intent": TestKeysetPagination.LISTING,
+                        "products": result["products"], "web_results": None,
+                        "sources": ["database"], "next_cursor": result["next_cursor"]}
+
+            @staticmethod
+            def generate_response(query, result, structured=False):
+                from formatter import format_result
+                return format_result(result, structured)
+
+        chat = ConversationalSearch(Engine())
+        first = chat.search("có những loại quạt nào", "s1", max_results=10)
+        second = chat.search("xem thêm", "s1", max_results=10)
+        third = chat.more("s1", max_results=10)
+        assert Engine.calls == 1
+        shown = [p["model"] for r in (first, second, third) for p in r["products"]]
+        assert len(shown) == len(set(shown)) == 23
+        assert "Xem thêm" in chat.engine.generate_response("", second)
+        assert chat.process_more("s1").startswith("✅")
+
+# ============================================================
+# TEST 28: Bitmap Facet Counts
+# ============================================================
+
+class TestFacets:
+    """Test bitmap facet counts over category, brand and price band"""
+
+    @pytest.fixture
+    def db(self, tmp_path, monkeypatch):
+        import sqlite3
+        import database
+        import facets
+        path = str(tmp_path / "facets.db")
+        monkeypatch.setattr(database, "DB_PATH", path)
+        monkeypatch.setattr(facets, "_index", None)
+        conn = sqlite3.connect(path)
+        database.create_products_table(conn)
+        rows = [("Tủ lạnh Samsung 1", "R1", 3_000_000), ("Tủ lạnh Samsung 1", "R1", 3_500_000),
+                ("Tủ lạnh LG 2", "R2", 12_000_000), ("Tủ lạnh LG 3", "R3", 4_000_000),
+                ("Tivi Samsung 4", "T4", 25_000_000), ("Quạt Sunhouse 5", "F5", 500_000)]
+        rows += [(f"Quạt Kangaroo {i}", f"K{i}", 300_000 * i) for i in range(1, 60)]
+        conn.executemany("INSERT INTO products (ten_san_pham, model, gia) VALUES (?, ?, ?)", rows)
+        conn.execute("UPDATE products SET thong_so_chinh = 'Máy nén Inverter; Wi-Fi' "
+                     "WHERE model IN ('R1', 'R2', 'T4')")
+        conn.commit()
+        database.ensure_schema(conn)
+        conn.close()
+        return path
+
+    def test_counts_leave_own_facet_out(self, db):
+        """Test: Each facet is counted under the other filters, duplicates once"""
+        from database import facet_counts
+        from query_parser import parse_query
+        result = facet_counts(parse_query("tủ lạnh samsung"))
+        assert result["total"] == 1
+        assert result["facets"]["brand"] == {"Samsung": 1, "LG": 2}
+        assert result["facets"]["category"] == {"TV": 1, "Tủ lạnh": 1}
+        assert result["facets"]["price"]["2000000-5000000"] == 1
+        assert list(result["facets"]["price"]) == ["0-2000000", "2000000-5000000",
+                                                   "5000000-10000000", "10000000-20000000",
+                                                   "20000000+"]
+        assert result["facets"]["spec"] == {"Inverter": 1, "Wi-Fi": 1}
+
+    def test_key_spec_filter_and_select(self, db):
+        """Test: A key spec narrows counts and rows; unknown specs are rejected"""
+        from database import facet_counts, facet_search
+        intent = {"intent": "search", "category": "Tủ lạnh", "brands": None}
+        result = facet_counts(intent, spec="Inverter")
+        assert result["total"] == 2 and result["facets"]["brand"] == {"Samsung": 1, "LG": 1}
+        assert result["facets"]["spec"] == {"Inverter": 2, "Wi-Fi": 2}
+        found = facet_search(intent, spec="Inverter", max_results=5)
+        assert [p["model"] for p in found["products"]] == ["R1", "R2"]
+        assert not facet_search(intent, "20000000+", "Inverter")["found"]
+        with pytest.raises(ValueError):
+            facet_counts(intent, spec="Turbo")
+
+    def test_matches_listings(self, db):
+        """Test: Bitmap totals and row sets equal the deduplicated catalog listings"""
+        from catalog import get_catalog
+        from facets import get_index
+        from query_parser import BRAND_PATTERNS, CATEGORY_PATTERNS
+        index, cat = get_index(), get_catalog()
+        for category in [None, *CATEGORY_PATTERNS]:
+            for brands in [None, *([b] for b in BRAND_PATTERNS), ["LG", "Samsung"]]:
+                intent = {"intent": "search", "category": category, "brands": brands}
+                rows = cat.listing(intent)[0]
+                assert index.counts(intent)["total"] == rows.size
+                assert sorted(index.select(intent)) == sorted(rows)
+
+    def test_price_band_filter_and_update(self, db):
+        """Test: A price band narrows the counts and follows live price updates"""
+        import catalog
+        from database import facet_counts
+        intent = {"intent": "search", "category": "Quạt", "brands": None}
+        before = facet_counts(intent, "20000000+")
+        assert before["total"] == 0 and before["facets"]["price"]["0-2000000"] == 7
+        with catalog.patching() as c:
+            c.update(c.rows_for_model("F5"), gia=30_000_000)
+        after = facet_counts(intent, "20000000+")
+        assert after["total"] == 1 and after["facets"]["brand"] == {"Sunhouse": 1}
+        with pytest.raises(ValueError):
+            facet_counts(intent, "cheap")
+
+    def test_popcount_and_packing(self):
+        """Test: Packed bitmaps round-trip and popcount counts set bits"""
+        import numpy as np
+        from facets import pack, popcount, unpack
+        mask = np.random.default_rng(7).random(1000) < 0.3
+        bits = pack(mask)
+        assert bits.dtype == np.uint64 and bits.size == 16
+        assert popcount(bits) == int(mask.sum())
+        assert list(unpack(bits, mask.size)) == list(np.flatnonzero(mask))
+
+    def test_api_facets(self, db):
+        """Test: /v1/facets returns counts; an unknown price band is a 400"""
+        from api_server import ApiError, SearchAPI
+        api = SearchAPI(engine=object())
+        result = api.facets({"q": "quạt", "price": "0-2000000", "limit": "5"})
+        assert result["total"] == 7 and result["intent"]["category"] == "Quạt"
+        assert len(result["items"]) == 5 and result["has_more"]
+        rest = api.facets({"q": "quạt", "price": "0-2000000", "limit": "5", "offset": "5"})
+        assert len(rest["items"]) == 2 and not rest["has_more"]
+        assert api.facets({})["total"] == 64
+        inverter = api.facets({"q": "tủ lạnh", "spec": "Inverter"})
+        assert [p["model"] for p in inverter["items"]] == ["R1", "R2"]
+        for bad in ({"q": "quạt", "price": "1-2"}, {"spec": "Turbo"}):
+            with pytest.raises(ApiError) as exc:
+                api.facets(bad)
+            assert exc.value.status == 400
+
+# ============================================================
+# TEST 29: Int8 Vector Scan with Float Re-scoring
+# ============================================================
+
+class TestVectorQuant:
+    """Test int8 quantized vector search against the float32 scan"""
+
+    @pytest.fixture
+    def data(self):
+        import numpy as np
+        from vector_quant import synthetic_vectors
+        vectors = synthetic_vectors(3000, 64, clusters=50)
+        rng = np.random.default_rng(1)
+        queries = vectors[rng.integers(0, 3000, 20)] + 0.05 * rng.standard_normal((20, 64))
+        return vectors, np.einsum("ij,ij->i", vectors, vectors), queries.astype(np.float32)
+
+    def test_quantize_error_bound(self, data):
+        """Test: Codes are int8 and reconstruct within half a step per dimension"""
+        import numpy as np
+        from vector_quant import quantize
+        vectors = data[0]
+        codes, scale = quantize(vectors)
+        assert codes.dtype == np.int8 and scale.shape == (64,)
+        assert codes.nbytes * 4 == vectors.nbytes
+        assert np.all(np.abs(codes * scale - vectors) <= scale / 2 + 1e-6)
+
+    def test_rescored_matches_exact(self, data):
+        """Test: Re-scored results carry exact distances and recall the float top-k"""
+        import numpy as np
+        from vector_quant import exact_search, quantize, quantized_search
+        vectors, norms, queries = data
+        codes, scale = quantize(vectors)
+        exact_rows, exact_dist = exact_search(vectors, norms, queries, 5)
+        rows, dist = quantized_search(codes, scale, vectors, norms, queries, 5, factor=10)
+        recall = np.mean([len(set(a) & set(b)) / 5 for a, b in zip(exact_rows, rows)])
+        assert recall >= 0.95
+        np.testing.assert_allclose(dist, np.take_along_axis(
+            np.einsum("ij,ij->i", queries, queries)[:, None] + norms[None, :]
+            - 2 * queries @ vectors.T, rows, axis=1), rtol=1e-4, atol=1e-4)
+        full = quantized_search(codes, scale, vectors, norms, queries, 5, factor=3000)
+        assert (full[0] == exact_rows).all()
+
+    def test_compare_report(self, data):
+        """Test: The benchmark reports recall, bytes and latency per rescore factor"""
+        from vector_quant import compare
+        vectors, _, queries = data
+        report = compare(vectors, queries[:5], k=3, factors=(1, 10))
+        assert report["int8x10"]["bytes"] == report["float32"]["bytes"] // 4 + 64 * 4
+        assert report["int8x10"]["recall"] >= report["int8x1"]["recall"]
+        assert report["int8x10"]["p50_ms"] >= 0
+
+    def test_artifact_stores_codes(self):
+        """Test: Artifacts built with embeddings carry their int8 codes"""
+        import numpy as np
+        from app_config import CSV_PATH
+        from catalog_build import compile_rows, load_rows
+        rng = np.random.default_rng(0)
+        _, arrays = compile_rows(load_rows(CSV_PATH),
+                                 embed=lambda docs: rng.standard_normal((len(docs), 8)))
+        assert arrays["embeddings.q8"].shape == arrays["embeddings"].shape
+        assert arrays["embeddings.q8"].dtype == np.int8
+        assert arrays["embeddings.scale"].shape == (8,)
+
+# ============================================================
+# TEST 30: Stable Embedded Documents, Typed Price Metadata
+# ============================================================
+
+class TestStableDocuments:
+    """Test that volatile fields stay out of embedded text and in typed metadata"""
+
+    ROW = {"ten_san_pham": "Quạt Sharp A", "model": "Q1", "gia": 900_000, "ton_kho": 4,
+           "thong_so_chinh": "40W", "nhom_hang": "Điện gia dụng", "nhom_hang_loai": "Quạt"}
+
+    def test_price_not_embedded(self):
+        """Test: Price and stock change the metadata, never the document"""
+        from vector_store import product_document, product_metadata
+        repriced = dict(self.ROW, gia=1_250_000, ton_kho=0)
+        assert product_document(repriced) == product_document(self.ROW)
+        assert "900" not in product_document(self.ROW)
+        meta = product_metadata(self.ROW)
+        assert (meta["gia"], meta["ton_kho"]) == (900_000, 4)
+        assert product_metadata(dict(self.ROW, ton_kho=None))["ton_kho"] == -1
+
+    def test_doc_schema_change_rebuilds_collection(self):
+        """Test: A collection from an older document schema is dropped and recreated"""
+        import vector_store
+
+        class Collection:
+            def __init__(self, schema, rows):
+                self.metadata, self.rows = {"doc_schema": schema}, rows
+
+            def count(self):
+                return self.rows
+
+        class Client:
+            def __init__(self, schema):
+                self.current, self.deleted = Collection(schema, 50), 0
+
+            def get_collection(self, name, embedding_function):
+                if self.current is None:
+                    raise ValueError(f"Collection {name} does not exist.")
+                return self.current
+
+            def get_or_create_collection(self, name, embedding_function, metadata):
+                if self.current is None:
+                    self.current = Collection(metadata["doc_schema"], 0)
+                self.current.metadata = metadata  # some versions overwrite it
+                return self.current
+
+            def delete_collection(self, name):
+                self.current, self.deleted = None, self.deleted + 1
+
+        current = Client(vector_store.DOC_SCHEMA)
+        assert vector_store._open_collection(current, None).count() == 50
+        stale = Client(vector_store.DOC_SCHEMA - 1)
+        assert vector_store._open_collection(stale, None).count() == 0
+        assert stale.deleted == 1 and current.deleted == 0
+        empty = Client(vector_store.DOC_SCHEMA)
+        empty.current = None
+        assert vector_store._open_collection(empty, None).count() == 0 and empty.deleted == 0
+
+    def test_artifact_digest_follows_doc_schema(self, tmp_path, monkeypatch):
+        """Test: Bumping DOC_SCHEMA rebuilds an artifact with embeddings"""
+        import vector_store
+        from catalog_build import _source_digest
+        path = TestCatalogArtifact._csv(tmp_path / "a.csv", ("Quạt A", "QA1", 100))
+        before = (_source_digest(path, True), _source_digest(path, False))
+        monkeypatch.setattr(vector_store, "DOC_SCHEMA", vector_store.DOC_SCHEMA + 1)
+        assert _source_digest(path, True) != before[0]
+        assert _source_digest(path, False) == before[1]
+
+    def test_price_range_filter(self, tmp_path, monkeypatch):
+        """Test: Semantic search filters numerically on live catalog prices"""
+        import numpy as np
+        import catalog
+        import vector_store
+        from catalog_build import build_artifact
+        embed = lambda docs: [[1.0, float(i)] for i in range(len(docs))]
+        out = str(tmp_path / "art")
+        monkeypatch.setattr(catalog, "CATALOG_ARTIFACT_DIR", out)
+        build_artifact(TestCatalogArtifact._csv(
+            tmp_path / "a.csv", ("Quạt A", "QA1", 100), ("Quạt B", "QB2", 300),
+            ("Quạt C", "QC3", 500)), out, embed=embed)
+        monkeypatch.setattr(vector_store, "_embedding_fn",
+                            lambda texts: np.array([[1.0, 0.0]] * len(texts)))
+        monkeypatch.setattr(vector_store, "_embedding_cache", type(vector_store._embedding_cache)())
+        models = lambda r: [p["model"] for p in r["products"]]
+        assert models(vector_store.semantic_search("quạt", 3)) == ["QA1", "QB2", "QC3"]
+        assert models(vector_store.semantic_search("quạt", 3, (200, None))) == ["QB2", "QC3"]
+        assert models(vector_store.semantic_search("quạt", 3, (None, 100))) == ["QA1"]
+        with catalog.patching() as c:
+            c.update(c.rows_for_model("QC3"), gia=150)
+        assert models(vector_store.semantic_search("quạt", 3, (None, 200))) == ["QA1", "QC3"]
+        assert not vector_store.semantic_search("quạt", 3, (1000, 2000))["found"]
+        monkeypatch.setattr(vector_store, "VECTOR_QUANTIZE", False)
+        assert models(vector_store.semantic_search_many(["quạt"], 3, (200, None))[0]) == ["QB2"]
+
+    def test_price_where_and_api_params(self):
+        """Test: Price bounds become a Chroma where clause; bad API bounds are a 400"""
+        from api_server import ApiError, _price_range
+        from vector_store import _price_where
+        assert _price_where(None) is None
+        assert _price_where((None, 5)) == {"gia": {"$lte": 5}}
+        assert _price_where((1, 5)) == {"$and": [{"gia": {"$gte": 1}}, {"gia": {"$lte": 5}}]}
+        assert _price_range({"min_price": "10"}) == (10, None)
+        assert _price_range({}) is None
+        with pytest.raises(ApiError):
+            _price_range({"max_price": "cheap"})
+
 # ============================================================
 # Run Tests
 # ============================================================
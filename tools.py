@@ -4,17 +4,22 @@ Functions for image analysis using vLLM + Qwen2-VL.
 """
 
 import base64
+import hashlib
 import re
 from typing import Dict, Any
 
-import requests
-
 from app_config import VLLM_URL, VISION_MODEL, VLLM_TIMEOUT
 from database import search_by_model, search_by_keywords
 from logger import get_logger
+from metrics import UPSTREAM_ERRORS, span
+from overload import Overloaded, stage
+from singleflight import SingleFlight
 
 logger = get_logger("tools")
 
+# The same photo and prompt in flight twice → one vLLM request
+_vision_flight = SingleFlight("vision")
+
 
 # ---------------------------------------------------------------------------
 # Image utilities
@@ -30,6 +35,13 @@ def _call_vision(prompt: str, image_path: str, *,
                  temperature: float = 0.1, max_tokens: int = 50) -> str:
     """Send a vision request to the vLLM server and return the text response."""
     b64 = encode_image(image_path)
+    key = (prompt, hashlib.sha256(b64.encode()).hexdigest(), temperature, max_tokens)
+    return _vision_flight.do(key, _post_vision, prompt, b64, temperature, max_tokens)
+
+
+def _post_vision(prompt: str, b64: str, temperature: float, max_tokens: int) -> str:
+    import requests  # Deferred: keeps text-only imports light
+
     payload = {
         "model": VISION_MODEL,
         "messages": [{
@@ -42,10 +54,18 @@ def _call_vision(prompt: str, image_path: str, *,
         "temperature": temperature,
         "max_tokens": max_tokens,
     }
-    resp = requests.post(VLLM_URL, json=payload, timeout=VLLM_TIMEOUT)
-    data = resp.json()
+    try:
+        with stage("vision"), span("vision"):
+            resp = requests.post(VLLM_URL, json=payload, timeout=VLLM_TIMEOUT)
+            data = resp.json()
+    except Overloaded:
+        raise
+    except Exception:
+        UPSTREAM_ERRORS.inc(service="vllm")
+        raise
     if "choices" in data:
         return data["choices"][0]["message"]["content"].strip()
+    UPSTREAM_ERRORS.inc(service="vllm")
     raise RuntimeError(f"Unexpected vLLM response: {data}")
 
 
@@ -84,6 +104,9 @@ def extract_model(image_path: str) -> Dict[str, Any]:
         if model_text:
             return {"found": True, "model": model_text}
         return {"found": False, "message": "Không thể trích xuất model từ ảnh"}
+    except Overloaded as exc:
+        logger.warning("extract_model shed: %s", exc)
+        return {"found": False, "busy": True, "message": "Hệ thống đang bận"}
     except Exception as exc:
         logger.error("extract_model error: %s", exc)
         return {"found": False, "message": f"Lỗi Vision: {exc}"}
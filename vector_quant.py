@@ -0,0 +1,216 @@
+"""
+VIVOHOME AI - Quantized Vector Scan
+Int8 scalar quantization of product embeddings for the catalog artifact's
+brute-force scan. Each dimension is scaled to [-127, 127] (symmetric, per
+dimension), the scan ranks every row by the int8 approximation, and only a
+short list — k × VECTOR_RESCORE_FACTOR rows — is re-scored exactly against
+the float32 vectors. The codes are a quarter of the float bytes, and the
+float pages of the mapped artifact are only touched for those candidates.
+
+    python vector_quant.py bench [--rows 1000000] [--dim 384] [--k 5] [--artifact]
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app_config import VECTOR_RESCORE_FACTOR
+from logger import get_logger
+from metrics import percentile, span
+
+logger = get_logger("vector_quant")
+
+_SCAN_CHUNK = 1024  # rows converted per step; the float block stays in L2
+
+
+# ---------------------------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------------------------
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """float32 (n, d) → int8 codes (n, d) and the per-dimension scale (d,)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scale = np.abs(vectors).max(axis=0) / 127 if len(vectors) else np.ones(vectors.shape[1])
+    scale = np.where(scale > 0, scale, 1).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+    return codes, scale
+
+
+# ---------------------------------------------------------------------------
+# Search
+# ---------------------------------------------------------------------------
+
+def approx_distances(codes: np.ndarray, scale: np.ndarray, norms: np.ndarray,
+                     queries: np.ndarray) -> np.ndarray:
+    """
+    Squared L2 from each query to every row, less the constant |q|², with
+    the dot product taken against the int8 codes: (q · scale) · code.
+    """
+    n, d = codes.shape
+    weighted = (queries * scale).astype(np.float32).T
+    dots = np.empty((n, len(queries)), dtype=np.float32)
+    block = np.empty((min(_SCAN_CHUNK, n), d), dtype=np.float32)
+    for start in range(0, n, _SCAN_CHUNK):
+        end = min(start + _SCAN_CHUNK, n)
+        rows = block[:end - start]
+        np.copyto(rows, codes[start:end], casting="unsafe")
+        np.matmul(rows, weighted, out=dots[start:end])
+    return (norms[:, None] - 2 * dots).T
+
+
+def exact_search(vectors: np.ndarray, norms: np.ndarray, queries: np.ndarray,
+                 k: int, allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Float32 brute force: (rows, squared L2) per query, nearest first. Rows
+    outside the boolean mask *allowed* get an infinite distance.
+    """
+    dist = (np.einsum("ij,ij->i", queries, queries)[:, None] + norms[None, :]
+            - 2 * (queries @ vectors.T))
+    if allowed is not None:
+        dist[:, ~allowed] = np.inf
+    return _top(dist, k)
+
+
+def quantized_search(codes: np.ndarray, scale: np.ndarray, vectors: np.ndarray,
+                     norms: np.ndarray, queries: np.ndarray, k: int,
+                     factor: int = VECTOR_RESCORE_FACTOR,
+                     allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Int8 scan for k × *factor* candidates per query, then exact float32
+    distances for those rows only. Same contract as exact_search.
+    """
+    n = len(codes)
+    shortlist = min(max(k * factor, k), n)
+    with span("vector_scan"):
+        approx = approx_distances(codes, scale, norms, queries)
+        if allowed is not None:
+            approx[:, ~allowed] = np.inf
+        candidates = (np.argpartition(approx, shortlist - 1, axis=1)[:, :shortlist]
+                      if shortlist < n else np.tile(np.arange(n), (len(queries), 1)))
+    with span("vector_rescore"):
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        rows = np.empty((len(queries), min(k, n)), dtype=np.int64)
+        dist = np.empty(rows.shape, dtype=np.float32)
+        for i, cand in enumerate(candidates):
+            cand = np.sort(cand)  # sequential reads from the mapped float block
+            exact = q_norms[i] + norms[cand] - 2 * (vectors[cand] @ queries[i])
+            if allowed is not None:
+                exact[~allowed[cand]] = np.inf
+            top, d = _top(exact[None, :], k)
+            rows[i], dist[i] = cand[top[0]], d[0]
+    return rows, dist
+
+
+def _top(dist: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """The k smallest per row, ordered; ties keep row order."""
+    n = dist.shape[1]
+    k = min(k, n)
+    part = (np.argpartition(dist, k - 1, axis=1)[:, :k] if k < n
+            else np.tile(np.arange(n), (len(dist), 1)))
+    part.sort(axis=1)
+    order = np.argsort(np.take_along_axis(dist, part, axis=1), axis=1, kind="stable")
+    rows = np.take_along_axis(part, order, axis=1)
+    return rows, np.take_along_axis(dist, rows, axis=1)
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def synthetic_vectors(rows: int, dim: int, *, clusters: int = 1000,
+                      seed: int = 42) -> np.ndarray:
+    """Unit vectors around *clusters* centres — near neighbours are close, like products."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((rows, dim), dtype=np.float32)
+    for start in range(0, rows, 100_000):
+        end = min(start + 100_000, rows)
+        vectors[start:end] = (centres[rng.integers(0, clusters, end - start)]
+                              + 0.5 * rng.standard_normal((end - start, dim)))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def compare(vectors: np.ndarray, queries: np.ndarray, *, k: int = 5,
+            factors: Tuple[int, ...] = (1, 4, VECTOR_RESCORE_FACTOR)) -> Dict:
+    """
+    Recall@k of the quantized search against the float32 baseline, with
+    per-query latency and the bytes each scan reads, for each rescore factor.
+    """
+    norms = np.einsum("ij,ij->i", vectors, vectors)
+    codes, scale = quantize(vectors)
+
+    def timed(fn) -> Tuple[List[np.ndarray], List[float]]:
+        fn(queries[:1])  # warm-up
+        found, ms = [], []
+        for q in queries:
+            start = time.perf_counter()
+            found.append(fn(q[None, :])[0][0])
+            ms.append((time.perf_counter() - start) * 1000)
+        return found, ms
+
+    def latency(ms: List[float]) -> Dict:
+        return {"p50_ms": round(percentile(ms, 50), 2), "p95_ms": round(percentile(ms, 95), 2)}
+
+    baseline, base_ms = timed(lambda q: exact_search(vectors, norms, q, k))
+    n, dim = vectors.shape
+    report = {"rows": n, "dim": dim, "k": k, "queries": len(queries),
+              "float32": {"bytes": int(vectors.nbytes), **latency(base_ms)}}
+    for factor in factors:
+        found, ms = timed(lambda q: quantized_search(codes, scale, vectors, norms, q, k, factor))
+        recall = np.mean([len(set(a) & set(b)) / len(a) for a, b in zip(baseline, found)])
+        report[f"int8x{factor}"] = {
+            "bytes": int(codes.nbytes + scale.nbytes),
+            "bytes_read": int(codes.nbytes + min(k * factor, n) * dim * 4),
+            "recall": round(float(recall), 4), **latency(ms)}
+    return report
+
+
+def _bench_inputs(rows: int, dim: int, n_queries: int,
+                  artifact: bool) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(7)
+    if artifact:
+        from catalog import current_artifact, get_catalog
+        if not current_artifact() or get_catalog().embeddings is None:
+            raise SystemExit("No catalog artifact with embeddings (catalog_build.py --embeddings)")
+        vectors = np.asarray(get_catalog().embeddings, dtype=np.float32)
+    else:
+        vectors = synthetic_vectors(rows, dim)
+    picks = vectors[rng.integers(0, len(vectors), n_queries)]
+    noise = rng.standard_normal(picks.shape).astype(np.float32) * 0.3 / np.sqrt(picks.shape[1])
+    return vectors, (picks + noise).astype(np.float32)
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Int8 vector scan: recall, memory, latency")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench")
+    bench.add_argument("--rows", type=int, default=200_000)
+    bench.add_argument("--dim", type=int, default=384)
+    bench.add_argument("--queries", type=int, default=50)
+    bench.add_argument("--k", type=int, default=5)
+    bench.add_argument("--artifact", action="store_true",
+                       help="use the published catalog artifact's embeddings")
+    bench.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    data, probe = _bench_inputs(args.rows, args.dim, args.queries, args.artifact)
+    result = compare(data, probe, k=args.k)
+    print(f"{result['rows']} rows × {result['dim']} dims, k={result['k']}")
+    print(f"{'scan':<10}{'MB':>9}{'MB read':>9}{'recall':>8}{'p50 ms':>8}{'p95 ms':>8}")
+    for name, r in result.items():
+        if isinstance(r, dict):
+            read = r.get("bytes_read", r["bytes"]) / 1e6
+            print(f"{name:<10}{r['bytes'] / 1e6:>9.1f}{read:>9.1f}{r.get('recall', 1.0):>8}"
+                  f"{r['p50_ms']:>8}{r['p95_ms']:>8}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
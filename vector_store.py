@@ -1,39 +1,181 @@
 """
 VIVOHOME AI - Vector Store (ChromaDB)
 Semantic search for products using multilingual sentence embeddings.
+
+Only stable descriptive fields are embedded (product_document); price and
+stock are typed metadata, so a price change is a metadata write, never a
+forward pass, and results can be filtered by price numerically. Changing
+what is embedded means bumping DOC_SCHEMA, which rebuilds the Chroma
+collection (and the artifact's embeddings) once.
 """
 
-from typing import Dict, List, Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
 
-from app_config import CHROMA_PATH, DB_PATH, EMBEDDING_MODEL
+from app_config import (CHROMA_PATH, DB_PATH, EMBEDDING_BACKEND, EMBEDDING_CACHE_SIZE,
+                        EMBEDDING_MODEL, VECTOR_QUANTIZE)
+from catalog import Catalog, current_artifact, get_catalog
 from logger import get_logger
+from metrics import CACHE_HITS, CACHE_MISSES, UPSTREAM_ERRORS, span
+from normalizer import normalize
+from singleflight import SingleFlight
+from vector_quant import exact_search, quantized_search
 
 logger = get_logger("vector_store")
 
+# Version of the embedded document text; bump whenever product_document changes
+DOC_SCHEMA = 2
+
+Metadata = Dict[str, Union[str, int]]
+
 # Lazy imports — chromadb may not be installed in all environments
 _client = None
 _collection = None
+_embedding_fn = None
+_init_lock = threading.Lock()  # Warm-up thread and first query must not load twice
+_pending_metadata: Dict[str, Metadata] = {}  # live updates before Chroma loaded
+
+# Query text → embedding (LRU); repeated queries skip the forward pass
+_embedding_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+_search_flight = SingleFlight("semantic")
 
 
 def _get_collection():
     """Lazy-init ChromaDB collection (singleton)."""
-    global _client, _collection
+    global _client, _collection, _embedding_fn
     if _collection is not None:
         return _collection
 
-    import chromadb
-    from chromadb.utils import embedding_functions
+    with _init_lock:
+        if _collection is not None:
+            return _collection
 
-    _client = chromadb.PersistentClient(path=CHROMA_PATH)
-    embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name=EMBEDDING_MODEL
-    )
-    _collection = _client.get_or_create_collection(
+        import chromadb
+        from chromadb.utils import embedding_functions
+
+        _client = chromadb.PersistentClient(path=CHROMA_PATH)
+        if EMBEDDING_BACKEND == "torch":
+            _embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
+                model_name=EMBEDDING_MODEL
+            )
+        else:
+            from embeddings import load_embedder
+            _embedding_fn = load_embedder()
+        collection = _open_collection(_client, _embedding_fn)
+        if _pending_metadata:
+            if collection.count() > 0:  # an empty store is built from the updated DB
+                ids = list(_pending_metadata)
+                collection.update(ids=ids, metadatas=[_pending_metadata[i] for i in ids])
+            _pending_metadata.clear()
+        _collection = collection
+    return _collection
+
+
+def _open_collection(client, embedding_fn):
+    """The products collection, recreated empty if its documents predate DOC_SCHEMA."""
+    # Read what is stored before get_or_create_collection(metadata=...), which
+    # may overwrite it with the current schema and hide stale documents.
+    try:
+        stored = client.get_collection(name="products", embedding_function=embedding_fn)
+    except Exception:  # missing; chromadb's error type differs between versions
+        stored = None
+    if stored is not None:
+        schema = (stored.metadata or {}).get("doc_schema")
+        if schema == DOC_SCHEMA:
+            return stored
+        if stored.count() > 0:
+            logger.warning("Vector store documents are schema %s, expected %d — re-embedding",
+                           schema, DOC_SCHEMA)
+        client.delete_collection("products")
+    return client.get_or_create_collection(
         name="products",
         embedding_function=embedding_fn,
-        metadata={"description": "VIVOHOME product embeddings"},
+        metadata={"description": "VIVOHOME product embeddings", "doc_schema": DOC_SCHEMA},
     )
-    return _collection
+
+
+def _artifact_catalog() -> Optional[Catalog]:
+    """The mapped catalog, when the published artifact carries embeddings."""
+    if not current_artifact():
+        return None
+    catalog = get_catalog()
+    return catalog if catalog.embeddings is not None else None
+
+
+def _get_embedding_fn():
+    """Query encoder: Chroma's, or the EMBEDDING_BACKEND encoder when product
+    vectors come from the catalog artifact (Chroma never loads)."""
+    global _embedding_fn
+    if _embedding_fn is None:
+        if _artifact_catalog() is None:
+            _get_collection()
+        else:
+            with _init_lock:
+                if _embedding_fn is None:
+                    from embeddings import load_embedder
+                    _embedding_fn = load_embedder()
+    return _embedding_fn
+
+
+def warm_up() -> None:
+    """Load the collection and run one query so model weights are resident."""
+    if _artifact_catalog() is not None:
+        embed_queries(["warm up"])
+        return
+    collection = _get_collection()
+    if collection.count() == 0:
+        init_vector_store()
+    collection.query(query_texts=["warm up"], n_results=1)
+
+
+def product_document(row) -> str:
+    """
+    Text embedded for a products row (Chroma and catalog_build --embeddings):
+    descriptive fields only — price and stock go in metadata. Bump DOC_SCHEMA
+    when this changes.
+    """
+    return (
+        f"Tên sản phẩm: {row['ten_san_pham']}  "
+        f"Model: {row['model'] or 'N/A'}  "
+        f"Thông số: {row['thong_so_chinh'] or 'N/A'}  "
+        f"Nhóm hàng: {row['nhom_hang_loai'] or 'N/A'}"
+    )
+
+
+def product_metadata(row) -> Metadata:
+    """
+    Chroma metadata for a products row (what search results are built from).
+    Price and stock are ints (stock -1 = unknown) so ``where`` can compare them.
+    """
+    stock = row["ton_kho"] if "ton_kho" in row.keys() else None
+    return {
+        "ten": row["ten_san_pham"],
+        "model": row["model"] or "N/A",
+        "gia": int(row["gia"] or 0),
+        "ton_kho": -1 if stock is None else int(stock),
+        "nsx": row["thong_so_chinh"] or "N/A",
+        "nhom_hang": row["nhom_hang"] or "N/A",
+    }
+
+
+def update_metadata(metadatas: Dict[str, Metadata]) -> None:
+    """
+    Replace metadata for document ids (``product_<id>``) in place — the
+    embeddings are kept. Queued until Chroma is loaded in this process.
+    """
+    if not metadatas:
+        return
+    with _init_lock:
+        if _collection is None:
+            _pending_metadata.update(metadatas)
+            return
+    ids = list(metadatas)
+    _collection.update(ids=ids, metadatas=[metadatas[i] for i in ids])
 
 
 def init_vector_store():
@@ -58,21 +200,8 @@ def init_vector_store():
     documents, metadatas, ids = [], [], []
 
     for row in rows:
-        text = (
-            f"Tên sản phẩm: {row['ten_san_pham']}  "
-            f"Model: {row['model'] or 'N/A'}  "
-            f"Thông số: {row['thong_so_chinh'] or 'N/A'}  "
-            f"Giá: {row['gia']:,} VND  "
-            f"Nhóm hàng: {row['nhom_hang_loai'] or 'N/A'}"
-        )
-        documents.append(text)
-        metadatas.append({
-            "ten": row["ten_san_pham"],
-            "model": row["model"] or "N/A",
-            "gia": str(row["gia"]),
-            "nsx": row["thong_so_chinh"] or "N/A",
-            "nhom_hang": row["nhom_hang"] or "N/A",
-        })
+        documents.append(product_document(row))
+        metadatas.append(product_metadata(row))
         ids.append(f"product_{row['id']}")
 
     logger.info("Embedding %d products into vector store...", len(documents))
@@ -81,46 +210,157 @@ def init_vector_store():
     return collection
 
 
-def semantic_search(query: str, n_results: int = 5) -> Dict:
+def embed_queries(texts: List[str]) -> List[List[float]]:
+    """Embed query texts in one forward pass, reusing cached vectors."""
+    embed = _get_embedding_fn()
+    # Case/Unicode/tone-placement variants share one embedding and cache slot
+    texts = [normalize(t) for t in texts]
+    found: Dict[str, List[float]] = {}
+    with _cache_lock:
+        for t in texts:
+            if t in _embedding_cache:
+                _embedding_cache.move_to_end(t)
+                found[t] = _embedding_cache[t]
+    missing = [t for t in dict.fromkeys(texts) if t not in found]
+    if found:
+        CACHE_HITS.inc(len(texts) - len(missing), cache="embedding")
+
+    if missing:
+        CACHE_MISSES.inc(len(missing), cache="embedding")
+        with span("embed") as sp:
+            vectors = embed(missing)
+            sp.count = len(missing)
+        with _cache_lock:
+            for t, v in zip(missing, vectors):
+                v = v.tolist() if hasattr(v, "tolist") else list(v)
+                found[t] = _embedding_cache[t] = v
+            while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+                _embedding_cache.popitem(last=False)
+    return [found[t] for t in texts]
+
+
+PriceRange = Tuple[Optional[int], Optional[int]]
+
+
+def semantic_search(query: str, n_results: int = 5,
+                    price_range: Optional[PriceRange] = None) -> Dict:
     """
     Search products by semantic similarity.
 
     Returns:
         {"found": bool, "count": int, "products": [...]}
     """
+    return _search_flight.do((normalize(query), n_results, price_range),
+                             lambda: semantic_search_many([query], n_results, price_range)[0])
+
+
+def _price_where(price_range: Optional[PriceRange]) -> Optional[Dict]:
+    """Chroma ``where`` for (min, max) VND, either bound optional."""
+    low, high = price_range or (None, None)
+    bounds = ([{"gia": {"$gte": int(low)}}] if low is not None else []) + \
+             ([{"gia": {"$lte": int(high)}}] if high is not None else [])
+    if len(bounds) > 1:
+        return {"$and": bounds}
+    return bounds[0] if bounds else None
+
+
+def semantic_search_many(queries: List[str], n_results: int = 5,
+                         price_range: Optional[PriceRange] = None) -> List[Dict]:
+    """
+    Batch semantic search: one embedding pass and one multi-query Chroma
+    call for all *queries*. Results are returned in input order; with
+    *price_range* (min, max VND, either may be None) only products priced
+    within it are returned.
+    """
+    if not queries:
+        return []
     try:
+        catalog = _artifact_catalog()
+        if catalog is not None:
+            return _search_catalog(catalog, queries, n_results, price_range)
+
         collection = _get_collection()
         if collection.count() == 0:
             init_vector_store()
 
-        results = collection.query(
-            query_texts=[query],
-            n_results=min(n_results, collection.count()),
-            include=["metadatas", "documents", "distances"],
-        )
-
-        products = []
-        if results and results["metadatas"]:
-            for i, meta in enumerate(results["metadatas"][0]):
-                distance = results["distances"][0][i] if results["distances"] else 0
-                similarity = round(1 - distance, 3)
-
-                products.append({
-                    "ten": meta.get("ten", "N/A"),
-                    "model": meta.get("model", "N/A"),
-                    "gia": int(meta.get("gia", 0)),
-                    "nsx": meta.get("nsx", "N/A"),
-                    "nhom_hang": meta.get("nhom_hang", "N/A"),
-                    "similarity": similarity,
-                    "source": "vector_db",
-                })
-
-        logger.info("Semantic search: %d results for '%s'", len(products), query[:50])
-        return {"found": len(products) > 0, "count": len(products), "products": products}
+        embeddings = embed_queries(list(queries))
+        with span("chroma_query"):
+            results = collection.query(
+                query_embeddings=embeddings,
+                n_results=min(n_results, collection.count()),
+                where=_price_where(price_range),
+                include=["metadatas", "documents", "distances"],
+            )
+
+        out = []
+        for q_idx, query in enumerate(queries):
+            products = []
+            if results and results["metadatas"]:
+                distances = results["distances"][q_idx] if results["distances"] else None
+                for i, meta in enumerate(results["metadatas"][q_idx]):
+                    distance = distances[i] if distances else 0
+                    similarity = round(1 - distance, 3)
+
+                    products.append({
+                        "ten": meta.get("ten", "N/A"),
+                        "model": meta.get("model", "N/A"),
+                        "gia": int(meta.get("gia", 0)),
+                        "nsx": meta.get("nsx", "N/A"),
+                        "nhom_hang": meta.get("nhom_hang", "N/A"),
+                        "similarity": similarity,
+                        "source": "vector_db",
+                    })
+            logger.info("Semantic search: %d results for '%s'", len(products), query[:50])
+            out.append({"found": len(products) > 0, "count": len(products),
+                        "products": products})
+        return out
 
     except Exception as exc:
+        UPSTREAM_ERRORS.inc(service="vector_store")
         logger.error("Semantic search error: %s", exc)
-        return {"found": False, "error": str(exc)}
+        return [{"found": False, "error": str(exc)} for _ in queries]
+
+
+def _search_catalog(catalog: Catalog, queries: List[str], n_results: int,
+                    price_range: Optional[PriceRange] = None) -> List[Dict]:
+    """
+    Nearest neighbours over the artifact's memory-mapped embeddings: an int8
+    scan with float re-scoring when the artifact has codes (VECTOR_QUANTIZE),
+    else an exact float scan. Prices come from the live catalog columns.
+    """
+    k = min(n_results, catalog.size)
+    if k <= 0:
+        return [{"found": False, "count": 0, "products": []} for _ in queries]
+    allowed = None
+    if price_range is not None:
+        low, high = price_range
+        allowed = np.ones(catalog.size, dtype=bool)
+        if low is not None:
+            allowed &= catalog.gia >= low
+        if high is not None:
+            allowed &= catalog.gia <= high
+    q = np.asarray(embed_queries(list(queries)), dtype=np.float32)
+    # Squared L2 — Chroma's default space — so "1 - distance" means the same
+    if VECTOR_QUANTIZE and catalog.embedding_codes is not None:
+        rows, dist = quantized_search(catalog.embedding_codes, catalog.embedding_scale,
+                                      catalog.embeddings, catalog.embedding_norms, q, k,
+                                      allowed=allowed)
+    else:
+        with span("vector_scan"):
+            rows, dist = exact_search(catalog.embeddings, catalog.embedding_norms, q, k,
+                                      allowed=allowed)
+
+    out = []
+    for query, order, distances in zip(queries, rows, dist):
+        products = [{
+            **catalog.product(i),
+            "nhom_hang": catalog.nhom_hang[i] or "N/A",
+            "similarity": round(1 - float(d), 3),
+            "source": "vector_db",
+        } for i, d in zip(order, distances) if np.isfinite(d)]  # inf = filtered out
+        logger.info("Semantic search: %d results for '%s'", len(products), query[:50])
+        out.append({"found": bool(products), "count": len(products), "products": products})
+    return out
 
 
 def hybrid_search(query: str, keyword_results: Optional[List] = None,
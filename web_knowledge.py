@@ -0,0 +1,195 @@
+"""
+VIVOHOME AI - Local Web Knowledge Store
+SQLite FTS5 snapshot of web answers: harvested Tavily responses and curated
+competitor price sheets. web_search() checks it before calling the live API
+(WEB_SEARCH_MODE), so repeat fallbacks cost milliseconds and offline
+deployments still answer from the snapshot.
+
+    python web_knowledge.py ingest prices.csv      # price sheet
+    python web_knowledge.py ingest harvest.jsonl   # {"query", "answer", "results"}
+    python web_knowledge.py search "iphone 15 pro max"
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional
+
+from app_config import WEB_KNOWLEDGE_MAX_AGE_DAYS, WEB_KNOWLEDGE_PATH
+from logger import get_logger
+from metrics import CACHE_HITS, CACHE_MISSES
+from normalizer import tokenize
+
+logger = get_logger("web_knowledge")
+
+
+# ---------------------------------------------------------------------------
+# Storage
+# ---------------------------------------------------------------------------
+
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(path or WEB_KNOWLEDGE_PATH, timeout=5)
+    conn.row_factory = sqlite3.Row
+    # search_text holds the folded query + title + content, so lookups are
+    # accent-insensitive like the catalog search.
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS documents USING fts5(
+            search_text,
+            type UNINDEXED, title UNINDEXED, content UNINDEXED,
+            url UNINDEXED, source UNINDEXED, fetched_at UNINDEXED
+        )
+    """)
+    return conn
+
+
+def add_documents(query: str, results: Iterable[Dict], *, path: Optional[str] = None) -> int:
+    """
+    Store web_search()-shaped results. Documents with the same url (or the
+    same answer text) are replaced, so re-harvesting refreshes prices.
+    """
+    now = time.time()
+    rows = []
+    for r in results:
+        text = " ".join([query or "", r.get("title", ""), r.get("content", "")])
+        rows.append((" ".join(tokenize(text)), r["type"], r.get("title", ""),
+                     r.get("content", ""), r.get("url", ""), r.get("source", ""), now))
+    if not rows:
+        return 0
+    conn = _connect(path)
+    try:
+        with conn:
+            for row in rows:
+                key, value = ("url", row[4]) if row[4] else ("content", row[3])
+                conn.execute(f"DELETE FROM documents WHERE {key} = ?", (value,))
+            conn.executemany("INSERT INTO documents VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    finally:
+        conn.close()
+    return len(rows)
+
+
+def lookup(query: str, max_results: int = 3, *, path: Optional[str] = None) -> Dict:
+    """
+    Full-text lookup in the same schema as web_search():
+    ``{"found": bool, "count": int, "results": [...]}``. Every query token
+    must appear in a document; at most one "answer" plus *max_results*
+    web results are returned, best BM25 first.
+    """
+    tokens = tokenize(query)
+    if not tokens or not os.path.exists(path or WEB_KNOWLEDGE_PATH):
+        CACHE_MISSES.inc(cache="web_knowledge")
+        return {"found": False}
+
+    match = " ".join(f'"{t}"' for t in tokens)
+    min_time = (time.time() - WEB_KNOWLEDGE_MAX_AGE_DAYS * 86400
+                if WEB_KNOWLEDGE_MAX_AGE_DAYS > 0 else 0)
+    conn = _connect(path)
+    try:
+        rows = conn.execute("""
+            SELECT type, title, content, url, source FROM documents
+            WHERE documents MATCH ? AND fetched_at >= ?
+            ORDER BY bm25(documents) LIMIT ?
+        """, (f"search_text : ({match})", min_time, max_results + 1)).fetchall()
+    except sqlite3.Error as exc:
+        logger.warning("Web knowledge lookup failed: %s", exc)
+        rows = []
+    finally:
+        conn.close()
+
+    results: List[Dict] = []
+    answers = [r for r in rows if r["type"] == "answer"][:1]
+    pages = [r for r in rows if r["type"] != "answer"][:max_results]
+    for r in answers:
+        results.append({"type": "answer", "content": r["content"], "source": r["source"]})
+    for r in pages:
+        results.append({"type": "web_result", "title": r["title"], "content": r["content"],
+                        "url": r["url"], "source": r["source"]})
+
+    if results:
+        CACHE_HITS.inc(cache="web_knowledge")
+        logger.info("Web knowledge hit: %d results for '%s'", len(results), query[:60])
+        return {"found": True, "count": len(results), "results": results}
+    CACHE_MISSES.inc(cache="web_knowledge")
+    return {"found": False}
+
+
+# ---------------------------------------------------------------------------
+# Ingestion
+# ---------------------------------------------------------------------------
+
+def ingest_price_sheet(csv_path: str, *, path: Optional[str] = None) -> int:
+    """
+    Load a competitor price sheet: CSV with ``product,price,retailer`` and
+    optional ``url,notes`` columns.
+    """
+    count = 0
+    with open(csv_path, encoding="utf-8-sig", newline="") as f:
+        for row in csv.DictReader(f):
+            product = (row.get("product") or "").strip()
+            if not product:
+                continue
+            retailer = (row.get("retailer") or "").strip()
+            try:
+                price = f"{int(float(row.get('price') or 0)):,} VND"
+            except ValueError:
+                price = (row.get("price") or "").strip()
+            content = f"Giá {price} tại {retailer}. {row.get('notes') or ''}".strip()
+            count += add_documents(product, [{
+                "type": "web_result",
+                "title": f"{product} - {retailer}" if retailer else product,
+                "content": content,
+                "url": (row.get("url") or "").strip(),
+                "source": "price_sheet",
+            }], path=path)
+    logger.info("Ingested %d price-sheet rows from %s", count, csv_path)
+    return count
+
+
+def ingest_harvest(jsonl_path: str, *, path: Optional[str] = None) -> int:
+    """Load harvested Tavily responses: one ``{"query", "answer", "results"}`` per line."""
+    count = 0
+    with open(jsonl_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            results = []
+            if item.get("answer"):
+                results.append({"type": "answer", "content": item["answer"],
+                                "source": "tavily_ai"})
+            for r in item.get("results", []):
+                results.append({"type": "web_result", "title": r.get("title", ""),
+                                "content": (r.get("content") or "")[:300],
+                                "url": r.get("url", ""), "source": "web_search"})
+            count += add_documents(item.get("query", ""), results, path=path)
+    logger.info("Ingested %d harvested documents from %s", count, jsonl_path)
+    return count
+
+
+def count_documents(path: Optional[str] = None) -> int:
+    if not os.path.exists(path or WEB_KNOWLEDGE_PATH):
+        return 0
+    conn = _connect(path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# CLI
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) >= 3 and sys.argv[1] == "ingest":
+        for file in sys.argv[2:]:
+            loader = ingest_harvest if file.endswith(".jsonl") else ingest_price_sheet
+            loader(file)
+        print(f"{count_documents()} documents in {WEB_KNOWLEDGE_PATH}")
+    elif len(sys.argv) >= 3 and sys.argv[1] == "search":
+        print(json.dumps(lookup(" ".join(sys.argv[2:])), ensure_ascii=False, indent=2))
+    else:
+        print(__doc__)
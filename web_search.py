@@ -1,28 +1,79 @@
 """
 VIVOHOME AI - Web Search (Tavily API)
 Fallback search when products are not found in the local database.
+The local web knowledge store (web_knowledge.py) is checked first.
 """
 
-import requests
-from typing import Dict, List
+import sqlite3
+import threading
+from typing import Dict, List, Optional
 
-from app_config import TAVILY_API_KEY, TAVILY_SEARCH_URL, WEB_SEARCH_TIMEOUT
+from app_config import (TAVILY_API_KEY, TAVILY_SEARCH_URL, WEB_KNOWLEDGE_HARVEST,
+                        WEB_SEARCH_MODE, WEB_SEARCH_TIMEOUT)
 from logger import get_logger
+from metrics import UPSTREAM_ERRORS
+from normalizer import normalize
+from overload import Overloaded, stage
+from singleflight import SingleFlight
+from web_knowledge import add_documents, lookup
 
 logger = get_logger("web_search")
 
+_flight = SingleFlight("web")
 
-def web_search(query: str, max_results: int = 3) -> Dict:
+
+def web_search(query: str, max_results: int = 3,
+               cancelled: Optional[threading.Event] = None) -> Dict:
     """
-    Search the web using Tavily API.
+    Search the web: local snapshot first, then the Tavily API.
+
+    WEB_SEARCH_MODE selects the sources — ``hybrid`` (local, then live),
+    ``offline`` (local only) or ``live`` (Tavily only). Live answers are
+    harvested into the local store when WEB_KNOWLEDGE_HARVEST is on.
 
     Args:
         query: Natural-language search query.
         max_results: Maximum number of results to return.
+        cancelled: Set by a caller that no longer needs the answer (an
+            early or abandoned call); checked before the paid live request.
 
     Returns:
         {"found": bool, "count": int, "results": [...]}
     """
+    # Cancellable calls only share with themselves: one caller's cancel
+    # must not empty another's answer
+    return _flight.do((normalize(query), max_results, cancelled),
+                      _web_search, query, max_results, cancelled)
+
+
+def _web_search(query: str, max_results: int,
+                cancelled: Optional[threading.Event] = None) -> Dict:
+    if WEB_SEARCH_MODE != "live":
+        local = lookup(query, max_results)
+        if local.get("found"):
+            return local
+        if WEB_SEARCH_MODE == "offline":
+            return {"found": False, "error": "Offline mode: no local match"}
+    if cancelled is not None and cancelled.is_set():
+        return {"found": False, "error": "cancelled"}
+
+    try:
+        with stage("web"):
+            result = _tavily_search(query, max_results)
+    except Overloaded as exc:
+        return {"found": False, "error": str(exc)}
+    if result.get("found") and WEB_KNOWLEDGE_HARVEST:
+        try:
+            add_documents(query, result["results"])
+        except sqlite3.Error as exc:
+            logger.warning("Could not store web results: %s", exc)
+    return result
+
+
+def _tavily_search(query: str, max_results: int) -> Dict:
+    """Live Tavily API call."""
+    import requests  # Deferred: only paid when the web fallback actually runs
+
     try:
         logger.info("Web search: '%s'", query[:80])
 
@@ -40,6 +91,7 @@ def web_search(query: str, max_results: int = 3) -> Dict:
         )
 
         if response.status_code != 200:
+            UPSTREAM_ERRORS.inc(service="tavily")
             logger.warning("Tavily API error: HTTP %d", response.status_code)
             return {"found": False, "error": f"API error: {response.status_code}"}
 
@@ -68,9 +120,11 @@ def web_search(query: str, max_results: int = 3) -> Dict:
         return {"found": len(results) > 0, "count": len(results), "results": results}
 
     except requests.exceptions.Timeout:
+        UPSTREAM_ERRORS.inc(service="tavily")
         logger.warning("Web search timed out after %ds", WEB_SEARCH_TIMEOUT)
         return {"found": False, "error": "Search timeout"}
     except Exception as exc:
+        UPSTREAM_ERRORS.inc(service="tavily")
         logger.error("Web search error: %s", exc)
         return {"found": False, "error": str(exc)}
 
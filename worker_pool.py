@@ -0,0 +1,271 @@
+"""
+VIVOHOME AI - Multi-process Search Serving
+Runs the GIL-bound pipeline (intent parsing, DB filtering, keyword scoring,
+response formatting) in N worker processes behind the UI.
+
+    UI process ──► ProcessPoolExecutor (N workers, read-only mmap'd SQLite)
+                        │ semantic_search()
+                        ▼
+                   embedding server (one process owns the model + Chroma)
+"""
+
+import os
+import secrets
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.managers import BaseManager
+from typing import Any, Dict, List, Optional, Tuple
+
+import querylog
+from app_config import MAX_SEARCH_RESULTS
+from logger import get_logger
+from metrics import drain, merge
+from normalizer import normalize
+from singleflight import SingleFlight
+
+logger = get_logger("worker_pool")
+
+_WARM_UP_TIMEOUT_S = 120  # every worker must have started by then
+
+
+# ---------------------------------------------------------------------------
+# Embedding server (single process)
+# ---------------------------------------------------------------------------
+
+class _VectorIndex:
+    """Lives in the embedding server; workers call it through a proxy."""
+
+    def search(self, query: str, n_results: int = 5) -> Dict:
+        from vector_store import semantic_search
+        return semantic_search(query, n_results=n_results)
+
+    def search_many(self, queries: List[str], n_results: int = 5,
+                    price_range: Optional[Tuple[Optional[int], Optional[int]]] = None
+                    ) -> List[Dict]:
+        from vector_store import semantic_search_many
+        return semantic_search_many(queries, n_results=n_results, price_range=price_range)
+
+    def warm_up(self) -> None:
+        from vector_store import warm_up
+        warm_up()
+
+
+_index: Optional[_VectorIndex] = None
+
+
+def _get_index() -> _VectorIndex:
+    global _index
+    if _index is None:
+        _index = _VectorIndex()
+    return _index
+
+
+class EmbeddingManager(BaseManager):
+    """multiprocessing manager exposing the shared ``vector_index``."""
+
+
+EmbeddingManager.register("vector_index", callable=_get_index)
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+_engine = None
+_warm_barrier = None
+
+
+def _init_worker(address: Tuple[str, int], authkey: bytes, use_web: bool,
+                 warm_barrier) -> None:
+    """Per-process setup: read-only catalog + proxy to the embedding server."""
+    global _engine, _warm_barrier
+    import database
+    from rag_engine import RAGEngine
+
+    database.use_read_only_connections()
+    _warm_barrier = warm_barrier
+    querylog.query_log.enabled = False  # the parent logs, so one process owns the file
+
+    manager = EmbeddingManager(address=address, authkey=authkey)
+    manager.connect()
+    index = manager.vector_index()
+
+    _engine = RAGEngine(use_web_fallback=use_web, use_semantic=True,
+                        semantic_backend=index.search, semantic_backend_many=index.search_many)
+    logger.info("Search worker %d ready", os.getpid())
+
+
+# The front end admits each request (rag_engine.admit) and passes the load
+# level along: a worker only ever has one request in flight, so its own
+# controller would never see the queue building up in front of it.
+# Each call returns (result, metric deltas); the front end merges the deltas
+# so stage latencies recorded here reach its /metrics.
+
+def _worker_search(query: str, max_results: int, with_candidates: bool = False,
+                   level: int = 0) -> Tuple[Dict, Dict]:
+    return (_engine.search(query, max_results, with_candidates=with_candidates, level=level),
+            drain())
+
+
+def _worker_search_many(queries: List[str], max_results: int,
+                        level: int = 0) -> Tuple[List[Dict], Dict]:
+    return _engine.search_many(queries, max_results, level=level), drain()
+
+
+def _worker_process(query: str, structured: bool = False,
+                    level: int = 0) -> Tuple[Tuple[Any, Dict], Dict]:
+    # The raw result goes back too: the front end writes the query log
+    result = _engine.search(query, level=level)
+    return (_engine.generate_response(query, result, structured), result), drain()
+
+
+def _worker_warm_up() -> Tuple[int, Dict]:
+    """
+    Warm this process, then wait for the rest: while every warm-up task
+    waits at once, each holds a different worker, so none starts cold.
+    """
+    _engine.search("warm up", 1, level=0)
+    _warm_barrier.wait(_WARM_UP_TIMEOUT_S)
+    return os.getpid(), drain()
+
+
+def _merged(shipped: Tuple[Any, Dict]) -> Any:
+    """A worker's result, after folding its metric deltas into this process."""
+    result, deltas = shipped
+    merge(deltas)
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+class SearchWorkerPool:
+    """
+    Drop-in for ``RAGEngine.search`` / ``RAGEngine.process`` that fans work
+    out to worker processes. Call ``close()`` (or use as a context manager)
+    to stop the workers and the embedding server.
+    """
+
+    def __init__(self, workers: int, *, use_web_fallback: bool = True):
+        self.workers = workers
+        ctx = get_context("spawn")  # fork + background threads is unsafe
+
+        # Workers open the catalog read-only, so migrate it here first
+        from database import get_connection
+        get_connection().close()
+
+        authkey = secrets.token_bytes(16)
+        self._manager = EmbeddingManager(address=("127.0.0.1", 0), authkey=authkey,
+                                         ctx=ctx)
+        self._manager.start()
+        address = self._manager.address
+        self._index = self._manager.vector_index()
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=ctx, initializer=_init_worker,
+            initargs=(address, authkey, use_web_fallback, ctx.Barrier(workers)),
+        )
+        self._flight = SingleFlight("pool_search")
+        logger.info("Search pool started: %d workers, embedding server at %s:%d",
+                    workers, *address)
+
+    def search(self, query: str, max_results: int = MAX_SEARCH_RESULTS, *,
+               with_candidates: bool = False) -> Dict:
+        from rag_engine import admit
+
+        # Identical concurrent queries share one worker round-trip
+        start = time.perf_counter()
+        result = self._flight.do(
+            (normalize(query), max_results, with_candidates),
+            lambda: admit(query, lambda level: _merged(self._executor.submit(
+                _worker_search, query, max_results, with_candidates, level).result())))
+        querylog.record(query, result, (time.perf_counter() - start) * 1000)
+        return result
+
+    def search_many(self, queries: List[str],
+                    max_results: int = MAX_SEARCH_RESULTS) -> List[Dict]:
+        """
+        The whole batch goes to one worker: its engine embeds every query in
+        one model call and ranks each distinct intent once, which splitting
+        across workers would undo. Results keep input order.
+        """
+        from overload import BUSY, controller
+        from rag_engine import busy_result
+
+        with controller.request() as level:
+            if level >= BUSY:
+                return [busy_result(q) for q in queries]
+            return _merged(self._executor.submit(_worker_search_many, queries, max_results,
+                                                 level).result())
+
+    def process(self, query: str, structured: bool = False):
+        from overload import BUSY, controller
+        from rag_engine import busy_result
+
+        start = time.perf_counter()
+        with controller.request() as level:
+            if level >= BUSY:
+                result = busy_result(query)
+                answer = self.generate_response(query, result, structured)
+            else:
+                answer, result = _merged(self._executor.submit(
+                    _worker_process, query, structured, level).result())
+        querylog.record(query, result, (time.perf_counter() - start) * 1000)
+        return answer
+
+    def semantic_search_many(self, queries: List[str], n_results: int = MAX_SEARCH_RESULTS,
+                             price_range: Optional[Tuple[Optional[int], Optional[int]]] = None
+                             ) -> List[Dict]:
+        """Raw batch semantic search on the embedding server (the one model)."""
+        return self._index.search_many(queries, n_results, price_range)
+
+    @staticmethod
+    def generate_response(query: str, search_result: Dict, structured: bool = False):
+        """Format locally — cheap next to a round-trip to a worker."""
+        from formatter import format_result
+        return format_result(search_result, structured)
+
+    def warm_up(self) -> None:
+        """Start every worker process, then load the embedding model once."""
+        self._warm_workers()
+        self._index.warm_up()
+
+    def _warm_workers(self) -> List[int]:
+        """One warm-up search in each worker process; returns their pids."""
+        futures = [self._executor.submit(_worker_warm_up) for _ in range(self.workers)]
+        return [_merged(f.result()) for f in futures]
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._manager.shutdown()
+
+    def __enter__(self) -> "SearchWorkerPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# ---------------------------------------------------------------------------
+# CLI test
+# ---------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    queries = ["TV giá cao nhất", "Tủ lạnh rẻ nhất", "So sánh TV Samsung và LG",
+               "Máy lọc nước Hòa Phát", "Bình tắm Rossi"] * 40
+
+    with SearchWorkerPool(os.cpu_count() or 2, use_web_fallback=False) as pool:
+        try:
+            pool.warm_up()
+        except Exception as exc:  # e.g. chromadb not installed → DB-only
+            print(f"Embedding warm-up skipped: {exc}")
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=pool.workers * 2) as clients:
+            list(clients.map(pool.process, queries))
+        elapsed = time.perf_counter() - start
+        print(f"{len(queries)} queries on {pool.workers} workers: "
+              f"{len(queries) / elapsed:.0f} q/s")